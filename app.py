@@ -3,180 +3,123 @@ N8N Workflow Generator API
 A Flask application that converts natural language prompts to n8n workflow JSON files
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import json
-import os
-from datetime import datetime
+import time
 import requests
-from dotenv import load_dotenv
+
+from backend_pool import RETRYABLE_STATUSES
+# Configuration, validation and post-processing are shared with the async gateway
+from gateway import (
+    BACKEND_POOL, LOCAL_INFER_TIMEOUT, LOCAL_INFER_URL, RESULT_CACHE, TRAINING_EXAMPLES,
+    backend_request, build_response, is_workflow_related, iter_sse, lookup_without_llm, parse_llm_response,
+    sse_event, stream_url_for,
+)
 
 app = Flask(__name__)
 CORS(app)
 
-# Load environment variables from .env, and if missing, fall back to .env.example (without overriding)
-load_dotenv(override=False)
-if os.path.exists('.env.example'):
-    load_dotenv('.env.example', override=False)
-
-# Load training examples
-with open('training_examples.json', 'r') as f:
-    TRAINING_EXAMPLES = json.load(f)
-
-# Configuration
-LOCAL_INFER_URL = os.getenv('LOCAL_INFER_URL', 'http://127.0.0.1:8000/generate')
-
-# Common n8n node types and their purposes
-NODE_TYPES = {
-    "triggers": {
-        "webhook": "n8n-nodes-base.webhook",
-        "schedule": "n8n-nodes-base.scheduleTrigger",
-        "cron": "n8n-nodes-base.cron",
-        "manual": "n8n-nodes-base.manualTrigger",
-        "gmail": "n8n-nodes-base.gmailTrigger",
-        "google sheets": "n8n-nodes-base.googleSheetsTrigger",
-        "github": "n8n-nodes-base.githubTrigger",
-        "form": "n8n-nodes-base.formTrigger"
-    },
-    "actions": {
-        "gmail": "n8n-nodes-base.gmail",
-        "email": "n8n-nodes-base.emailSend",
-        "slack": "n8n-nodes-base.slack",
-        "discord": "n8n-nodes-base.discord",
-        "google sheets": "n8n-nodes-base.googleSheets",
-        "airtable": "n8n-nodes-base.airtable",
-        "trello": "n8n-nodes-base.trello",
-        "notion": "n8n-nodes-base.notion",
-        "http": "n8n-nodes-base.httpRequest",
-        "webhook response": "n8n-nodes-base.respondToWebhook"
-    }
-}
-
-def create_system_prompt():
-    """Create the system prompt for the LLM"""
-    examples_text = "\n\n".join([
-        f"Example {i+1}:\nPrompt: {ex['prompt']}\nWorkflow: {json.dumps(ex['workflow'], indent=2)}"
-        for i, ex in enumerate(TRAINING_EXAMPLES[:3])
-    ])
-    
-    return f"""You are an expert n8n workflow designer. Your task is to convert natural language automation requests into valid n8n workflow JSON.
-
-N8N WORKFLOW STRUCTURE:
-A workflow consists of:
-1. "nodes": Array of node objects with name, type, position, parameters, and typeVersion
-2. "connections": Object mapping node connections
-
-COMMON NODE TYPES:
-Triggers: {json.dumps(NODE_TYPES['triggers'], indent=2)}
-Actions: {json.dumps(NODE_TYPES['actions'], indent=2)}
-
-EXAMPLES:
-{examples_text}
-
-RULES:
-1. Always include at least one trigger node (the starting point)
-2. Position nodes horizontally: first node at [250, 300], next at [450, 300], etc. (increment x by 200)
-3. Use simple, descriptive node names
-4. Connect nodes in the "connections" object
-5. Include typeVersion: 1 for all nodes
-6. Return ONLY valid JSON, no markdown or explanations
-7. If the request is unclear, create a basic workflow that matches the intent
-
-Respond with ONLY the JSON workflow object."""
-
-
-# Removed Groq fallback; the app now uses only LOCAL_INFER_URL
-
-
-def ensure_required_defaults(workflow: dict) -> dict:
-    """Ensure minimal required params so nodes import cleanly; also disable nodes needing credentials.
-    - Add default params (e.g., Gmail send needs to/subject/message)
-    - Disable external-action nodes so workflow can execute without credentials
-    """
-    nodes = workflow.get('nodes', [])
-    for node in nodes:
-        ntype = node.get('type', '')
-        params = node.setdefault('parameters', {})
-
-        # Heuristic: disable nodes that likely require credentials or external services
-        external_types = (
-            'n8n-nodes-base.gmail', 'n8n-nodes-base.slack', 'n8n-nodes-base.discord',
-            'n8n-nodes-base.googleSheets', 'n8n-nodes-base.airtable', 'n8n-nodes-base.trello',
-            'n8n-nodes-base.notion', 'n8n-nodes-base.httpRequest'
-        )
-        if any(ntype.endswith(ext.split('.')[-1]) for ext in external_types):
-            node.setdefault('disabled', True)
-
-        # Gmail send defaults
-        if ntype == 'n8n-nodes-base.gmail':
-            params.setdefault('resource', 'message')
-            params.setdefault('operation', 'send')
-            params.setdefault('to', 'you@example.com')
-            params.setdefault('subject', 'Automated notification')
-            params.setdefault('message', 'This is an automated message from your workflow.')
-
-        # Slack post message defaults
-        if ntype == 'n8n-nodes-base.slack':
-            params.setdefault('resource', 'message')
-            params.setdefault('operation', 'post')
-            params.setdefault('channel', '#general')
-            params.setdefault('text', 'Automated notification')
-
-        # Discord send message defaults
-        if ntype == 'n8n-nodes-base.discord':
-            params.setdefault('resource', 'message')
-            params.setdefault('operation', 'send')
-            params.setdefault('text', 'Automated notification')
-            params.setdefault('channelId', 'REPLACE_WITH_CHANNEL_ID')
-
-        # Google Sheets append defaults
-        if ntype == 'n8n-nodes-base.googleSheets':
-            params.setdefault('operation', 'append')
-            params.setdefault('resource', 'sheet')
-            # Placeholders to avoid execution until user configures
-            params.setdefault('documentId', 'REPLACE_WITH_SHEET_ID')
-            params.setdefault('sheetName', 'Sheet1')
-
-        # Google Sheets Trigger defaults (keep disabled until configured)
-        if ntype == 'n8n-nodes-base.googleSheetsTrigger':
-            node.setdefault('disabled', True)
-
-        # Notion create page defaults
-        if ntype == 'n8n-nodes-base.notion':
-            params.setdefault('resource', 'page')
-            params.setdefault('operation', 'create')
-            # Minimal placeholders; user must configure in n8n
-            params.setdefault('databaseId', 'REPLACE_WITH_DATABASE_ID')
-            # Notion node often expects properties; provide a minimal title
-            params.setdefault('propertiesUi', {
-                'property': [
-                    {
-                        'name': 'Name',
-                        'key': 'title',
-                        'type': 'title',
-                        'title': [
-                            {
-                                'text': 'New page from workflow'
-                            }
-                        ]
-                    }
-                ]
-            })
-
-    return workflow
+if len(BACKEND_POOL) > 1:
+    BACKEND_POOL.start_probing()
 
 
 def generate_with_local_llm(prompt: str):
-    try:
-        resp = requests.post(LOCAL_INFER_URL, json={"prompt": prompt}, timeout=60)
+    """Call the least-loaded backend, retrying on another one if it can't be reached or is unavailable"""
+    body = backend_request(prompt)
+    tried, error = [], "no inference backend available"
+    for _ in range(len(BACKEND_POOL)):
+        backend = BACKEND_POOL.acquire(exclude=tried)
+        if backend is None:
+            break
+        tried.append(backend)
+        start = time.time()
+        try:
+            resp = requests.post(backend.url, json=body, timeout=LOCAL_INFER_TIMEOUT)
+        except requests.ConnectionError as e:
+            # Includes connect timeouts: the prompt never reached this backend
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e)
+            continue
+        except requests.RequestException as e:
+            # A read timeout leaves the backend decoding; don't start the same generation elsewhere
+            BACKEND_POOL.release(backend, ok=False)
+            return None, str(e)
+        if resp.status_code in RETRYABLE_STATUSES:
+            BACKEND_POOL.release(backend, ok=False)
+            error = f"local inference error: {resp.status_code} {resp.text[:200]}"
+            continue
+        BACKEND_POOL.release(backend, ok=True, latency=time.time() - start)
+        try:
+            return parse_llm_response(resp.status_code, resp.text, resp.json() if resp.status_code == 200 else {})
+        except Exception as e:
+            return None, str(e)
+    return None, error
+
+
+def stream_with_local_llm(prompt: str):
+    """Relay token/node events from a backend's /generate/stream, then a done event with the final workflow.
+
+    Failover to another backend only happens when one can't be reached or answers
+    502/503/504; backends without a streaming route are called through
+    generate_with_local_llm.
+    """
+    body = backend_request(prompt)
+    workflow, tried, error = None, [], "no inference backend available"
+    for _ in range(len(BACKEND_POOL)):
+        backend = BACKEND_POOL.acquire(exclude=tried)
+        if backend is None:
+            break
+        tried.append(backend)
+        start = time.time()
+        try:
+            resp = requests.post(stream_url_for(backend.url), json=body,
+                                 stream=True, timeout=LOCAL_INFER_TIMEOUT)
+        except requests.ConnectionError as e:
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e)
+            continue
+        except requests.RequestException as e:
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e)
+            break
+        if resp.status_code in RETRYABLE_STATUSES:
+            BACKEND_POOL.release(backend, ok=False)
+            error = f"local inference error: {resp.status_code} {resp.text[:200]}"
+            resp.close()
+            continue
+        if resp.status_code == 404:
+            BACKEND_POOL.release(backend, ok=True)
+            resp.close()
+            workflow, error = generate_with_local_llm(prompt)
+            break
         if resp.status_code != 200:
-            return None, f"local inference error: {resp.status_code} {resp.text[:200]}"
-        data = resp.json()
-        if "workflow" not in data:
-            return None, "local inference returned no workflow"
-        return data["workflow"], None
-    except Exception as e:
-        return None, str(e)
+            BACKEND_POOL.release(backend, ok=True)
+            _, error = parse_llm_response(resp.status_code, resp.text, {})
+            resp.close()
+            break
+        ok = True
+        try:
+            for event, payload in iter_sse(resp.iter_lines(decode_unicode=True)):
+                if event == 'done':
+                    workflow, error = parse_llm_response(200, payload, json.loads(payload))
+                elif event == 'error':
+                    error = json.loads(payload).get('error', payload)
+                else:
+                    yield f"event: {event}\ndata: {payload}\n\n"
+        except (requests.RequestException, ValueError) as e:
+            ok, error = False, str(e)
+        finally:
+            BACKEND_POOL.release(backend, ok=ok, latency=time.time() - start)
+            resp.close()
+        break
+
+    if workflow is None:
+        yield sse_event('error', {'error': f"Generation failed: {error}"})
+        return
+    if RESULT_CACHE:
+        RESULT_CACHE.put(prompt, workflow)
+    yield sse_event('done', build_response(prompt, workflow, 'local'))
 
 
 @app.route('/')
@@ -185,64 +128,6 @@ def index():
     return send_from_directory('.', 'index.html')
 
 
-def is_workflow_related(prompt: str) -> tuple[bool, str]:
-    """
-    Check if prompt is related to workflow creation.
-    Returns (is_valid, error_message)
-    """
-    prompt_lower = prompt.lower().strip()
-    
-    # Common greetings and off-topic phrases
-    greeting_patterns = [
-        'hi', 'hello', 'hey', 'greetings', 'good morning', 'good afternoon',
-        'good evening', 'what\'s up', 'whats up', 'sup', 'yo', 'hiya'
-    ]
-    
-    off_topic_patterns = [
-        'how are you', 'who are you', 'what are you', 'tell me about',
-        'can you help', 'i need help', 'help me', 'what can you do',
-        'what is your name', 'your name', 'who made you', 'who created you'
-    ]
-    
-    # Check if it's just a greeting or off-topic
-    is_greeting = any(prompt_lower == pattern or prompt_lower.startswith(pattern + ' ') 
-                     for pattern in greeting_patterns)
-    
-    is_off_topic = any(pattern in prompt_lower for pattern in off_topic_patterns)
-    
-    # Workflow-related keywords that indicate valid requests
-    workflow_keywords = [
-        'workflow', 'automation', 'create', 'build', 'make', 'generate',
-        'trigger', 'webhook', 'send', 'email', 'slack', 'notification',
-        'schedule', 'run', 'execute', 'process', 'when', 'if', 'then',
-        'connect', 'integrate', 'api', 'database', 'fetch', 'store',
-        'update', 'delete', 'add', 'save', 'get', 'post', 'data'
-    ]
-    
-    has_workflow_keyword = any(keyword in prompt_lower for keyword in workflow_keywords)
-    
-    # If it's a greeting or off-topic, reject
-    if is_greeting or is_off_topic:
-        return False, (
-            "I'm a workflow generator assistant. I can help you create n8n workflows! "
-            "Try describing an automation you'd like to build, for example:\n"
-            "• 'Send email when webhook receives data'\n"
-            "• 'Create Slack notification every day at 9am'\n"
-            "• 'Save form submissions to Google Sheets'"
-        )
-    
-    # If it's too short and has no workflow keywords, probably invalid
-    if len(prompt_lower.split()) < 3 and not has_workflow_keyword:
-        return False, (
-            "Please describe the workflow you'd like to create. "
-            "Be specific about what should happen and when. "
-            "For example: 'Send an email notification when a webhook receives data'"
-        )
-    
-    # Looks valid!
-    return True, ""
-
-
 @app.route('/api/generate', methods=['POST'])
 def generate_workflow():
     """Generate n8n workflow from natural language prompt"""
@@ -262,34 +147,69 @@ def generate_workflow():
                 'type': 'validation_error'
             }), 400
         
-        # Use local fine-tuned LLM only
-        workflow, error = generate_with_local_llm(prompt)
-        if error or not workflow:
-            return jsonify({"error": f"Generation failed: {error}"}), 500
+        # Serve repeated prompts from the cache, then close corpus matches; otherwise use the local fine-tuned LLM
+        workflow, method, match = lookup_without_llm(prompt)
+        if workflow is None:
+            method = 'local'
+            workflow, error = generate_with_local_llm(prompt)
+            if error or not workflow:
+                return jsonify({"error": f"Generation failed: {error}"}), 500
+            if RESULT_CACHE:
+                RESULT_CACHE.put(prompt, workflow)
         
-        # Add metadata
-        workflow['name'] = prompt[:50]
-        workflow['active'] = False
-        workflow['settings'] = {}
-        workflow = ensure_required_defaults(workflow)
-        
-        return jsonify({
-            'success': True,
-            'workflow': workflow,
-            'prompt': prompt,
-            'method': 'local'
-        })
+        return jsonify(build_response(prompt, workflow, method, match))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_workflow_stream():
+    """Same as /api/generate, streamed as server-sent events: token, node, then done or error"""
+    data = request.get_json(silent=True) or {}
+    prompt = data.get('prompt', '')
+
+    if not prompt:
+        return jsonify({'error': 'Prompt is required'}), 400
+
+    is_valid, error_msg = is_workflow_related(prompt)
+    if not is_valid:
+        return jsonify({
+            'success': False,
+            'error': error_msg,
+            'type': 'validation_error'
+        }), 400
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    workflow, method, match = lookup_without_llm(prompt)
+    if workflow is not None:
+        # Nothing to stream for cache and corpus hits; the client gets the result straight away
+        body = sse_event('done', build_response(prompt, workflow, method, match))
+        return Response(body, mimetype='text/event-stream', headers=headers)
+    return Response(stream_with_context(stream_with_local_llm(prompt)),
+                    mimetype='text/event-stream', headers=headers)
+
+
 @app.route('/api/examples', methods=['GET'])
 def get_examples():
     """Get training examples"""
     return jsonify([ex['prompt'] for ex in TRAINING_EXAMPLES])
 
 
+@app.route('/api/backends', methods=['GET'])
+def backend_status():
+    """Health, load and latency of each inference backend"""
+    return jsonify(BACKEND_POOL.snapshot())
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the result cache"""
+    if not RESULT_CACHE:
+        return jsonify({'enabled': False})
+    return jsonify(dict(RESULT_CACHE.stats(), enabled=True))
+
+
 if __name__ == '__main__':
     print("\n" + "=" * 70)
     print("[STARTING] Frontend API")
@@ -0,0 +1,273 @@
+"""
+N8N Workflow Generator API (async)
+ASGI variant of app.py: the same routes and pipeline, but calls to the inference
+backend go through one persistent, connection-pooled httpx.AsyncClient, so an
+in-flight LLM decode costs a coroutine instead of a blocked worker thread.
+The CPU-bound steps around it (cache and corpus lookups, parsing, validation
+and layout) run in Starlette's thread pool so they never stall the event loop.
+
+Run with:
+    uvicorn app_async:app --host 0.0.0.0 --port 5000
+"""
+
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Configuration, validation and post-processing are shared with the Flask gateway
+from gateway import (
+    BACKEND_POOL, LOCAL_INFER_TIMEOUT, LOCAL_INFER_URL, RESULT_CACHE, TRAINING_EXAMPLES,
+    backend_request, build_response, is_workflow_related, lookup_without_llm, parse_llm_response, sse_event,
+    stream_url_for,
+)
+from backend_pool import RETRYABLE_STATUSES
+
+# Upper bound on concurrent connections to the inference backend(s)
+GATEWAY_MAX_CONNECTIONS = int(os.getenv('GATEWAY_MAX_CONNECTIONS', 256))
+
+# Failures that mean the request never reached the backend, so it is safe to send it to another one
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+client: httpx.AsyncClient = None
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global client
+    if len(BACKEND_POOL) > 1:
+        BACKEND_POOL.start_probing()
+    client = httpx.AsyncClient(
+        timeout=LOCAL_INFER_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=GATEWAY_MAX_CONNECTIONS,
+            max_keepalive_connections=GATEWAY_MAX_CONNECTIONS,
+        ),
+    )
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def generate_with_local_llm(prompt: str):
+    """Call the least-loaded backend, retrying on another one if it can't be reached or is unavailable"""
+    body = await run_in_threadpool(backend_request, prompt)
+    tried, error = [], "no inference backend available"
+    for _ in range(len(BACKEND_POOL)):
+        backend = BACKEND_POOL.acquire(exclude=tried)
+        if backend is None:
+            break
+        tried.append(backend)
+        start = time.time()
+        try:
+            resp = await client.post(backend.url, json=body)
+        except CONNECT_ERRORS as e:
+            # The prompt never reached this backend
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e) or type(e).__name__
+            continue
+        except httpx.HTTPError as e:
+            # A read timeout leaves the backend decoding; don't start the same generation elsewhere
+            BACKEND_POOL.release(backend, ok=False)
+            return None, str(e) or type(e).__name__
+        if resp.status_code in RETRYABLE_STATUSES:
+            BACKEND_POOL.release(backend, ok=False)
+            error = f"local inference error: {resp.status_code} {resp.text[:200]}"
+            continue
+        BACKEND_POOL.release(backend, ok=True, latency=time.time() - start)
+        try:
+            body = resp.json() if resp.status_code == 200 else {}
+            return await run_in_threadpool(parse_llm_response, resp.status_code, resp.text, body)
+        except Exception as e:
+            return None, str(e)
+    return None, error
+
+
+async def aiter_sse(lines):
+    """Yield (event, data) pairs from the text lines of an event stream"""
+    event = 'message'
+    async for line in lines:
+        if line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            yield event, line[5:].strip()
+            event = 'message'
+
+
+async def stream_with_local_llm(prompt: str):
+    """Relay token/node events from a backend's /generate/stream, then a done event with the final workflow"""
+    body = await run_in_threadpool(backend_request, prompt)
+    workflow, tried, error = None, [], "no inference backend available"
+    for _ in range(len(BACKEND_POOL)):
+        backend = BACKEND_POOL.acquire(exclude=tried)
+        if backend is None:
+            break
+        tried.append(backend)
+        start = time.time()
+        try:
+            req = client.build_request('POST', stream_url_for(backend.url), json=body)
+            resp = await client.send(req, stream=True)
+        except CONNECT_ERRORS as e:
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e) or type(e).__name__
+            continue
+        except httpx.HTTPError as e:
+            BACKEND_POOL.release(backend, ok=False)
+            error = str(e) or type(e).__name__
+            break
+        if resp.status_code != 200:
+            text = (await resp.aread()).decode('utf-8', 'replace')
+            await resp.aclose()
+            if resp.status_code in RETRYABLE_STATUSES:
+                BACKEND_POOL.release(backend, ok=False)
+                error = f"local inference error: {resp.status_code} {text[:200]}"
+                continue
+            BACKEND_POOL.release(backend, ok=True)
+            if resp.status_code == 404:
+                # Backend without a streaming route
+                workflow, error = await generate_with_local_llm(prompt)
+            else:
+                _, error = await run_in_threadpool(parse_llm_response, resp.status_code, text, {})
+            break
+        ok = True
+        try:
+            async for event, payload in aiter_sse(resp.aiter_lines()):
+                if event == 'done':
+                    workflow, error = await run_in_threadpool(parse_llm_response, 200, payload, json.loads(payload))
+                elif event == 'error':
+                    error = json.loads(payload).get('error', payload)
+                else:
+                    yield f"event: {event}\ndata: {payload}\n\n"
+        except (httpx.HTTPError, ValueError) as e:
+            ok, error = False, str(e) or type(e).__name__
+        finally:
+            BACKEND_POOL.release(backend, ok=ok, latency=time.time() - start)
+            await resp.aclose()
+        break
+
+    if workflow is None:
+        yield sse_event('error', {'error': f"Generation failed: {error}"})
+        return
+    if RESULT_CACHE:
+        await run_in_threadpool(RESULT_CACHE.put, prompt, workflow)
+    yield sse_event('done', await run_in_threadpool(build_response, prompt, workflow, 'local'))
+
+
+async def index(request: Request):
+    """Serve the main HTML page"""
+    return FileResponse('index.html')
+
+
+async def generate_workflow(request: Request):
+    """Generate n8n workflow from natural language prompt"""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        prompt = (data or {}).get('prompt', '')
+
+        if not prompt:
+            return JSONResponse({'error': 'Prompt is required'}, status_code=400)
+
+        is_valid, error_msg = is_workflow_related(prompt)
+        if not is_valid:
+            return JSONResponse({
+                'success': False,
+                'error': error_msg,
+                'type': 'validation_error'
+            }, status_code=400)
+
+        workflow, method, match = await run_in_threadpool(lookup_without_llm, prompt)
+        if workflow is None:
+            method = 'local'
+            workflow, error = await generate_with_local_llm(prompt)
+            if error or not workflow:
+                return JSONResponse({"error": f"Generation failed: {error}"}, status_code=500)
+            if RESULT_CACHE:
+                await run_in_threadpool(RESULT_CACHE.put, prompt, workflow)
+
+        return JSONResponse(await run_in_threadpool(build_response, prompt, workflow, method, match))
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def generate_workflow_stream(request: Request):
+    """Same as /api/generate, streamed as server-sent events: token, node, then done or error"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    prompt = (data or {}).get('prompt', '')
+
+    if not prompt:
+        return JSONResponse({'error': 'Prompt is required'}, status_code=400)
+
+    is_valid, error_msg = is_workflow_related(prompt)
+    if not is_valid:
+        return JSONResponse({
+            'success': False,
+            'error': error_msg,
+            'type': 'validation_error'
+        }, status_code=400)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    workflow, method, match = await run_in_threadpool(lookup_without_llm, prompt)
+    if workflow is not None:
+        body = sse_event('done', await run_in_threadpool(build_response, prompt, workflow, method, match))
+        return StreamingResponse(iter([body]), media_type='text/event-stream', headers=headers)
+    return StreamingResponse(stream_with_local_llm(prompt), media_type='text/event-stream', headers=headers)
+
+
+async def get_examples(request: Request):
+    """Get training examples"""
+    return JSONResponse([ex['prompt'] for ex in TRAINING_EXAMPLES])
+
+
+async def backend_status(request: Request):
+    """Health, load and latency of each inference backend"""
+    return JSONResponse(BACKEND_POOL.snapshot())
+
+
+async def cache_stats(request: Request):
+    """Hit/miss/eviction counters of the result cache"""
+    if not RESULT_CACHE:
+        return JSONResponse({'enabled': False})
+    return JSONResponse(dict(RESULT_CACHE.stats(), enabled=True))
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/generate', generate_workflow, methods=['POST']),
+        Route('/api/generate/stream', generate_workflow_stream, methods=['POST']),
+        Route('/api/examples', get_examples, methods=['GET']),
+        Route('/api/backends', backend_status, methods=['GET']),
+        Route('/api/cache/stats', cache_stats, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("\n" + "=" * 70)
+    print("[STARTING] Frontend API (async)")
+    print("=" * 70)
+    print("Browser:          http://localhost:5000")
+    print(f"LLM Endpoint:     {LOCAL_INFER_URL}")
+    print("=" * 70 + "\n")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,177 @@
+"""
+Load balancing across several inference backends.
+
+LOCAL_INFER_URLS takes a comma-separated list of /generate endpoints (for
+example several scripts/serve/local_inference.py or trained_model/api.py
+processes). Each request goes to the available backend with the fewest
+outstanding requests. A backend is ejected for a while after repeated
+transport failures, or when its smoothed latency is far above the others, and
+is readmitted once its /readyz endpoint (or /health, for servers without
+one) answers again, so a server still loading its model gets no traffic.
+
+Callers retry on another backend only when the connection fails or the
+backend answers 502/503/504, i.e. when the prompt never reached a decoder.
+After a read timeout the first backend may still be decoding, so sending the
+prompt elsewhere would run the same generation twice; that request fails
+instead.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+# HTTP statuses that mean "this backend can't serve right now", not "the request was bad"
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+# Weight of the newest sample in the per-backend latency moving average
+EWMA_ALPHA = 0.2
+
+
+def health_url_for(url: str, path: str = 'health') -> str:
+    """http://host:8000/generate -> http://host:8000/health"""
+    return url.rstrip('/').rsplit('/', 1)[0] + '/' + path
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.health_url = health_url_for(url)
+        # Readiness endpoint of local_inference.py; dropped after a 404 from servers that don't have it
+        self.ready_url = health_url_for(url, 'readyz')
+        self.outstanding = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.ewma_latency = None
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+    def snapshot(self) -> dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'ejected': self.ejected_until > time.time(),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ewma_latency': round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+        }
+
+
+class BackendPool:
+    """Thread-safe least-outstanding-requests balancer with health probing and ejection."""
+
+    def __init__(self, urls, max_failures=3, eject_seconds=30.0, slow_factor=0.0,
+                 probe_interval=10.0, probe_timeout=2.0):
+        if not urls:
+            raise ValueError("BackendPool needs at least one backend URL")
+        self.backends = [Backend(url) for url in urls]
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        # Eject a backend whose latency exceeds slow_factor x the pool median (0 disables)
+        self.slow_factor = slow_factor
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._prober = None
+
+    @classmethod
+    def from_env(cls, default_url: str):
+        urls = [u.strip() for u in os.getenv('LOCAL_INFER_URLS', '').split(',') if u.strip()]
+        return cls(
+            urls or [default_url],
+            max_failures=int(os.getenv('BACKEND_MAX_FAILURES', 3)),
+            eject_seconds=float(os.getenv('BACKEND_EJECT_SECONDS', 30)),
+            slow_factor=float(os.getenv('BACKEND_SLOW_FACTOR', 0)),
+            probe_interval=float(os.getenv('BACKEND_PROBE_INTERVAL', 10)),
+        )
+
+    def __len__(self):
+        return len(self.backends)
+
+    def acquire(self, exclude=()):
+        """Reserve the backend with the fewest outstanding requests, or None if all are excluded."""
+        now = time.time()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            # If everything is ejected or unhealthy, still try rather than fail outright
+            pool = [b for b in candidates if b.available(now)] or candidates
+            if not pool:
+                return None
+            backend = min(pool, key=lambda b: (b.outstanding, b.ewma_latency or 0.0))
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, ok: bool, latency: float = None):
+        """Return a backend after a request; ok=False records a transport-level failure."""
+        with self._lock:
+            backend.outstanding -= 1
+            if not ok:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.max_failures:
+                    self._eject(backend)
+                return
+            backend.consecutive_failures = 0
+            if latency is not None:
+                backend.ewma_latency = latency if backend.ewma_latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * backend.ewma_latency)
+                self._eject_if_slow(backend)
+
+    def probe(self):
+        """Hit every backend's /readyz (or /health) once and update its state."""
+        for backend in self.backends:
+            try:
+                resp = None
+                if backend.ready_url:
+                    resp = requests.get(backend.ready_url, timeout=self.probe_timeout)
+                    if resp.status_code == 404:
+                        backend.ready_url = resp = None
+                if resp is None:
+                    resp = requests.get(backend.health_url, timeout=self.probe_timeout)
+                ok = resp.status_code == 200 and resp.json().get('ok', True) is not False
+            except (requests.RequestException, ValueError):
+                ok = False
+            with self._lock:
+                backend.healthy = ok
+                if ok and backend.ejected_until and backend.ejected_until <= time.time():
+                    # Readmit with a clean slate so one old slow sample doesn't eject it again
+                    backend.ejected_until = 0.0
+                    backend.consecutive_failures = 0
+                    backend.ewma_latency = None
+
+    def start_probing(self):
+        if self._prober is None and self.probe_interval > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name='backend-prober', daemon=True)
+            self._prober.start()
+        return self
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [b.snapshot() for b in self.backends]
+
+    def _probe_loop(self):
+        while True:
+            self.probe()
+            time.sleep(self.probe_interval)
+
+    def _eject(self, backend: Backend):
+        backend.ejected_until = time.time() + self.eject_seconds
+
+    def _eject_if_slow(self, backend: Backend):
+        if self.slow_factor <= 0:
+            return
+        latencies = sorted(b.ewma_latency for b in self.backends
+                           if b.ewma_latency is not None and b.available(time.time()))
+        # Never eject the last backend standing
+        if len(latencies) < 2:
+            return
+        median = latencies[len(latencies) // 2]
+        if backend.ewma_latency > self.slow_factor * median:
+            self._eject(backend)
@@ -0,0 +1,302 @@
+"""
+Framework-neutral core of the n8n workflow generator gateways.
+
+Configuration, the backend pool, the result cache, the retrieval index and
+every step around the LLM call (prompt checks, cache and corpus lookups,
+parsing and repairing a generation, defaults and layout) live here, so app.py
+(Flask) and app_async.py (Starlette) run the same pipeline without one
+importing the other. Importing this module starts no threads; each gateway
+starts BACKEND_POOL's prober itself.
+"""
+
+import json
+import os
+
+from dotenv import load_dotenv
+
+from backend_pool import BackendPool
+from node_catalog import load_catalog
+from node_defaults import NodeDefaults
+from workflow_cache import WorkflowCache
+from workflow_index import load_index
+from workflow_layout import has_positions, layout_workflow, strip_positions
+from workflow_validator import WorkflowValidator, describe, unrepaired
+
+# Load environment variables from .env, and if missing, fall back to .env.example (without overriding)
+load_dotenv(override=False)
+if os.path.exists('.env.example'):
+    load_dotenv('.env.example', override=False)
+
+# Load training examples
+with open('training_examples.json', 'r') as f:
+    TRAINING_EXAMPLES = json.load(f)
+
+# Configuration
+LOCAL_INFER_URL = os.getenv('LOCAL_INFER_URL', 'http://127.0.0.1:8000/generate')
+LOCAL_INFER_TIMEOUT = float(os.getenv('LOCAL_INFER_TIMEOUT', 60))
+
+# Inference backends (LOCAL_INFER_URLS, comma-separated; defaults to LOCAL_INFER_URL alone)
+BACKEND_POOL = BackendPool.from_env(LOCAL_INFER_URL)
+
+# Cache of generated workflows keyed on normalized prompts (CACHE_MAX_BYTES=0 disables it)
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 8 * 1024 * 1024))
+RESULT_CACHE = WorkflowCache(
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=int(os.getenv('CACHE_TTL', 3600)),
+    similarity_threshold=float(os.getenv('CACHE_SIMILARITY', 0)),
+) if CACHE_MAX_BYTES > 0 else None
+
+# Retrieval index over workflows/ used to pick the few-shot examples sent with each prompt (FEW_SHOT_K=0 sends none)
+FEW_SHOT_K = int(os.getenv('FEW_SHOT_K', 3))
+# Skip corpus examples whose JSON is longer than this, to keep the context short
+FEW_SHOT_MAX_CHARS = int(os.getenv('FEW_SHOT_MAX_CHARS', 3000))
+WORKFLOW_INDEX = load_index()
+
+# Retrieval-only fast path: return a matching corpus workflow without calling the LLM
+RETRIEVAL_FAST_PATH = os.getenv('RETRIEVAL_FAST_PATH', '0') == '1'
+RETRIEVAL_THRESHOLD = float(os.getenv('RETRIEVAL_THRESHOLD', 0.6))
+
+# Lay generated workflows out from their connections instead of keeping model-made coordinates
+AUTO_LAYOUT = os.getenv('AUTO_LAYOUT', '1') == '1'
+
+# Every node type known from n8n_nodes/ and the workflow corpus (trigger flag, credentials, typeVersion)
+NODE_CATALOG = load_catalog()
+
+# Per-node-type default parameters and disabled flags, compiled once
+NODE_DEFAULTS = NodeDefaults.from_env()
+
+# Structural checks and repairs applied to every generated workflow
+WORKFLOW_VALIDATOR = WorkflowValidator(NODE_CATALOG)
+
+# Common n8n node types and their purposes
+NODE_TYPES = {
+    "triggers": {
+        "webhook": "n8n-nodes-base.webhook",
+        "schedule": "n8n-nodes-base.scheduleTrigger",
+        "cron": "n8n-nodes-base.cron",
+        "manual": "n8n-nodes-base.manualTrigger",
+        "gmail": "n8n-nodes-base.gmailTrigger",
+        "google sheets": "n8n-nodes-base.googleSheetsTrigger",
+        "github": "n8n-nodes-base.githubTrigger",
+        "form": "n8n-nodes-base.formTrigger"
+    },
+    "actions": {
+        "gmail": "n8n-nodes-base.gmail",
+        "email": "n8n-nodes-base.emailSend",
+        "slack": "n8n-nodes-base.slack",
+        "discord": "n8n-nodes-base.discord",
+        "google sheets": "n8n-nodes-base.googleSheets",
+        "airtable": "n8n-nodes-base.airtable",
+        "trello": "n8n-nodes-base.trello",
+        "notion": "n8n-nodes-base.notion",
+        "http": "n8n-nodes-base.httpRequest",
+        "webhook response": "n8n-nodes-base.respondToWebhook"
+    }
+}
+
+def select_examples(prompt: str = None, k: int = FEW_SHOT_K) -> list:
+    """Pick the k corpus workflows most relevant to the prompt (falls back to the training examples)"""
+    examples = []
+    if prompt and WORKFLOW_INDEX is not None:
+        for _, doc in WORKFLOW_INDEX.search(prompt, k * 3):
+            wf = WORKFLOW_INDEX.load_workflow(doc)
+            example = {'nodes': wf['nodes'], 'connections': wf.get('connections', {})}
+            if len(json.dumps(example, separators=(',', ':'))) <= FEW_SHOT_MAX_CHARS:
+                examples.append({'prompt': doc['name'], 'workflow': example})
+            if len(examples) == k:
+                break
+    return examples or TRAINING_EXAMPLES[:k]
+
+
+def backend_request(prompt: str) -> dict:
+    """Body of an inference backend request: the prompt and the few-shot examples selected for it"""
+    body = {'prompt': prompt}
+    if FEW_SHOT_K > 0:
+        body['examples'] = [{'prompt': ex['prompt'], 'workflow': strip_positions(ex['workflow'])}
+                            for ex in select_examples(prompt)]
+    return body
+
+
+def create_system_prompt(prompt: str = None):
+    """Create the system prompt for the LLM, with few-shot examples relevant to the prompt"""
+    examples_text = "\n\n".join([
+        f"Example {i+1}:\nPrompt: {ex['prompt']}\nWorkflow: {json.dumps(strip_positions(ex['workflow']), separators=(',', ':'))}"
+        for i, ex in enumerate(select_examples(prompt))
+    ])
+    
+    return f"""You are an expert n8n workflow designer. Your task is to convert natural language automation requests into valid n8n workflow JSON.
+
+N8N WORKFLOW STRUCTURE:
+A workflow consists of:
+1. "nodes": Array of node objects with name, type, parameters, and typeVersion
+2. "connections": Object mapping node connections
+
+COMMON NODE TYPES:
+Triggers: {json.dumps(NODE_TYPES['triggers'], indent=2)}
+Actions: {json.dumps(NODE_TYPES['actions'], indent=2)}
+
+EXAMPLES:
+{examples_text}
+
+RULES:
+1. Always include at least one trigger node (the starting point)
+2. Do not include node positions; the layout is computed from the connections
+3. Use simple, descriptive node names
+4. Connect nodes in the "connections" object
+5. Include typeVersion: 1 for all nodes
+6. Return ONLY valid JSON, no markdown or explanations
+7. If the request is unclear, create a basic workflow that matches the intent
+
+Respond with ONLY the JSON workflow object."""
+
+
+# Removed Groq fallback; the app now uses only LOCAL_INFER_URL
+
+
+def ensure_required_defaults(workflow: dict) -> dict:
+    """Ensure minimal required params so nodes import cleanly; also disable nodes needing credentials.
+    - Add default params (e.g., Gmail send needs to/subject/message)
+    - Disable external-action nodes so workflow can execute without credentials
+    Rules come from node_defaults.json (plus NODE_DEFAULTS_FILES).
+    """
+    return NODE_DEFAULTS.apply(workflow)
+
+
+def match_corpus_workflow(prompt: str):
+    """Return (workflow, match info) for the best corpus workflow if it clears RETRIEVAL_THRESHOLD"""
+    if WORKFLOW_INDEX is None:
+        return None, None
+    hits = WORKFLOW_INDEX.search(prompt, 1)
+    if not hits or hits[0][0] < RETRIEVAL_THRESHOLD:
+        return None, None
+    score, doc = hits[0]
+    wf = WORKFLOW_INDEX.load_workflow(doc)
+    workflow = {'nodes': wf['nodes'], 'connections': wf.get('connections', {})}
+    return workflow, {'file': doc['file'], 'name': doc['name'], 'score': round(score, 4)}
+
+
+def lookup_without_llm(prompt: str):
+    """Return (workflow, method, match) from the result cache or the retrieval fast path, if either hits"""
+    workflow = RESULT_CACHE.get(prompt) if RESULT_CACHE else None
+    if workflow is not None:
+        return workflow, 'cache', None
+    if RETRIEVAL_FAST_PATH:
+        workflow, match = match_corpus_workflow(prompt)
+        if workflow is not None:
+            return workflow, 'retrieval', match
+    return None, None, None
+
+
+def build_response(prompt: str, workflow: dict, method: str, match: dict = None) -> dict:
+    """Add workflow metadata and defaults and wrap it in the /api/generate response body"""
+    workflow['name'] = prompt[:50]
+    workflow['active'] = False
+    workflow['settings'] = {}
+    workflow = ensure_required_defaults(workflow)
+    # Corpus matches keep their hand-made canvas unless they lack positions
+    if AUTO_LAYOUT and (method != 'retrieval' or not has_positions(workflow)):
+        layout_workflow(workflow)
+    
+    result = {
+        'success': True,
+        'workflow': workflow,
+        'prompt': prompt,
+        'method': method
+    }
+    if match:
+        result['match'] = match
+    return result
+
+
+def parse_llm_response(status_code: int, text: str, data: dict):
+    """Turn an inference server response into (workflow, error)"""
+    if status_code != 200:
+        return None, f"local inference error: {status_code} {text[:200]}"
+    if "workflow" not in data:
+        return None, "local inference returned no workflow"
+    workflow = data["workflow"]
+    # Repair what can be repaired so a slightly broken generation is still usable (and cacheable)
+    errors = unrepaired(WORKFLOW_VALIDATOR.check(workflow))
+    if errors:
+        return None, f"invalid workflow: {describe(errors)}"
+    return workflow, None
+
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse(lines):
+    """Yield (event, data) pairs from the text lines of an event stream"""
+    event = 'message'
+    for line in lines:
+        if line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            yield event, line[5:].strip()
+            event = 'message'
+
+
+def stream_url_for(url: str) -> str:
+    """http://host:8000/generate -> http://host:8000/generate/stream"""
+    return url.rstrip('/') + '/stream'
+
+
+def is_workflow_related(prompt: str) -> tuple[bool, str]:
+    """
+    Check if prompt is related to workflow creation.
+    Returns (is_valid, error_message)
+    """
+    prompt_lower = prompt.lower().strip()
+    
+    # Common greetings and off-topic phrases
+    greeting_patterns = [
+        'hi', 'hello', 'hey', 'greetings', 'good morning', 'good afternoon',
+        'good evening', 'what\'s up', 'whats up', 'sup', 'yo', 'hiya'
+    ]
+    
+    off_topic_patterns = [
+        'how are you', 'who are you', 'what are you', 'tell me about',
+        'can you help', 'i need help', 'help me', 'what can you do',
+        'what is your name', 'your name', 'who made you', 'who created you'
+    ]
+    
+    # Check if it's just a greeting or off-topic
+    is_greeting = any(prompt_lower == pattern or prompt_lower.startswith(pattern + ' ') 
+                     for pattern in greeting_patterns)
+    
+    is_off_topic = any(pattern in prompt_lower for pattern in off_topic_patterns)
+    
+    # Workflow-related keywords that indicate valid requests
+    workflow_keywords = [
+        'workflow', 'automation', 'create', 'build', 'make', 'generate',
+        'trigger', 'webhook', 'send', 'email', 'slack', 'notification',
+        'schedule', 'run', 'execute', 'process', 'when', 'if', 'then',
+        'connect', 'integrate', 'api', 'database', 'fetch', 'store',
+        'update', 'delete', 'add', 'save', 'get', 'post', 'data'
+    ]
+    
+    has_workflow_keyword = any(keyword in prompt_lower for keyword in workflow_keywords)
+    
+    # If it's a greeting or off-topic, reject
+    if is_greeting or is_off_topic:
+        return False, (
+            "I'm a workflow generator assistant. I can help you create n8n workflows! "
+            "Try describing an automation you'd like to build, for example:\n"
+            "• 'Send email when webhook receives data'\n"
+            "• 'Create Slack notification every day at 9am'\n"
+            "• 'Save form submissions to Google Sheets'"
+        )
+    
+    # If it's too short and has no workflow keywords, probably invalid
+    if len(prompt_lower.split()) < 3 and not has_workflow_keyword:
+        return False, (
+            "Please describe the workflow you'd like to create. "
+            "Be specific about what should happen and when. "
+            "For example: 'Send an email notification when a webhook receives data'"
+        )
+    
+    # Looks valid!
+    return True, ""
+
@@ -0,0 +1,587 @@
+"""
+Grammar-constrained decoding for n8n workflow JSON.
+
+JsonScanner is an incremental, character-level JSON parser that also enforces a
+small workflow schema (required keys, value types and array bounds for the
+workflow, its nodes and its connections). WorkflowConstraint wraps one scanner
+per generated sequence and masks next-token logits so only tokens that keep the
+output a valid prefix of a workflow object can be sampled. Once the top-level
+object closes, EOS is the only token left.
+
+JsonObjectTracker is the cheap, non-constraining counterpart: it only watches
+braces and strings so decoding can stop the moment the first top-level object
+closes, constrained or not. NodeStreamExtractor does the same bookkeeping to
+pull each finished element of the "nodes" array out of a streamed generation.
+"""
+
+import json
+
+import torch
+
+# Guard against the model stalling on endless whitespace between tokens
+MAX_WHITESPACE_RUN = 64
+
+# How many of the highest-scoring tokens are checked against the grammar each
+# step. With the low temperatures we sample at, everything below this is never
+# picked anyway, so checking the whole vocabulary would be wasted work.
+DEFAULT_TOP_K = 64
+# When none of them fit, the window widens by this factor (64 -> 512 -> 4096)
+# and the search gives up past MAX_TOP_K: the grammar has hit a dead end.
+TOP_K_GROWTH = 8
+MAX_TOP_K = 4096
+
+CONNECTION_SCHEMA = {
+    "type": "object",
+    "required": ["node", "type", "index"],
+    "properties": {
+        "node": {"type": "string"},
+        "type": {"type": "string"},
+        "index": {"type": "number"},
+    },
+}
+
+# {"<source node>": {"main": [[{"node": ..., "type": "main", "index": 0}]]}}
+CONNECTIONS_SCHEMA = {
+    "type": "object",
+    "additionalProperties": {
+        "type": "object",
+        "additionalProperties": {
+            "type": "array",
+            "items": {"type": "array", "items": CONNECTION_SCHEMA},
+        },
+    },
+}
+
+NODE_SCHEMA = {
+    "type": "object",
+    # position is optional: workflow_layout computes it after generation
+    "required": ["name", "type", "typeVersion"],
+    "properties": {
+        "name": {"type": "string"},
+        "type": {"type": "string"},
+        "position": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+        "typeVersion": {"type": "number"},
+        "parameters": {"type": "object"},
+        "disabled": {"type": "boolean"},
+    },
+}
+
+WORKFLOW_SCHEMA = {
+    "type": "object",
+    "required": ["nodes", "connections"],
+    "properties": {
+        "name": {"type": "string"},
+        "nodes": {"type": "array", "items": NODE_SCHEMA, "minItems": 1},
+        "connections": CONNECTIONS_SCHEMA,
+    },
+}
+
+# Compact training format (see workflow_format.py)
+COMPACT_NODE_SCHEMA = {
+    "type": "object",
+    "required": ["t"],
+    "properties": {
+        "t": {"type": "string"},
+        "n": {"type": "string"},
+        "v": {"type": "number"},
+        "p": {"type": "object"},
+        "xy": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+        "w": {"type": "number"},
+        "x": {"type": "object"},
+    },
+}
+
+COMPACT_WORKFLOW_SCHEMA = {
+    "type": "object",
+    "required": ["nodes", "edges"],
+    "properties": {
+        "nodes": {"type": "array", "items": COMPACT_NODE_SCHEMA, "minItems": 1},
+        # [source, target, output, input, kind]
+        "edges": {"type": "array", "items": {"type": "array", "minItems": 2, "maxItems": 5}},
+    },
+}
+
+# Scanner modes
+_VALUE, _ARR_FIRST, _OBJ_FIRST, _OBJ_KEY, _COLON, _AFTER, _STRING, _NUMBER, _LITERAL, _DONE = range(10)
+
+# Number lexer states; _N_FINAL are the ones a number may end in
+_N_MINUS, _N_ZERO, _N_INT, _N_DOT, _N_FRAC, _N_E, _N_ESIGN, _N_EXP = range(8)
+_N_FINAL = (_N_ZERO, _N_INT, _N_FRAC, _N_EXP)
+
+_DIGITS = "0123456789"
+_HEX = "0123456789abcdefABCDEF"
+_WHITESPACE = " \t\n\r"
+
+
+class JsonScanner:
+    """Incremental JSON parser: feed() text, reject the first character that can't follow."""
+
+    __slots__ = ("mode", "stack", "schema", "key", "is_key", "esc", "num", "lit", "ws")
+
+    def __init__(self, schema=None):
+        self.mode = _VALUE
+        # Frames are [kind ('o'/'a'), schema, seen keys (object) or item count (array), current key]
+        self.stack = []
+        # Schema of the value about to start; the top level is always an object
+        self.schema = schema or {"type": "object"}
+        self.key = ""
+        self.is_key = False
+        self.esc = 0  # 1 right after a backslash, -n while n \u hex digits remain
+        self.num = _N_INT
+        self.lit = ""
+        self.ws = 0
+
+    @property
+    def done(self):
+        """True once the top-level value has closed."""
+        return self.mode == _DONE
+
+    def copy(self):
+        other = JsonScanner.__new__(JsonScanner)
+        other.mode = self.mode
+        other.stack = [frame[:] for frame in self.stack]
+        other.schema = self.schema
+        other.key = self.key
+        other.is_key = self.is_key
+        other.esc = self.esc
+        other.num = self.num
+        other.lit = self.lit
+        other.ws = self.ws
+        return other
+
+    def feed(self, text):
+        """Consume text; returns False (leaving the scanner undefined) if it can't be valid JSON."""
+        for ch in text:
+            if not self._step(ch):
+                return False
+        return True
+
+    def _step(self, ch):
+        mode = self.mode
+        if mode == _STRING:
+            return self._string_char(ch)
+        if mode == _NUMBER:
+            if self._number_char(ch):
+                return True
+            if self.num not in _N_FINAL:
+                return False
+            # The character terminates the number; handle it as the next structural char
+            self._end_value()
+            return self._step(ch)
+        if mode == _LITERAL:
+            if ch != self.lit[0]:
+                return False
+            self.lit = self.lit[1:]
+            if not self.lit:
+                self._end_value()
+            return True
+
+        if ch in _WHITESPACE:
+            self.ws += 1
+            return self.ws <= MAX_WHITESPACE_RUN
+        self.ws = 0
+
+        if mode == _VALUE:
+            return self._start_value(ch)
+        if mode == _ARR_FIRST:
+            if ch == "]":
+                return self._close()
+            self.schema = (self.stack[-1][1] or {}).get("items")
+            return self._start_value(ch)
+        if mode in (_OBJ_FIRST, _OBJ_KEY):
+            if ch == '"':
+                self.mode = _STRING
+                self.is_key = True
+                self.key = ""
+                return True
+            return ch == "}" and mode == _OBJ_FIRST and self._close()
+        if mode == _COLON:
+            if ch != ":":
+                return False
+            frame = self.stack[-1]
+            schema = frame[1] or {}
+            child = schema.get("properties", {}).get(frame[3])
+            if child is None and isinstance(schema.get("additionalProperties"), dict):
+                child = schema["additionalProperties"]
+            self.schema = child
+            self.mode = _VALUE
+            return True
+        if mode == _AFTER:
+            frame = self.stack[-1]
+            if ch == ",":
+                if frame[0] == "o":
+                    self.mode = _OBJ_KEY
+                    return True
+                schema = frame[1] or {}
+                if schema.get("maxItems") is not None and frame[2] >= schema["maxItems"]:
+                    return False
+                self.schema = schema.get("items")
+                self.mode = _VALUE
+                return True
+            if (ch == "}" and frame[0] == "o") or (ch == "]" and frame[0] == "a"):
+                return self._close()
+            return False
+        # _DONE: only trailing whitespace is allowed
+        return False
+
+    def _start_value(self, ch):
+        if ch == "{":
+            kind = "object"
+        elif ch == "[":
+            kind = "array"
+        elif ch == '"':
+            kind = "string"
+        elif ch == "-" or ch in _DIGITS:
+            kind = "number"
+        elif ch in "tf":
+            kind = "boolean"
+        elif ch == "n":
+            kind = "null"
+        else:
+            return False
+        expected = (self.schema or {}).get("type")
+        if expected and expected != kind:
+            return False
+
+        if kind == "object":
+            self.stack.append(["o", self.schema, frozenset(), None])
+            self.mode = _OBJ_FIRST
+        elif kind == "array":
+            self.stack.append(["a", self.schema, 0, None])
+            self.mode = _ARR_FIRST
+        elif kind == "string":
+            self.mode = _STRING
+            self.is_key = False
+            self.esc = 0
+        elif kind == "number":
+            self.mode = _NUMBER
+            self.num = _N_MINUS if ch == "-" else (_N_ZERO if ch == "0" else _N_INT)
+        else:
+            self.mode = _LITERAL
+            self.lit = {"t": "rue", "f": "alse", "n": "ull"}[ch]
+        return True
+
+    def _string_char(self, ch):
+        if self.esc == 1:
+            if ch == "u":
+                self.esc = -4
+            elif ch in '"\\/bfnrt':
+                self.esc = 0
+            else:
+                return False
+        elif self.esc < 0:
+            if ch not in _HEX:
+                return False
+            self.esc += 1
+        elif ch == "\\":
+            self.esc = 1
+        elif ch == '"':
+            if self.is_key:
+                frame = self.stack[-1]
+                frame[2] = frame[2] | {self.key}
+                frame[3] = self.key
+                self.mode = _COLON
+            else:
+                self._end_value()
+            return True
+        elif ord(ch) < 0x20:
+            return False
+        if self.is_key:
+            self.key += ch
+        return True
+
+    def _number_char(self, ch):
+        s = self.num
+        digit = ch in _DIGITS
+        if s == _N_MINUS:
+            if not digit:
+                return False
+            self.num = _N_ZERO if ch == "0" else _N_INT
+        elif s in (_N_ZERO, _N_INT):
+            if digit and s == _N_INT:
+                pass
+            elif ch == ".":
+                self.num = _N_DOT
+            elif ch in "eE":
+                self.num = _N_E
+            else:
+                return False
+        elif s in (_N_DOT, _N_FRAC):
+            if digit:
+                self.num = _N_FRAC
+            elif ch in "eE" and s == _N_FRAC:
+                self.num = _N_E
+            else:
+                return False
+        elif s == _N_E:
+            if ch in "+-":
+                self.num = _N_ESIGN
+            elif digit:
+                self.num = _N_EXP
+            else:
+                return False
+        else:  # _N_ESIGN, _N_EXP
+            if not digit:
+                return False
+            self.num = _N_EXP
+        return True
+
+    def _close(self):
+        frame = self.stack[-1]
+        schema = frame[1] or {}
+        if frame[0] == "o":
+            if any(key not in frame[2] for key in schema.get("required", ())):
+                return False
+        elif frame[2] < schema.get("minItems", 0):
+            return False
+        self.stack.pop()
+        self._end_value()
+        return True
+
+    def _end_value(self):
+        if not self.stack:
+            self.mode = _DONE
+            return
+        frame = self.stack[-1]
+        if frame[0] == "a":
+            frame[2] += 1
+        self.mode = _AFTER
+
+
+def token_texts(tokenizer):
+    """Return the surface text of every vocabulary id (None for special/unusable ids)."""
+    special = set(tokenizer.all_special_ids)
+    texts = []
+    for tid, piece in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+        if piece is None or tid in special:
+            texts.append(None)
+        elif len(piece) == 6 and piece.startswith("<0x") and piece.endswith(">"):
+            # SentencePiece byte fallback; non-ASCII bytes are only ever valid inside strings
+            byte = int(piece[3:5], 16)
+            texts.append(chr(byte) if byte < 0x80 else "�")
+        elif "▁" in piece:
+            # SentencePiece word boundary marker; convert_tokens_to_string would strip it
+            texts.append(piece.replace("▁", " "))
+        else:
+            texts.append(tokenizer.convert_tokens_to_string([piece]))
+    return texts
+
+
+class WorkflowConstraint:
+    """Per-sequence grammar state that masks logits to valid workflow JSON continuations."""
+
+    def __init__(self, texts, eos_token_id, schema=WORKFLOW_SCHEMA, top_k=DEFAULT_TOP_K):
+        self.scanner = JsonScanner(schema)
+        self.texts = texts
+        self.eos_token_id = eos_token_id
+        self.top_k = top_k
+        # Set once no token within MAX_TOP_K continues the output; the sequence has to end there
+        self.stalled = False
+
+    @property
+    def done(self):
+        return self.scanner.done
+
+    def allows(self, token_id):
+        if token_id == self.eos_token_id:
+            return self.scanner.done
+        text = self.texts[token_id] if token_id < len(self.texts) else None
+        return bool(text) and self.scanner.copy().feed(text)
+
+    def advance(self, token_id):
+        """Record a sampled token; EOS and tokens after completion or a stall are ignored."""
+        if token_id == self.eos_token_id or self.scanner.done or self.stalled:
+            return
+        text = self.texts[token_id] if token_id < len(self.texts) else None
+        if not text or not self.scanner.feed(text):
+            raise ValueError(f"token {token_id} violates the workflow grammar")
+
+    def mask(self, logits):
+        """Return a copy of 1-D logits with every grammar-violating token set to -inf.
+
+        When nothing may follow (the object closed, or the grammar stalled) EOS
+        is the only token left. Without an EOS id that leaves nothing to sample,
+        so None is returned and the caller has to end the sequence itself.
+        """
+        masked = torch.full_like(logits, float("-inf"))
+        allowed = [] if self.scanner.done else self._allowed(logits)
+        if allowed:
+            masked[allowed] = logits[allowed]
+            return masked
+        self.stalled = not self.scanner.done
+        if self.eos_token_id is None:
+            return None
+        # EOS's own logit may be -inf; any finite value makes it the certain pick
+        masked[self.eos_token_id] = 0.0
+        return masked
+
+    def _allowed(self, logits):
+        """Valid tokens among the best-scoring ones, widening the window while none fit."""
+        vocab = logits.shape[-1]
+        limit = min(vocab, max(self.top_k, MAX_TOP_K))
+        checked, k = 0, min(self.top_k, limit)
+        while True:
+            candidates = torch.topk(logits, k).indices.tolist()[checked:]
+            allowed = [t for t in candidates if self.allows(t)]
+            if allowed or k >= limit:
+                return allowed
+            checked, k = k, min(k * TOP_K_GROWTH, limit)
+
+
+class WorkflowLogitsProcessor:
+    """model.generate() logits processor applying one WorkflowConstraint per batch row."""
+
+    def __init__(self, texts, eos_token_id, prompt_length, schema=WORKFLOW_SCHEMA, top_k=DEFAULT_TOP_K):
+        self.texts = texts
+        self.eos_token_id = eos_token_id
+        self.schema = schema
+        self.top_k = top_k
+        self.seen = prompt_length
+        self.constraints = None
+
+    def __call__(self, input_ids, scores):
+        if self.constraints is None:
+            self.constraints = [
+                WorkflowConstraint(self.texts, self.eos_token_id, self.schema, self.top_k)
+                for _ in range(input_ids.shape[0])
+            ]
+        # Catch each row's grammar state up with the token sampled last step
+        for row, constraint in enumerate(self.constraints):
+            for token_id in input_ids[row, self.seen:].tolist():
+                constraint.advance(token_id)
+            masked = constraint.mask(scores[row])
+            # None: stalled without an EOS id to end on; the row runs on unconstrained to max_length
+            if masked is not None:
+                scores[row] = masked
+        self.seen = input_ids.shape[1]
+        return scores
+
+
+class JsonObjectTracker:
+    """Brace/string-aware watcher that notices when the first top-level object closes.
+
+    Unlike WorkflowConstraint it never rejects anything, so it also works for
+    unconstrained generations that wrap the JSON in chatter.
+    """
+
+    __slots__ = ("texts", "depth", "started", "in_string", "escape", "done")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.done = False
+
+    def advance(self, token_id):
+        text = self.texts[token_id] if token_id < len(self.texts) else None
+        if text and not self.done:
+            self.feed(text)
+        return self.done
+
+    def feed(self, text):
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif not self.started:
+                # Anything before the first brace (quotes included) is chatter
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.done = True
+                    break
+        return self.done
+
+
+class BalancedJsonStoppingCriteria:
+    """model.generate() stopping criterion that ends each row once its JSON object closes.
+
+    tokens_saved holds how much of the max_length budget was left unused.
+    """
+
+    def __init__(self, texts, prompt_length, max_length):
+        self.texts = texts
+        self.seen = prompt_length
+        self.max_length = max_length
+        self.trackers = None
+        self.tokens_saved = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.trackers is None:
+            self.trackers = [JsonObjectTracker(self.texts) for _ in range(input_ids.shape[0])]
+        for row, tracker in enumerate(self.trackers):
+            for token_id in input_ids[row, self.seen:].tolist():
+                tracker.advance(token_id)
+        self.seen = input_ids.shape[1]
+        done = torch.tensor([t.done for t in self.trackers], dtype=torch.bool, device=input_ids.device)
+        if bool(done.all()):
+            self.tokens_saved = max(0, self.max_length - input_ids.shape[1])
+        return done
+
+
+class NodeStreamExtractor:
+    """Yield each completed element of the top-level "nodes" array from streamed JSON text."""
+
+    def __init__(self):
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string = []
+        self.last_string = None  # Most recent string at depth 1, i.e. the key before a value
+        self.in_nodes = False
+        self.capture = None
+
+    def feed(self, text):
+        """Consume more text; returns the list of node dicts completed by it."""
+        nodes = []
+        for ch in text:
+            if self.capture is not None:
+                self.capture.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_string = "".join(self.string)
+                elif len(self.stack) == 1:
+                    self.string.append(ch)
+            elif not self.stack:
+                # Chatter before the workflow object
+                if ch == "{":
+                    self.stack.append(ch)
+            elif ch == '"':
+                self.in_string = True
+                self.string = []
+            elif ch in "{[":
+                if len(self.stack) == 1 and ch == "[":
+                    self.in_nodes = self.last_string == "nodes"
+                elif len(self.stack) == 2 and ch == "{" and self.in_nodes:
+                    self.capture = [ch]
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if self.capture is not None and len(self.stack) == 2:
+                    try:
+                        nodes.append(json.loads("".join(self.capture)))
+                    except ValueError:
+                        pass  # Not valid JSON after all; the final parse will report it
+                    self.capture = None
+                elif len(self.stack) == 1:
+                    self.in_nodes = False
+        return nodes
@@ -0,0 +1,218 @@
+"""
+Catalogue of known n8n node types.
+
+Compiled from two sources into data/node_catalog.json:
+- the codex files shipped under n8n_nodes/ (*.node.json), which give
+  categories, aliases and whether the node is a trigger, and
+- the workflows/ corpus, which adds every node type seen in a real workflow
+  with its most common typeVersion, whether it usually carries credentials and
+  whether it only ever starts a chain (webhook, cron, ... triggers).
+
+Lookups by node type or alias are plain dict hits, so validation, defaults and
+the keyword server can ask "is this a trigger?" or "does this need
+credentials?" without their own lists of literals.
+
+Build (or rebuild) the catalogue with:
+    python node_catalog.py
+"""
+
+import json
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+from workflow_index import WORKFLOWS_DIR, _load_workflow_file
+
+CODEX_DIR = Path("n8n_nodes")
+CATALOG_FILE = Path("data") / "node_catalog.json"
+CATALOG_VERSION = 1
+
+# A type counts as needing credentials when at least this share of its corpus uses carry them
+CREDENTIALS_SHARE = 0.25
+
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def short_name(node_type: str) -> str:
+    """n8n-nodes-base.googleSheets -> googleSheets"""
+    return node_type.rsplit(".", 1)[-1]
+
+
+def display_alias(node_type: str) -> str:
+    """n8n-nodes-base.googleSheets -> "google sheets\""""
+    return _CAMEL_RE.sub(" ", short_name(node_type)).lower()
+
+
+def _read_codex(codex_dir: Path) -> dict:
+    codex = {}
+    for path in sorted(codex_dir.rglob("*.node.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        node_type = data.get("node") if isinstance(data, dict) else None
+        if not isinstance(node_type, str):
+            continue
+        docs = data.get("resources", {}).get("primaryDocumentation", [])
+        codex[node_type] = {
+            "categories": list(data.get("categories", [])),
+            "aliases": [a.lower() for a in data.get("alias", [])],
+            "trigger": any("/trigger-nodes/" in d.get("url", "") for d in docs),
+        }
+    return codex
+
+
+def _read_corpus(workflows_dir: Path) -> dict:
+    """Per node type usage counts gathered from the workflow corpus."""
+    stats = {}
+    for path in sorted(workflows_dir.glob("*.json")):
+        try:
+            wf = _load_workflow_file(path)
+        except (OSError, ValueError):
+            continue
+        if wf is None:
+            continue
+        types_by_name = {}
+        for node in wf["nodes"]:
+            if not isinstance(node, dict) or not isinstance(node.get("type"), str):
+                continue
+            types_by_name[node.get("name")] = node["type"]
+            s = stats.setdefault(node["type"], {"count": 0, "credentials": 0, "versions": Counter(),
+                                                "main_in": 0, "main_out": 0})
+            s["count"] += 1
+            s["credentials"] += bool(node.get("credentials"))
+            if isinstance(node.get("typeVersion"), (int, float)):
+                s["versions"][node["typeVersion"]] += 1
+        # Only "main" edges say anything about triggers; ai_* edges wire sub-nodes into agents
+        connections = wf.get("connections") if isinstance(wf.get("connections"), dict) else {}
+        for source, outputs in connections.items():
+            branches = outputs.get("main") if isinstance(outputs, dict) else None
+            for branch in branches or []:
+                for edge in branch or []:
+                    if not isinstance(edge, dict):
+                        continue
+                    if source in types_by_name:
+                        stats[types_by_name[source]]["main_out"] += 1
+                    if edge.get("node") in types_by_name:
+                        stats[types_by_name[edge["node"]]]["main_in"] += 1
+    return stats
+
+
+def _signature(codex_dir: Path, workflows_dir: Path) -> list:
+    sig = []
+    for files in (sorted(codex_dir.rglob("*.node.json")), sorted(workflows_dir.glob("*.json"))):
+        sig += [len(files), max((int(p.stat().st_mtime) for p in files), default=0)]
+    return sig
+
+
+def build_catalog(codex_dir: Path = CODEX_DIR, workflows_dir: Path = WORKFLOWS_DIR) -> dict:
+    codex = _read_codex(codex_dir) if codex_dir.is_dir() else {}
+    corpus = _read_corpus(workflows_dir) if workflows_dir.is_dir() else {}
+
+    nodes = {}
+    for node_type in sorted(set(codex) | set(corpus)):
+        entry = codex.get(node_type, {"categories": [], "aliases": [], "trigger": False})
+        usage = corpus.get(node_type)
+        trigger = entry["trigger"] or short_name(node_type).lower().endswith("trigger")
+        if usage is not None:
+            trigger = trigger or (usage["main_out"] > 0 and usage["main_in"] == 0)
+        nodes[node_type] = {
+            "categories": entry["categories"],
+            "aliases": entry["aliases"],
+            "trigger": trigger,
+            "typeVersion": usage["versions"].most_common(1)[0][0] if usage and usage["versions"] else 1,
+            "credentials": bool(usage) and usage["credentials"] >= CREDENTIALS_SHARE * usage["count"],
+            "count": usage["count"] if usage else 0,
+        }
+
+    # When several types share an alias, the most used one wins
+    aliases = {}
+    for node_type in sorted(nodes, key=lambda t: nodes[t]["count"]):
+        for alias in [display_alias(node_type), short_name(node_type).lower()] + nodes[node_type]["aliases"]:
+            aliases[alias] = node_type
+
+    return {
+        "version": CATALOG_VERSION,
+        "built_at": int(time.time()),
+        "signature": _signature(codex_dir, workflows_dir),
+        "nodes": nodes,
+        "aliases": aliases,
+    }
+
+
+class NodeCatalog:
+    """In-memory view of the catalogue with O(1) lookups by node type or alias."""
+
+    def __init__(self, data: dict):
+        self.nodes = data["nodes"]
+        self.aliases = data["aliases"]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_type):
+        return node_type in self.nodes
+
+    def get(self, node_type: str) -> dict:
+        return self.nodes.get(node_type)
+
+    def resolve(self, name: str) -> str:
+        """Node type for a full type id, short name or alias ("google sheets", "JS"), or None."""
+        if name in self.nodes:
+            return name
+        return self.aliases.get(name.lower().strip())
+
+    def is_trigger(self, node_type: str) -> bool:
+        entry = self.nodes.get(node_type)
+        return entry["trigger"] if entry else short_name(node_type).lower().endswith("trigger")
+
+    def needs_credentials(self, node_type: str) -> bool:
+        entry = self.nodes.get(node_type)
+        return bool(entry and entry["credentials"])
+
+    def type_version(self, node_type: str, default=1):
+        entry = self.nodes.get(node_type)
+        return entry["typeVersion"] if entry else default
+
+
+def save_catalog(data: dict, catalog_file: Path = CATALOG_FILE):
+    catalog_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = catalog_file.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, catalog_file)
+
+
+def load_catalog(catalog_file: Path = CATALOG_FILE, codex_dir: Path = CODEX_DIR,
+                 workflows_dir: Path = WORKFLOWS_DIR) -> NodeCatalog:
+    """Load the prebuilt catalogue, rebuilding it if it is missing or a source changed."""
+    data = None
+    if catalog_file.exists():
+        with open(catalog_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CATALOG_VERSION or data.get("signature") != _signature(codex_dir, workflows_dir):
+            data = None
+    if data is None:
+        data = build_catalog(codex_dir, workflows_dir)
+        try:
+            save_catalog(data, catalog_file)
+        except OSError:
+            pass  # A read-only checkout can still serve from the in-memory catalogue
+    return NodeCatalog(data)
+
+
+def main():
+    start = time.perf_counter()
+    data = build_catalog()
+    save_catalog(data)
+    elapsed = time.perf_counter() - start
+    triggers = sum(1 for entry in data["nodes"].values() if entry["trigger"])
+    print(f"Catalogued {len(data['nodes'])} node types ({triggers} triggers, {len(data['aliases'])} aliases) "
+          f"into {CATALOG_FILE} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
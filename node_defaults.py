@@ -0,0 +1,85 @@
+"""
+Per-node-type defaults applied to generated workflows before they are returned.
+
+Rules live in node_defaults.json (and any extra files listed in
+NODE_DEFAULTS_FILES, later files overriding earlier ones per node type):
+
+    {
+      "n8n-nodes-base.slack": {
+        "description": "free text, ignored",
+        "parameters": {"channel": "#general"},
+        "disabled": true
+      }
+    }
+
+"parameters" are filled in where the node doesn't set them; "disabled" is the
+node's default disabled state. External services that need credentials start
+disabled so the workflow can execute before the user connects accounts; only
+node types with an explicit "disabled": true are affected.
+
+The rules are compiled once into a dict keyed by node type, so normalising a
+workflow is one lookup per node.
+"""
+
+import json
+import os
+from copy import deepcopy
+from pathlib import Path
+
+DEFAULTS_FILE = Path("node_defaults.json")
+
+
+class _Rule:
+    __slots__ = ("params", "disabled")
+
+    def __init__(self, params, disabled):
+        # (key, value, needs_copy): dict/list values are copied per node so nodes never share them
+        self.params = params
+        self.disabled = disabled
+
+
+def load_rules(paths) -> dict:
+    """Merge rule files in order; a later file replaces a node type's rule wholesale."""
+    rules = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected an object keyed by node type")
+        rules.update(data)
+    return rules
+
+
+class NodeDefaults:
+    """Compiled node-type -> defaults table."""
+
+    def __init__(self, rules: dict):
+        table = {}
+        for node_type, rule in rules.items():
+            params = tuple((key, value, isinstance(value, (dict, list)))
+                           for key, value in rule.get("parameters", {}).items())
+            table[node_type] = _Rule(params, rule.get("disabled"))
+        self._table = table
+
+    @classmethod
+    def from_env(cls):
+        extra = [p.strip() for p in os.getenv("NODE_DEFAULTS_FILES", "").split(",") if p.strip()]
+        return cls(load_rules([DEFAULTS_FILE] + extra))
+
+    def __len__(self):
+        return len(self._table)
+
+    def apply(self, workflow: dict) -> dict:
+        """Fill in default parameters and disabled flags in place; returns the workflow."""
+        table = self._table
+        for node in workflow.get("nodes", []):
+            params = node.setdefault("parameters", {})
+            rule = table.get(node.get("type", ""))
+            if rule is None:
+                continue
+            if rule.disabled is not None:
+                node.setdefault("disabled", rule.disabled)
+            for key, value, needs_copy in rule.params:
+                if key not in params:
+                    params[key] = deepcopy(value) if needs_copy else value
+        return workflow
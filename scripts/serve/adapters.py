@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+
+from scheduler import PromptPrefix
+
+"""
+Several LoRA adapters served from one copy of the base model.
+
+Adapters are registered by name (ADAPTERS="ckpt350=Kaggle_Output/n8n-workflow-generator/checkpoint-350,...")
+and loaded into the PeftModel the first time a request asks for one. At most
+max_loaded stay in memory; loading another one deletes the least recently used
+adapter that no running sequence needs. Requests for different adapters are
+decoded in the same batch through peft's per-row adapter_names.
+
+"base" selects the base model without any adapter. All loading and eviction
+happens on the scheduler thread, between forward passes.
+"""
+
+DEFAULT_ADAPTER = "default"
+BASE_ADAPTER = "base"
+# peft's adapter_names entry for rows that skip every adapter
+_PEFT_BASE = "__base__"
+
+
+def parse_adapters(spec: str) -> dict:
+    """"name=path,name=path" -> {name: path}"""
+    adapters = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, path = item.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"ADAPTERS entries look like name=path, got {item.strip()!r}")
+        if name.strip() in (DEFAULT_ADAPTER, BASE_ADAPTER):
+            raise ValueError(f"ADAPTERS can't redefine the reserved adapter name {name.strip()!r}")
+        adapters[name.strip()] = path.strip()
+    return adapters
+
+
+class _Adapter:
+    def __init__(self, path, prefix=None):
+        self.path = path
+        self.prefix = prefix
+        self.requests = 0
+
+
+class AdapterRegistry:
+    """Named LoRA adapters on one PeftModel, loaded on demand and LRU-evicted."""
+
+    def __init__(self, model, paths: dict, prefix_ids=None, default_prefix=None, max_loaded=4):
+        self.model = model
+        self.paths = dict(paths)
+        self.prefix_ids = list(prefix_ids) if prefix_ids is not None else None
+        self.max_loaded = max(1, int(max_loaded))
+        # The adapter PeftModel.from_pretrained attached is always loaded and never evicted
+        self.loaded = OrderedDict([(DEFAULT_ADAPTER, _Adapter(None, default_prefix))])
+        self.stats = {"loads": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name) -> bool:
+        return name is None or name in (DEFAULT_ADAPTER, BASE_ADAPTER) or name in self.paths
+
+    def names(self) -> list:
+        return [DEFAULT_ADAPTER, BASE_ADAPTER] + list(self.paths)
+
+    @staticmethod
+    def peft_name(name):
+        if name == BASE_ADAPTER:
+            return _PEFT_BASE
+        return name or DEFAULT_ADAPTER
+
+    def acquire(self, name, in_use=()):
+        """The loaded adapter for name (None means the default), loading it first if needed."""
+        name = name or DEFAULT_ADAPTER
+        if name not in self:
+            raise KeyError(f"unknown adapter {name!r}")
+        with self._lock:
+            entry = self.loaded.get(name)
+            if entry is None:
+                in_use = {n or DEFAULT_ADAPTER for n in in_use}
+                self._evict(len(self.loaded) + 1 - self.max_loaded, in_use | {name})
+                entry = self._load(name)
+            self.loaded.move_to_end(name)
+            entry.requests += 1
+            return entry
+
+    def _load(self, name):
+        if name == BASE_ADAPTER:
+            entry = _Adapter(None)
+        else:
+            self.model.load_adapter(self.paths[name], adapter_name=name, is_trainable=False)
+            entry = _Adapter(self.paths[name])
+            self.stats["loads"] += 1
+        if self.prefix_ids is not None:
+            entry.prefix = PromptPrefix(self.model, self.prefix_ids, adapter=self.peft_name(name))
+        self.loaded[name] = entry
+        return entry
+
+    def _evict(self, count, keep):
+        """Drop up to count least recently used adapters outside keep (capacity may overflow while all are busy)."""
+        for name in list(self.loaded):
+            if count <= 0:
+                break
+            if name in keep or name == DEFAULT_ADAPTER:
+                continue
+            del self.loaded[name]
+            if name != BASE_ADAPTER:
+                self.model.delete_adapter(name)
+                self.stats["evictions"] += 1
+            count -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, max_loaded=self.max_loaded, available=self.names(),
+                        loaded={name: entry.requests for name, entry in self.loaded.items()})
@@ -1,23 +1,107 @@
 import os
+import sys
 import json
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+import threading
+import time
 import traceback
 import torch  # Needed at module scope for generate()
+from pathlib import Path
+
+from adapters import BASE_ADAPTER, AdapterRegistry, parse_adapters
+from prefork import serve_prefork
+from scheduler import BatchScheduler, GenerationRequest, PromptPrefix
+from speculative import SpeculativeScheduler
+
+# Shared workflow helpers (json_grammar, ...) live at the repository root
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from json_grammar import (
+    COMPACT_WORKFLOW_SCHEMA, WORKFLOW_SCHEMA, JsonObjectTracker, NodeStreamExtractor, WorkflowConstraint, token_texts,
+)
+from node_catalog import load_catalog
+from workflow_format import COMPACT_FORMAT, N8N_FORMAT, compact_workflow, expand_node, expand_workflow, load_format
+from workflow_layout import layout_workflow, strip_positions
+from workflow_validator import WorkflowValidator, describe, unrepaired
 
 """
 Local inference server for the fine-tuned adapter.
 Environment variables:
 - BASE_MODEL: base HF model id (default mistralai/Mistral-7B-Instruct-v0.3)
 - ADAPTER_PATH: path to LoRA adapter (default models/n8n-lora)
+- MERGED_MODEL_PATH: model exported by merge_adapter.py; when set, it is loaded
+  instead of BASE_MODEL + ADAPTER_PATH
+- ADAPTERS: more LoRA adapters of the same base model, "name=path,name=path"; a request
+  picks one with an "adapter" field ("default" is ADAPTER_PATH, "base" no adapter)
+- MAX_ADAPTERS: adapters kept in memory at once, least recently used evicted first (default 4)
+- MAX_BATCH_SIZE: max sequences decoded together by the scheduler (default 8)
+- CONSTRAINED_DECODING: mask logits against the workflow JSON grammar (default 1);
+  a request can override it with a boolean "constrained" field
+- SPECULATIVE: decode with a small draft model guessing ahead of the main one (default 0);
+  DRAFT_MODEL picks it (default FALLBACK_MODEL), SPECULATIVE_TOKENS caps the guesses per step (default 6)
+- EAGER_LOAD: load the model in a background thread at startup and warm it up (default 1);
+  with 0 the model loads on the first request
+- WARMUP_ROUNDS: max warm-up generations before reporting ready (default 3); rounds stop
+  early once one is within 10% of the previous, WARMUP_TOKENS long (default 32)
+
+- WORKERS: serve from this many pre-forked processes sharing one copy of the weights
+  (default 1, CPU only); each is pinned to its share of the CPUs, WORKER_THREADS
+  overrides its PyTorch thread count
+
+A request may carry "examples", a list of {"prompt", "workflow"} pairs (the gateway
+sends the FEW_SHOT_K corpus workflows most relevant to the prompt); they are given
+to the model as earlier user/assistant turns after the cached system prefix, with
+each workflow in the adapter's output format.
+
+Each adapter's output format ("compact" or "n8n") is read from the
+workflow_format.json qlora_train writes next to it; compact output is expanded
+to n8n JSON.
+
+GET /livez answers as soon as the process is up; GET /readyz only returns 200
+once the model is loaded and warmed up, with the load stage and progress
+otherwise, so a load balancer can hold traffic back until then.
 """
 
 app = Flask(__name__)
 
+# Generated workflows are checked (and repaired) against the node catalogue before they're returned
+VALIDATOR = WorkflowValidator(load_catalog())
+
+SYSTEM_PROMPT = (
+    "You are an expert n8n workflow designer. Convert the user's prompt to a valid n8n JSON workflow. "
+    "Return ONLY JSON."
+)
+# Everything before the user's text is identical for every request; its KV cache is computed once
+PROMPT_PREFIX = f"<s>[SYSTEM]\n{SYSTEM_PROMPT}\n[/SYSTEM]\n[USER]\n"
+
+
+def build_prompt(prompt, examples=(), compact=False):
+    # Keep a generic chat template that most instruct models can parse
+    return f"{PROMPT_PREFIX}{few_shot_turns(examples, compact)}{prompt}\n[/USER]\n[ASSISTANT]\n"
+
+
+def few_shot_turns(examples, compact=False):
+    """Earlier user/assistant turns for the request's examples, serialized the way qlora_train writes targets.
+
+    Malformed entries are skipped.
+    """
+    turns = []
+    for ex in examples if isinstance(examples, list) else ():
+        prompt, workflow = (ex.get("prompt"), ex.get("workflow")) if isinstance(ex, dict) else (None, None)
+        if not isinstance(prompt, str) or not isinstance(workflow, dict):
+            continue
+        if compact:
+            answer = json.dumps(compact_workflow(workflow, positions=False), ensure_ascii=False, separators=(",", ":"))
+        else:
+            answer = json.dumps(strip_positions(workflow), ensure_ascii=False)
+        turns.append(f"{prompt.strip()}\n[/USER]\n[ASSISTANT]\n{answer}\n[/ASSISTANT]\n[USER]\n")
+    return "".join(turns)
+
 
 def load_model():
     """Load the primary model (Mistral + LoRA) with graceful CPU/small-model fallback.
 
-    Primary: BASE_MODEL (default mistralai/Mistral-7B-Instruct-v0.2) + ADAPTER_PATH (LoRA)
+    Primary: MERGED_MODEL_PATH if set (adapter already merged by merge_adapter.py),
+    else BASE_MODEL (default mistralai/Mistral-7B-Instruct-v0.2) + ADAPTER_PATH (LoRA)
     Fallback: FALLBACK_MODEL (default Qwen/Qwen2.5-1.5B-Instruct) without adapter
     """
     from transformers import AutoTokenizer, AutoModelForCausalLM
@@ -26,6 +110,10 @@ def load_model():
     base = os.environ.get("BASE_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
     adapter = os.environ.get("ADAPTER_PATH", "models/n8n-lora")
     fallback_id = os.environ.get("FALLBACK_MODEL", "Qwen/Qwen2.5-1.5B-Instruct")
+    merged = os.environ.get("MERGED_MODEL_PATH", "")
+    use_merged = bool(merged) and os.path.exists(os.path.join(merged, "config.json"))
+    if merged and not use_merged:
+        print(f"[WARN] MERGED_MODEL_PATH={merged} has no config.json; loading base + adapter", flush=True)
 
     # Model info for health/debug
     info = {
@@ -33,10 +121,13 @@ def load_model():
         "adapter": adapter,
         "using_fallback": False,
         "model_id": None,
+        "workflow_format": N8N_FORMAT,
     }
 
     # Prefer loading tokenizer from adapter dir if present; fall back to base
-    source_for_tokenizer = adapter if os.path.exists(adapter) else base
+    source_for_tokenizer = merged if use_merged else adapter if os.path.exists(adapter) else base
+    # Safetensors shards of a merged export are memory-mapped and loaded without a random init first
+    source_for_model = merged if use_merged else base
 
     try:
         tokenizer = AutoTokenizer.from_pretrained(source_for_tokenizer, use_fast=True, trust_remote_code=True)
@@ -48,18 +139,23 @@ def load_model():
         # For CPU: use simple device mapping without disk offload
         if torch.cuda.is_available():
             base_model = AutoModelForCausalLM.from_pretrained(
-                base, torch_dtype=dtype, device_map="auto", max_memory={0: "6GB"}, trust_remote_code=True
+                source_for_model, torch_dtype=dtype, device_map="auto", max_memory={0: "6GB"},
+                low_cpu_mem_usage=True, trust_remote_code=True
             )
         else:
             # CPU mode: load directly without device_map to avoid disk offload issues
             base_model = AutoModelForCausalLM.from_pretrained(
-                base, torch_dtype=dtype, trust_remote_code=True
+                source_for_model, torch_dtype=dtype, low_cpu_mem_usage=True, trust_remote_code=True
             ).to("cpu")
 
+        if use_merged:
+            model = base_model
+            info.update({"model_id": merged, "merged": True, "workflow_format": load_format(merged)})
         # Attach LoRA adapter only if adapter path exists and looks valid
-        if os.path.isdir(adapter) and any(os.path.exists(os.path.join(adapter, fname)) for fname in ("adapter_config.json", "adapter_model.bin", "adapter_model.safetensors")):
+        elif os.path.isdir(adapter) and any(os.path.exists(os.path.join(adapter, fname)) for fname in ("adapter_config.json", "adapter_model.bin", "adapter_model.safetensors")):
             model = PeftModel.from_pretrained(base_model, adapter, is_trainable=False)
             info["model_id"] = f"{base} + {adapter}"
+            info["workflow_format"] = load_format(adapter)
         else:
             # No adapter present; run base instruct model
             model = base_model
@@ -89,61 +185,270 @@ def load_model():
             raise
 
 
+def load_draft_model(device):
+    """Draft model for speculative decoding: DRAFT_MODEL (default FALLBACK_MODEL), on the main model's device."""
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    draft_id = os.environ.get("DRAFT_MODEL", os.environ.get("FALLBACK_MODEL", "Qwen/Qwen2.5-1.5B-Instruct"))
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_id, use_fast=True, trust_remote_code=True)
+    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    draft_model = AutoModelForCausalLM.from_pretrained(draft_id, torch_dtype=dtype, trust_remote_code=True).to(device)
+    draft_model.eval()
+    return draft_id, draft_tokenizer, draft_model
+
+
+def load_adapter_registry(model, prefix_ids, default_prefix):
+    """AdapterRegistry for ADAPTERS, or None when unset or the model has no LoRA adapter to swap."""
+    from peft import PeftModel
+
+    paths = parse_adapters(os.environ.get("ADAPTERS", ""))
+    if not paths:
+        return None
+    if not isinstance(model, PeftModel):
+        print("[WARN] ADAPTERS needs a base model loaded with a LoRA adapter (not merged); ignoring it", flush=True)
+        return None
+    for name, path in paths.items():
+        ADAPTER_FORMATS[name] = load_format(path)
+    ADAPTER_FORMATS[BASE_ADAPTER] = N8N_FORMAT
+    registry = AdapterRegistry(model, paths, prefix_ids=prefix_ids, default_prefix=default_prefix,
+                               max_loaded=int(os.environ.get("MAX_ADAPTERS", 4)))
+    MODEL_INFO["adapters"] = registry.names()
+    return registry
+
+
 tokenizer, model = None, None
 MODEL_INFO = None
+DRAFT_TOKENIZER = None
+DRAFT_MODEL = None
+scheduler = None
+TOKEN_TEXTS = None
+PREFIX = None
+ADAPTER_REGISTRY = None
+# Output format of each extra adapter; the default one is in MODEL_INFO
+ADAPTER_FORMATS = {}
+_init_lock = threading.Lock()
+_loader = None
+
+# Load stages in order; progress is the share of stages completed
+LOAD_STAGES = ("loading_model", "preparing", "starting_scheduler", "warming_up", "ready")
+LOAD_STATE = {
+    "stage": "idle",
+    "progress": 0.0,
+    "started_at": None,
+    "ready_at": None,
+    "error": None,
+    "warmup_seconds": [],
+}
+WARMUP_PROMPT = "When a webhook is called, add a row to Google Sheets and send a Slack message"
+# A warm-up round this close to the previous one means latency has settled
+WARMUP_TOLERANCE = 0.1
+
+
+def _set_stage(stage):
+    LOAD_STATE["stage"] = stage
+    LOAD_STATE["progress"] = round(LOAD_STAGES.index(stage) / (len(LOAD_STAGES) - 1), 2)
+    if LOAD_STATE["started_at"] is None:
+        LOAD_STATE["started_at"] = time.time()
+    if stage == "ready":
+        LOAD_STATE["ready_at"] = time.time()
+    print(f"[*] {stage.replace('_', ' ')} ({LOAD_STATE['progress']:.0%})", flush=True)
+
+
+def _ready():
+    return LOAD_STATE["stage"] == "ready"
+
+
+def _speculative():
+    # Speculation needs a draft smaller than the model it serves; skip it when already on the fallback
+    return os.environ.get("SPECULATIVE", "0") == "1" and not MODEL_INFO["using_fallback"]
+
+
+def _load_draft():
+    global DRAFT_TOKENIZER, DRAFT_MODEL
+    draft_id, DRAFT_TOKENIZER, DRAFT_MODEL = load_draft_model(model.device)
+    MODEL_INFO["draft_model"] = draft_id
+
+
+def _preload():
+    """Load what pre-forked workers share: weights and tokenizer tables, but no threads or forward passes."""
+    global tokenizer, model, MODEL_INFO, TOKEN_TEXTS
+    _set_stage("loading_model")
+    tokenizer, model, MODEL_INFO = load_model()
+    TOKEN_TEXTS = token_texts(tokenizer)
+    if _speculative():
+        _load_draft()
+
+
+def _post_fork(worker):
+    # Each worker builds its own prompt prefix and scheduler thread on the shared weights
+    MODEL_INFO["worker"] = worker
+    if os.environ.get("EAGER_LOAD", "1") == "1":
+        start_loading()
 
 
 def _init():
-    global tokenizer, model, MODEL_INFO
-    if tokenizer is None or model is None:
-        try:
-            tokenizer, model, MODEL_INFO = load_model()
-        except Exception as exc:
-            # Log full traceback to ease debugging
-            traceback.print_exc()
-            raise
+    global tokenizer, model, MODEL_INFO, scheduler, TOKEN_TEXTS, PREFIX, ADAPTER_REGISTRY
+    # Concurrent first requests must not load the model (or start the scheduler) twice
+    with _init_lock:
+        if tokenizer is None or model is None:
+            _set_stage("loading_model")
+            try:
+                tokenizer, model, MODEL_INFO = load_model()
+            except Exception as exc:
+                # Log full traceback to ease debugging
+                traceback.print_exc()
+                raise
+        if PREFIX is None:
+            _set_stage("preparing")
+        if TOKEN_TEXTS is None:
+            TOKEN_TEXTS = token_texts(tokenizer)
+        if PREFIX is None:
+            PREFIX = PromptPrefix(model, tokenizer(PROMPT_PREFIX)["input_ids"])
+        if scheduler is None:
+            _set_stage("starting_scheduler")
+            ADAPTER_REGISTRY = load_adapter_registry(model, tokenizer(PROMPT_PREFIX)["input_ids"], PREFIX)
+            if _speculative():
+                if DRAFT_MODEL is None:
+                    _load_draft()
+                scheduler = SpeculativeScheduler(
+                    model, tokenizer, DRAFT_MODEL, DRAFT_TOKENIZER,
+                    draft_prefix=PromptPrefix(DRAFT_MODEL, DRAFT_TOKENIZER(PROMPT_PREFIX)["input_ids"]),
+                    max_draft_tokens=int(os.environ.get("SPECULATIVE_TOKENS", 6)),
+                    adapters=ADAPTER_REGISTRY,
+                ).start()
+            else:
+                scheduler = BatchScheduler(model, tokenizer, max_batch_size=int(os.environ.get("MAX_BATCH_SIZE", 8)),
+                                           adapters=ADAPTER_REGISTRY).start()
+        if not _ready() and _loader is None:
+            _set_stage("ready")  # Lazy loading: no warm-up, the first request pays for it
+
+
+def _warm_up():
+    """Run short generations until their latency settles (first-call allocations, kernel selection, caches)."""
+    _set_stage("warming_up")
+    rounds = int(os.environ.get("WARMUP_ROUNDS", 3))
+    tokens = int(os.environ.get("WARMUP_TOKENS", 32))
+    previous = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        req = _submit({"prompt": WARMUP_PROMPT}, max_new_tokens=tokens)
+        req.wait()
+        if req.error:
+            raise RuntimeError(f"warm-up generation failed: {req.error}")
+        seconds = time.perf_counter() - start
+        LOAD_STATE["warmup_seconds"].append(round(seconds, 3))
+        if previous is not None and abs(seconds - previous) <= WARMUP_TOLERANCE * previous:
+            break
+        previous = seconds
+
+
+def _load_in_background():
+    try:
+        _init()
+        _warm_up()
+        _set_stage("ready")
+    except Exception as exc:
+        traceback.print_exc()
+        LOAD_STATE["stage"] = "failed"
+        LOAD_STATE["error"] = str(exc)
+
+
+def start_loading():
+    """Load and warm up the model on a background thread so the server can answer /livez meanwhile."""
+    global _loader
+    if _loader is None:
+        _loader = threading.Thread(target=_load_in_background, name="model-loader", daemon=True)
+        _loader.start()
+    return _loader
+
+
+def _not_ready():
+    """503 while a background load is in progress (or failed), None when requests can be served."""
+    if _loader is None or _ready():
+        return None
+    resp = jsonify({"ok": False, "error": "model is not ready", "loading": LOAD_STATE})
+    resp.headers["Retry-After"] = "10"
+    return resp, 503
+
+
+@app.route("/livez", methods=["GET"])
+def livez():
+    """The process is up; a failed load is reported so the supervisor can restart it."""
+    ok = LOAD_STATE["stage"] != "failed"
+    return jsonify({"ok": ok, "stage": LOAD_STATE["stage"], "error": LOAD_STATE["error"]}), 200 if ok else 503
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """200 once the model is loaded and warmed up; 503 with load progress before that."""
+    return jsonify({"ok": _ready(), **LOAD_STATE}), 200 if _ready() else 503
 
 
 @app.route("/health", methods=["GET"])
 def health():
     # Initialize if not already, but don't crash health on failure
+    not_ready = _not_ready()
+    if not_ready:
+        return not_ready
     try:
         _init()
         info = MODEL_INFO or {}
-        return jsonify({"ok": True, "model": info})
+        body = {"ok": True, "model": info, "scheduler": scheduler.snapshot()}
+        if ADAPTER_REGISTRY is not None:
+            body["adapters"] = ADAPTER_REGISTRY.snapshot()
+        return jsonify(body)
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
-@app.route("/generate", methods=["POST"])
-def generate():
-    _init()  # Ensure model is loaded
-    data = request.get_json(silent=True) or {}
+def _workflow_format(adapter=None):
+    if adapter in ADAPTER_FORMATS:
+        return ADAPTER_FORMATS[adapter]
+    return (MODEL_INFO or {}).get("workflow_format", N8N_FORMAT)
+
+
+def _compact(adapter=None):
+    return _workflow_format(adapter) == COMPACT_FORMAT
+
+
+def _submit(data, stream=False, max_new_tokens=1024):
+    """Queue a generation for the request body; raises ValueError for a missing prompt or unknown adapter."""
     prompt = data.get("prompt", "").strip()
     if not prompt:
-        return jsonify({"error": "prompt is required"}), 400
+        raise ValueError("prompt is required")
+    adapter = data.get("adapter") or None
+    if adapter is not None and (ADAPTER_REGISTRY is None or adapter not in ADAPTER_REGISTRY):
+        available = ADAPTER_REGISTRY.names() if ADAPTER_REGISTRY is not None else []
+        raise ValueError(f"unknown adapter {adapter!r}; available: {available}")
+    constrained = data.get("constrained", os.environ.get("CONSTRAINED_DECODING", "1") == "1")
+    schema = COMPACT_WORKFLOW_SCHEMA if _compact(adapter) else WORKFLOW_SCHEMA
+    text = build_prompt(prompt, data.get("examples") or [], _compact(adapter))
 
-    system = (
-        "You are an expert n8n workflow designer. Convert the user's prompt to a valid n8n JSON workflow. "
-        "Return ONLY JSON."
-    )
-    # Keep a generic chat template that most instruct models can parse
-    text = (
-        f"<s>[SYSTEM]\n{system}\n[/SYSTEM]\n[USER]\n{prompt}\n[/USER]\n[ASSISTANT]\n"
-    )
-
-    inputs = tokenizer(text, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        out = model.generate(
-            **inputs,
-            max_new_tokens=1024,
-            do_sample=True,
-            temperature=0.2,
-            top_p=0.95,
-            pad_token_id=tokenizer.eos_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-        )
-    full = tokenizer.decode(out[0], skip_special_tokens=True)
+    # Decoding happens on the scheduler thread, batched with other in-flight requests
+    return scheduler.submit(GenerationRequest(
+        tokenizer(text)["input_ids"],
+        max_new_tokens=max_new_tokens,
+        temperature=0.2,
+        top_p=0.95,
+        eos_token_id=tokenizer.eos_token_id,
+        constraint=WorkflowConstraint(TOKEN_TEXTS, tokenizer.eos_token_id, schema) if constrained else None,
+        json_stop=JsonObjectTracker(TOKEN_TEXTS),
+        prefix=PREFIX,
+        stream=stream,
+        draft_input_ids=DRAFT_TOKENIZER(text)["input_ids"] if DRAFT_TOKENIZER is not None else None,
+        adapter=adapter,
+    ))
+
+
+def _result(req):
+    """Build the /generate response body and status for a finished request."""
+    if req.error:
+        return {"error": f"generation failed: {req.error}"}, 500
+    if req.finish_reason == "grammar":
+        return {"error": "generation stopped: no token continues valid workflow JSON",
+                "raw": tokenizer.decode(req.output_ids, skip_special_tokens=True)[-2000:]}, 500
+    # Only decode the completion so braces in the user prompt can't confuse extraction
+    full = tokenizer.decode(req.output_ids, skip_special_tokens=True)
     # Extract JSON
     start = full.find('{')
     end = full.rfind('}')
@@ -153,15 +458,124 @@ def generate():
         content = full
     # Validate JSON
     try:
-        workflow = json.loads(content)
+        workflow = expand_workflow(json.loads(content))
     except Exception as e:
-        return jsonify({"error": f"invalid json: {str(e)}", "raw": full[-2000:]}), 500
+        return {"error": f"invalid json: {str(e)}", "raw": full[-2000:]}, 500
+    issues = VALIDATOR.check(workflow)
+    errors = unrepaired(issues)
+    if errors:
+        return {"error": f"invalid workflow: {describe(errors)}", "issues": issues, "raw": full[-2000:]}, 500
+    layout_workflow(workflow)
     # Attach minimal model info in response for debugging; frontend ignores unknown keys
-    resp = {"workflow": workflow, "method": "local"}
+    resp = {
+        "workflow": workflow,
+        "method": "local",
+        "issues": issues,
+        "metrics": {
+            "prompt_tokens": len(req.input_ids),
+            "prefix_hit_tokens": req.prefix_hit_tokens,
+            "generated_tokens": len(req.output_ids),
+            "workflow_format": _workflow_format(req.adapter),
+            "tokens_saved": req.tokens_saved,
+            "finish_reason": req.finish_reason,
+        },
+    }
+    if req.adapter is not None:
+        resp["adapter"] = req.adapter
+    if req.draft_tokens:
+        resp["metrics"]["draft_tokens"] = req.draft_tokens
+        resp["metrics"]["acceptance_rate"] = round(req.accepted_tokens / req.draft_tokens, 4)
     if MODEL_INFO:
         resp["model"] = MODEL_INFO
-    return jsonify(resp)
+    return resp, 200
+
+
+class StreamDecoder:
+    """Incremental detokenizer: text added by each token, decoding only the last few tokens."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids = []
+        # ids[prefix:read] were already emitted and give the left context for ids[read:]
+        self.prefix = 0
+        self.read = 0
+
+    def feed(self, token_id):
+        self.ids.append(token_id)
+        # Decoding with the previous tokens as context keeps word-leading spaces intact
+        emitted = self.tokenizer.decode(self.ids[self.prefix:self.read], skip_special_tokens=True)
+        text = self.tokenizer.decode(self.ids[self.prefix:], skip_special_tokens=True)
+        # Hold back incomplete multi-byte characters until the next token completes them
+        if len(text) <= len(emitted) or text.endswith("\ufffd"):
+            return ""
+        self.prefix, self.read = self.read, len(self.ids)
+        return text[len(emitted):]
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/generate", methods=["POST"])
+def generate():
+    not_ready = _not_ready()
+    if not_ready:
+        return not_ready
+    _init()  # Ensure model is loaded
+    try:
+        req = _submit(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    req.wait()
+    body, status = _result(req)
+    return jsonify(body), status
+
+
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    """Server-sent events: "token" text deltas, a "node" per completed node object, then "done" or "error"."""
+    not_ready = _not_ready()
+    if not_ready:
+        return not_ready
+    _init()  # Ensure model is loaded
+    try:
+        req = _submit(request.get_json(silent=True) or {}, stream=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def events():
+        decoder = StreamDecoder(tokenizer)
+        nodes = NodeStreamExtractor()
+        # Compact nodes are expanded as they arrive; positions are relative to the previous node
+        previous, taken = None, set()
+        while True:
+            token_id = req.stream.get()
+            if token_id is None:
+                break
+            delta = decoder.feed(token_id)
+            if delta:
+                yield _sse("token", {"text": delta})
+                for node in nodes.feed(delta):
+                    if _compact(req.adapter):
+                        node = expand_node(node, previous, taken)
+                        previous = node["position"]
+                    yield _sse("node", node)
+        body, status = _result(req)
+        yield _sse("done" if status == 200 else "error", body)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=False)
+    workers = int(os.environ.get("WORKERS", 1))
+    if workers > 1 and torch.cuda.is_available():
+        print("[WARN] WORKERS needs CPU inference (CUDA can't be shared across fork); serving one process", flush=True)
+        workers = 1
+    if workers > 1:
+        threads = int(os.environ.get("WORKER_THREADS", 0)) or None
+        serve_prefork(app, "0.0.0.0", 8000, workers, preload=_preload, post_fork=_post_fork, threads=threads)
+    else:
+        if os.environ.get("EAGER_LOAD", "1") == "1":
+            start_loading()
+        app.run(host="0.0.0.0", port=8000, debug=False)
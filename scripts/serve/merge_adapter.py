@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+"""
+Merge a trained LoRA adapter into its base model and save the result once.
+
+Servers that load the merged model skip PeftModel at startup and run no extra
+adapter matmuls per token. Weights are written as safetensors shards, which
+from_pretrained memory-maps and materializes straight into the model with
+low_cpu_mem_usage, so a cold start reads the shards instead of building a
+randomly initialised model first.
+
+    python scripts/serve/merge_adapter.py
+
+Environment variables:
+- ADAPTER_PATH: adapter to merge (default models/n8n-lora; trained_model/ works too)
+- BASE_MODEL: base model id (default: base_model_name_or_path from adapter_config.json)
+- MERGED_MODEL_PATH: output directory (default models/n8n-merged)
+- MERGE_DTYPE: float16 or bfloat16 (default float16)
+- MAX_SHARD_SIZE: safetensors shard size (default 2GB)
+- MERGE_VERIFY: compare merged and adapter logits on a probe prompt (default 1)
+
+Then serve it with MERGED_MODEL_PATH=models/n8n-merged.
+"""
+
+DEFAULT_BASE_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+MERGE_INFO_FILE = "merge_info.json"
+
+# Files copied from the adapter directory next to the merged weights
+_ADAPTER_EXTRAS = ("workflow_format.json",)
+
+PROBE_TEXT = '{"nodes":[{"name":"Webhook","type":"n8n-nodes-base.webhook","typeVersion":1,"parameters":{"path":'
+
+
+def base_model_for(adapter: Path) -> str:
+    config = adapter / "adapter_config.json"
+    if config.exists():
+        with open(config, "r", encoding="utf-8") as f:
+            base = json.load(f).get("base_model_name_or_path")
+        if base:
+            return base
+    return DEFAULT_BASE_MODEL
+
+
+def _probe_logits(model, tokenizer):
+    ids = tokenizer(PROBE_TEXT, return_tensors="pt")["input_ids"].to(model.device)
+    with torch.inference_mode():
+        return model(input_ids=ids).logits[0].float()
+
+
+def main():
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from peft import PeftModel
+
+    adapter = Path(os.environ.get("ADAPTER_PATH", "models/n8n-lora"))
+    base = os.environ.get("BASE_MODEL") or base_model_for(adapter)
+    out_dir = Path(os.environ.get("MERGED_MODEL_PATH", "models/n8n-merged"))
+    dtype_name = os.environ.get("MERGE_DTYPE", "float16")
+    dtype = {"float16": torch.float16, "bfloat16": torch.bfloat16}[dtype_name]
+    if not (adapter / "adapter_config.json").exists():
+        print(f"No adapter_config.json in {adapter}; set ADAPTER_PATH to a trained adapter", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    print(f"Loading {base} ({dtype_name}) + {adapter}...")
+    tokenizer = AutoTokenizer.from_pretrained(adapter, use_fast=True, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(base, torch_dtype=dtype, low_cpu_mem_usage=True,
+                                                 trust_remote_code=True)
+    model = PeftModel.from_pretrained(model, adapter, is_trainable=False)
+    model.eval()
+
+    verify = os.environ.get("MERGE_VERIFY", "1") == "1"
+    reference = _probe_logits(model, tokenizer) if verify else None
+    print("Merging adapter weights...")
+    model = model.merge_and_unload()
+    max_diff = None
+    if verify:
+        merged = _probe_logits(model, tokenizer)
+        max_diff = (merged - reference).abs().max().item()
+        agreement = (merged.argmax(-1) == reference.argmax(-1)).float().mean().item()
+        print(f"Merged vs adapter logits: max abs diff {max_diff:.4f}, top-1 agreement {agreement:.1%}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(out_dir, safe_serialization=True, max_shard_size=os.environ.get("MAX_SHARD_SIZE", "2GB"))
+    tokenizer.save_pretrained(out_dir)
+    for name in _ADAPTER_EXTRAS:
+        if (adapter / name).exists():
+            shutil.copy2(adapter / name, out_dir / name)
+    with open(out_dir / MERGE_INFO_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "base_model": base,
+            "adapter": str(adapter),
+            "dtype": dtype_name,
+            "merged_at": int(time.time()),
+            "probe_max_abs_diff": max_diff,
+        }, f, indent=2)
+
+    size = sum(p.stat().st_size for p in out_dir.glob("*.safetensors"))
+    print(f"Saved merged model to {out_dir} ({size / 1e9:.1f} GB) in {time.perf_counter() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
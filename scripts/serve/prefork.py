@@ -0,0 +1,113 @@
+import gc
+import os
+import signal
+import sys
+import time
+
+"""
+Pre-fork serving: one process loads the model, several processes serve it.
+
+The parent binds the listening socket and loads the weights, then forks
+WORKERS children that accept connections on the shared socket. The weights
+are inherited copy-on-write and only ever read, so every worker uses the same
+physical memory for them. gc.freeze() moves everything loaded so far out of
+the garbage collector's reach, so collections in the workers don't write to
+(and thereby copy) those pages.
+
+Each worker is pinned to its own slice of the CPUs and sizes PyTorch's
+intra-op thread pool to it, so workers don't fight over cores. Threads don't
+survive fork(): the parent must not start any (no scheduler, no forward pass
+that spins up the OpenMP pool); workers start theirs in post_fork. POSIX only,
+and CPU only since CUDA can't be used across fork().
+"""
+
+# Seconds to wait before replacing a worker that exited, so a crash loop doesn't spin
+RESPAWN_DELAY = 1.0
+
+
+def cpu_sets(workers: int) -> list:
+    """Split the CPUs this process may use into contiguous, near-equal slices, at most one per CPU."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers, len(cpus)))
+    size, extra = divmod(len(cpus), workers)
+    sets, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cpus[start:end])
+        start = end
+    return sets
+
+
+def _run_worker(server, index, cpus, threads, post_fork):
+    import torch
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    print(f"[*] Worker {index} (pid {os.getpid()}): CPUs {cpus[0]}-{cpus[-1]}, {threads} threads", flush=True)
+    if post_fork is not None:
+        post_fork({"index": index, "pid": os.getpid(), "cpus": cpus, "threads": threads})
+    server.serve_forever()
+
+
+def serve_prefork(app, host, port, workers, preload=None, post_fork=None, threads=None):
+    """Load with preload() in this process, then serve app from workers forked processes; blocks.
+
+    post_fork(worker_info) runs first thing in every worker. threads is the
+    intra-op thread count per worker (default: the worker's share of CPUs).
+    """
+    from werkzeug.serving import make_server
+
+    if not hasattr(os, "fork"):
+        raise RuntimeError("pre-fork serving needs os.fork (Linux or macOS)")
+    # Bind before forking so every worker accepts from the same socket
+    server = make_server(host, port, app, threaded=True)
+    if preload is not None:
+        preload()
+    gc.collect()
+    gc.freeze()
+
+    sets = cpu_sets(workers)
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(server, index, sets[index], threads or len(sets[index]), post_fork)
+            finally:
+                os._exit(1)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(len(sets)):
+        spawn(index)
+    print(f"[OK] Serving on http://{host}:{port} with {len(sets)} workers", flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        print(f"[WARN] Worker {index} (pid {pid}) exited with status {status}; restarting", file=sys.stderr, flush=True)
+        time.sleep(RESPAWN_DELAY)
+        spawn(index)
+    server.server_close()
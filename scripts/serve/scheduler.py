@@ -0,0 +1,347 @@
+import queue
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+
+"""
+Continuous batching scheduler for the local inference server.
+
+Flask handlers submit a GenerationRequest and block on it; a single background
+thread owns the model and runs one shared decode loop. Between decode steps new
+requests are prefilled and join the running batch, and finished sequences leave
+immediately, so concurrent users share every forward pass instead of queueing
+behind one another.
+
+Prefill gives each new sequence its own legacy (tuple) KV cache. The running
+batch shares one left-padded, stacked cache that every decode step extends in
+place of the old one; it is only re-padded when sequences join (their cache is
+padded and appended as new rows) or leave (their rows are dropped). A
+PromptPrefix holds the KV cache of the constant system preamble so prefill
+only has to run over the part of the prompt that differs per request.
+
+With an AdapterRegistry every request names a LoRA adapter of one shared base
+model; sequences for different adapters still decode in the same batch (peft
+routes each row through its own adapter).
+"""
+
+
+def _left_pad(k, v, pad):
+    """Prepend pad empty positions to one layer's keys and values."""
+    if not pad:
+        return k, v
+    return F.pad(k, (0, 0, pad, 0)), F.pad(v, (0, 0, pad, 0))
+
+
+class PromptPrefix:
+    """KV cache for a constant prompt prefix, computed once and shared by every request."""
+
+    def __init__(self, model, input_ids, adapter=None):
+        self.input_ids = list(input_ids)
+        # The cached KV depends on the weights, so each LoRA adapter needs its own prefix
+        kwargs = {"adapter_names": [adapter]} if adapter is not None else {}
+        with torch.inference_mode():
+            ids = torch.tensor([self.input_ids], dtype=torch.long, device=model.device)
+            self.past = model(input_ids=ids, use_cache=True, **kwargs).past_key_values
+
+    def match(self, input_ids):
+        """Return (hit_tokens, past) for the longest shared prefix, keeping at least one token to prefill."""
+        limit = min(len(self.input_ids), len(input_ids) - 1)
+        hit = 0
+        while hit < limit and self.input_ids[hit] == input_ids[hit]:
+            hit += 1
+        if hit == 0:
+            return 0, None
+        # Slicing makes views; the model concatenates onto them, so the shared cache is never modified
+        return hit, tuple((k[:, :, :hit, :], v[:, :, :hit, :]) for k, v in self.past)
+
+
+class GenerationRequest:
+    """A single prompt waiting for (or going through) decoding."""
+
+    def __init__(self, input_ids, max_new_tokens=1024, temperature=0.2, top_p=0.95, eos_token_id=None,
+                 constraint=None, json_stop=None, prefix=None, stream=False, draft_input_ids=None, adapter=None):
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.eos_token_id = eos_token_id
+        # Optional json_grammar.WorkflowConstraint masking this sequence's logits
+        self.constraint = constraint
+        # Optional json_grammar.JsonObjectTracker ending decoding once the object closes
+        self.json_stop = json_stop
+        # Optional PromptPrefix whose cached KV replaces prefill of the shared preamble
+        self.prefix = prefix
+        self.prefix_hit_tokens = 0
+        # With stream=True every sampled token id is put on this queue, then None when finished
+        self.stream = queue.Queue() if stream else None
+        # Prompt in the draft model's tokenization (speculative decoding only)
+        self.draft_input_ids = list(draft_input_ids) if draft_input_ids is not None else None
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        # LoRA adapter to decode with (scheduler with an AdapterRegistry only; None is the default one)
+        self.adapter = adapter
+
+        self.output_ids = []
+        self.tokens_saved = 0
+        self.finish_reason = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        # Decoding state owned by the scheduler thread
+        self.past = None
+        self.past_len = 0
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the request has finished; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def _finish(self, reason, error=None):
+        self.finish_reason = reason
+        self.error = error
+        self.finished_at = time.time()
+        self.past = None  # Release the KV cache as soon as the sequence leaves
+        self._done.set()
+        if self.stream is not None:
+            self.stream.put(None)
+
+
+class BatchScheduler:
+    """Run all in-flight GenerationRequests through one shared decode loop."""
+
+    def __init__(self, model, tokenizer, max_batch_size=8, adapters=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max(1, int(max_batch_size))
+        # Optional adapters.AdapterRegistry; adapters are loaded and evicted on this thread only
+        self.adapters = adapters
+        self.pending = queue.Queue()
+        self.active = []
+        # Batched KV cache of the running batch: one row per request in _rows, _cache_len positions long
+        self._rows = []
+        self._past = None
+        self._cache_len = 0
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "failed": 0,
+            "decode_steps": 0,
+            "generated_tokens": 0,
+            "tokens_saved": 0,
+            "prefill_tokens": 0,
+            "prefix_hit_tokens": 0,
+            "max_batch_seen": 0,
+        }
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, req):
+        self.stats["requests"] += 1
+        self.pending.put(req)
+        return req
+
+    def snapshot(self):
+        """Scheduler counters for /health."""
+        return dict(self.stats, active=len(self.active), queued=self.pending.qsize(),
+                    max_batch_size=self.max_batch_size)
+
+    # ------------------------------------------------------------------
+    # Scheduler thread
+    # ------------------------------------------------------------------
+    def _loop(self):
+        with torch.inference_mode():
+            while True:
+                self._admit()
+                if not self.active:
+                    continue
+                try:
+                    self._decode_step()
+                except Exception as exc:
+                    # A failed batched step fails every sequence in it; the loop keeps serving
+                    for req in self.active:
+                        self.stats["failed"] += 1
+                        req._finish("error", error=str(exc))
+                    self.active = []
+                    self._reset_batch()
+
+    def _admit(self):
+        """Move queued requests into the running batch, prefilling each one."""
+        # Sleep on the queue only when there is nothing to decode
+        block = not self.active
+        while len(self.active) < self.max_batch_size:
+            try:
+                req = self.pending.get(block=block)
+            except queue.Empty:
+                break
+            block = False
+            try:
+                self._prefill(req)
+            except Exception as exc:
+                self.stats["failed"] += 1
+                req._finish("error", error=str(exc))
+                continue
+            if not self._maybe_finish(req):
+                self.active.append(req)
+
+    def _adapter_kwargs(self, batch):
+        """Per-row adapter routing for a forward pass over batch (nothing without a registry)."""
+        if self.adapters is None:
+            return {}
+        return {"adapter_names": [self.adapters.peft_name(req.adapter) for req in batch]}
+
+    def _prefill(self, req):
+        req.started_at = time.time()
+        if self.adapters is not None:
+            # Loads the adapter if needed, evicting one no running sequence uses
+            req.prefix = self.adapters.acquire(req.adapter, in_use={r.adapter for r in self.active}).prefix
+        hit, past = req.prefix.match(req.input_ids) if req.prefix is not None else (0, None)
+        req.prefix_hit_tokens = hit
+        self.stats["prefix_hit_tokens"] += hit
+        self.stats["prefill_tokens"] += len(req.input_ids) - hit
+        input_ids = torch.tensor([req.input_ids[hit:]], dtype=torch.long, device=self.model.device)
+        out = self.model(input_ids=input_ids, past_key_values=past, use_cache=True, **self._adapter_kwargs([req]))
+        req.past = out.past_key_values
+        req.past_len = len(req.input_ids)
+        req.output_ids.append(self._sample(out.logits[0, -1], req))
+
+    def _reset_batch(self):
+        self._rows, self._past, self._cache_len = [], None, 0
+
+    def _sync_batch(self):
+        """Bring the batched cache in line with self.active: drop finished rows, pad and append new ones."""
+        rows = self._rows
+        active = set(map(id, self.active))
+        keep = [i for i, req in enumerate(rows) if id(req) in active]
+        if len(keep) < len(rows):
+            rows = [rows[i] for i in keep]
+            if not rows:
+                self._reset_batch()
+            else:
+                # Left padding every remaining row shares (the longest sequence may have left) is cut off too
+                trim = self._cache_len - max(req.past_len for req in rows)
+                index = torch.tensor(keep, dtype=torch.long, device=self._past[0][0].device)
+                self._past = [(k.index_select(0, index)[:, :, trim:, :], v.index_select(0, index)[:, :, trim:, :])
+                              for k, v in self._past]
+                self._cache_len -= trim
+                self._rows = rows
+
+        joined = [req for req in self.active if req.past is not None]
+        if joined:
+            length = max([self._cache_len] + [req.past_len for req in joined])
+            parts = [[] for _ in range(len(joined[0].past))]
+            if self._past is not None:
+                for layer, (k, v) in enumerate(self._past):
+                    parts[layer].append(_left_pad(k, v, length - self._cache_len))
+            for req in joined:
+                for layer, (k, v) in enumerate(req.past):
+                    parts[layer].append(_left_pad(k, v, length - req.past_len))
+                # The batched cache owns this sequence's keys and values from now on
+                req.past = None
+            self._past = [(torch.cat([k for k, _ in layer], dim=0), torch.cat([v for _, v in layer], dim=0))
+                          for layer in parts]
+            self._rows = self._rows + joined
+            self._cache_len = length
+        self.active = list(self._rows)
+
+    def _decode_step(self):
+        self._sync_batch()
+        batch = self.active
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+        device = self.model.device
+        max_len = self._cache_len
+
+        attention_mask = torch.zeros((len(batch), max_len + 1), dtype=torch.long, device=device)
+        for i, req in enumerate(batch):
+            attention_mask[i, max_len - req.past_len:] = 1
+        input_ids = torch.tensor([[req.output_ids[-1]] for req in batch], dtype=torch.long, device=device)
+        position_ids = torch.tensor([[req.past_len] for req in batch], dtype=torch.long, device=device)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=tuple(self._past),
+            use_cache=True,
+            **self._adapter_kwargs(batch),
+        )
+        self.stats["decode_steps"] += 1
+        # Every row grew by one position, so the padding of each row is unchanged
+        self._past = [(k, v) for k, v in out.past_key_values]
+        self._cache_len = max_len + 1
+
+        still_active = []
+        for i, req in enumerate(batch):
+            req.past_len += 1
+            req.output_ids.append(self._sample(out.logits[i, -1], req))
+            if not self._maybe_finish(req):
+                still_active.append(req)
+        self.active = still_active
+        if not still_active:
+            self._reset_batch()  # Don't hold the cache while the loop sleeps on the queue
+
+    def _maybe_finish(self, req):
+        token_id = req.output_ids[-1]
+        if token_id is None or (req.eos_token_id is not None and token_id == req.eos_token_id):
+            # EOS (or None: nothing left to sample) is never returned, so it isn't counted as generated either
+            req.output_ids.pop()
+            self.stats["completed"] += 1
+            # "grammar": no token continued the workflow JSON, so the output is cut short
+            req._finish("grammar" if req.constraint is not None and req.constraint.stalled else "eos")
+            return True
+        self.stats["generated_tokens"] += 1
+        if req.stream is not None:
+            req.stream.put(token_id)
+        if (req.constraint is not None and req.constraint.done) or (
+                req.json_stop is not None and req.json_stop.advance(token_id)):
+            # The workflow object just closed; anything after it would be discarded
+            reason = "json_complete"
+            req.tokens_saved = req.max_new_tokens - len(req.output_ids)
+            self.stats["tokens_saved"] += req.tokens_saved
+        elif len(req.output_ids) >= req.max_new_tokens:
+            reason = "length"
+        else:
+            return False
+        self.stats["completed"] += 1
+        req._finish(reason)
+        return True
+
+    @staticmethod
+    def _sample(logits, req):
+        """Temperature + nucleus sampling for one sequence, matching model.generate().
+
+        Returns None when the grammar constraint leaves no token to sample.
+        """
+        logits = logits.float()
+        if req.constraint is not None:
+            logits = req.constraint.mask(logits)
+            if logits is None:
+                return None
+        token_id = BatchScheduler._sample_logits(logits, req)
+        if req.constraint is not None:
+            req.constraint.advance(token_id)
+        return token_id
+
+    @staticmethod
+    def _sample_logits(logits, req):
+        if not req.temperature or req.temperature <= 0:
+            return int(torch.argmax(logits))
+        logits = logits / req.temperature
+        if req.top_p is not None and req.top_p < 1.0:
+            sorted_logits, sorted_idx = torch.sort(logits, descending=True)
+            cum_probs = torch.softmax(sorted_logits, dim=-1).cumsum(dim=-1)
+            remove = cum_probs > req.top_p
+            # Always keep the most likely token
+            remove[1:] = remove[:-1].clone()
+            remove[0] = False
+            logits = logits.index_fill(0, sorted_idx[remove], float("-inf"))
+        probs = torch.softmax(logits, dim=-1)
+        return int(torch.multinomial(probs, num_samples=1))
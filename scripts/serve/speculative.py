@@ -0,0 +1,171 @@
+import torch
+
+from scheduler import BatchScheduler
+
+"""
+Speculative decoding for the local inference server.
+
+A small draft model (FALLBACK_MODEL by default) guesses the next few tokens
+and the large model checks all of them in one forward pass, so each pass of
+the large model can emit several tokens instead of one. Workflow JSON is very
+predictable (keys, brackets, repeated node structure), so most guesses hold.
+
+The draft and target models don't share a tokenizer, so guesses travel as
+text: the draft continues the text generated so far, and its continuation is
+re-tokenized with the target tokenizer. The target then samples every
+position with its own sampler (same temperature, top-p and grammar
+constraint as the batch scheduler) and keeps draft tokens only while they
+match what it sampled. The output therefore follows the target model's
+distribution exactly; the draft only decides how many tokens each forward
+pass produces.
+
+Requests are decoded one at a time, which suits a CPU box serving a few users;
+with many concurrent users the continuous batching scheduler does better.
+"""
+
+# Target tokens re-decoded as left context when re-tokenizing a draft continuation
+CONTEXT_TOKENS = 8
+
+
+def crop_past(past, length):
+    """Drop cached positions from length on (DynamicCache or legacy tuple cache)."""
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    return tuple((k[:, :, :length, :], v[:, :, :length, :]) for k, v in past)
+
+
+class _DraftState:
+    """Draft model KV cache and the token ids it covers, for one request."""
+
+    def __init__(self, prompt_ids):
+        self.prompt_ids = prompt_ids
+        self.ids = []
+        self.past = None
+
+
+class SpeculativeScheduler(BatchScheduler):
+    """BatchScheduler interface (submit/wait/stream/snapshot) decoding with a draft model."""
+
+    def __init__(self, model, tokenizer, draft_model, draft_tokenizer, draft_prefix=None, max_draft_tokens=6,
+                 adapters=None):
+        super().__init__(model, tokenizer, max_batch_size=1, adapters=adapters)
+        self.draft_model = draft_model
+        self.draft_tokenizer = draft_tokenizer
+        # Optional PromptPrefix over the draft tokenization of the shared preamble
+        self.draft_prefix = draft_prefix
+        self.max_draft_tokens = max(1, int(max_draft_tokens))
+        self.stats.update({"draft_tokens": 0, "accepted_tokens": 0, "target_forwards": 0})
+
+    def snapshot(self):
+        snap = super().snapshot()
+        snap["speculative"] = True
+        snap["acceptance_rate"] = round(self.stats["accepted_tokens"] / max(1, self.stats["draft_tokens"]), 4)
+        # Tokens emitted per forward pass of the target model (1.0 without speculation)
+        snap["tokens_per_forward"] = round(self.stats["generated_tokens"] / max(1, self.stats["target_forwards"]), 3)
+        return snap
+
+    # ------------------------------------------------------------------
+    # Scheduler thread
+    # ------------------------------------------------------------------
+    def _loop(self):
+        with torch.inference_mode():
+            while True:
+                req = self.pending.get()
+                try:
+                    self._prefill(req)
+                    self.stats["target_forwards"] += 1
+                    if not self._maybe_finish(req):
+                        self.active = [req]
+                        self._generate(req)
+                except Exception as exc:
+                    self.stats["failed"] += 1
+                    req._finish("error", error=str(exc))
+                finally:
+                    self.active = []
+
+    def _generate(self, req):
+        prompt_ids = req.draft_input_ids
+        if prompt_ids is None:
+            prompt_ids = self.draft_tokenizer(self.tokenizer.decode(req.input_ids, skip_special_tokens=True))["input_ids"]
+        draft = _DraftState(prompt_ids)
+        k = self.max_draft_tokens
+        while True:
+            proposal = self._propose(req, draft, k)
+            past_len = req.past_len
+            input_ids = torch.tensor([[req.output_ids[-1]] + proposal], dtype=torch.long, device=self.model.device)
+            out = self.model(input_ids=input_ids, past_key_values=req.past, use_cache=True,
+                             **self._adapter_kwargs([req]))
+            self.stats["target_forwards"] += 1
+            self.stats["decode_steps"] += 1
+
+            # Sample each position as plain decoding would; stop at the first disagreement
+            accepted = 0
+            for j in range(len(proposal) + 1):
+                token_id = self._sample(out.logits[0, j], req)
+                req.output_ids.append(token_id)
+                if self._maybe_finish(req):
+                    self._count(req, len(proposal), accepted)
+                    return
+                if j < len(proposal) and token_id == proposal[j]:
+                    accepted += 1
+                    continue
+                break
+            self._count(req, len(proposal), accepted)
+
+            # The cache now holds the previous last token plus the accepted guesses
+            req.past_len = past_len + 1 + accepted
+            req.past = crop_past(out.past_key_values, req.past_len)
+            # Guess further while guesses hold, back off after a miss
+            k = min(self.max_draft_tokens, k + 1) if accepted == len(proposal) else max(1, accepted + 1)
+
+    def _count(self, req, proposed, accepted):
+        req.draft_tokens += proposed
+        req.accepted_tokens += accepted
+        self.stats["draft_tokens"] += proposed
+        self.stats["accepted_tokens"] += accepted
+
+    def _propose(self, req, draft, k):
+        """Up to k draft guesses for the tokens after req.output_ids, as target token ids."""
+        text = self.tokenizer.decode(req.output_ids, skip_special_tokens=True)
+        want = draft.prompt_ids + self.draft_tokenizer(text, add_special_tokens=False)["input_ids"]
+        device = self.draft_model.device
+
+        if draft.past is None and self.draft_prefix is not None:
+            hit, draft.past = self.draft_prefix.match(want)
+            draft.ids = want[:hit]
+        # Reuse the draft cache up to where its tokens still agree with the text, feeding at least one token
+        common = 0
+        limit = min(len(draft.ids), len(want) - 1)
+        while common < limit and draft.ids[common] == want[common]:
+            common += 1
+        if draft.past is not None and common < len(draft.ids):
+            draft.past = crop_past(draft.past, common)
+        out = self.draft_model(input_ids=torch.tensor([want[common:]], dtype=torch.long, device=device),
+                               past_key_values=draft.past if common else None, use_cache=True)
+        draft.ids = list(want)
+
+        guesses = []
+        eos = self.draft_tokenizer.eos_token_id
+        for i in range(k):
+            token_id = int(torch.argmax(out.logits[0, -1]))
+            if token_id == eos:
+                break
+            guesses.append(token_id)
+            if i < k - 1:
+                out = self.draft_model(input_ids=torch.tensor([[token_id]], dtype=torch.long, device=device),
+                                       past_key_values=out.past_key_values, use_cache=True)
+                draft.ids.append(token_id)
+        # draft.ids now matches the cache: the text so far plus every guess fed back in
+        draft.past = out.past_key_values
+        if not guesses:
+            return []
+
+        # Re-tokenize the guessed text with the target tokenizer, anchored on the last few target tokens
+        drafted = self.draft_tokenizer.decode(guesses, skip_special_tokens=True)
+        context = self.tokenizer.decode(req.output_ids[-CONTEXT_TOKENS:], skip_special_tokens=True)
+        before = self.tokenizer(context, add_special_tokens=False)["input_ids"]
+        after = self.tokenizer(context + drafted, add_special_tokens=False)["input_ids"]
+        if after[:len(before)] != before:
+            return []  # The guess changed how the context tokenizes; decode one token normally
+        return after[len(before):][:2 * self.max_draft_tokens]
@@ -0,0 +1,77 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+"""
+Time simple_test_server.keyword_to_nodes on the training and test prompts.
+
+    python scripts/test/bench_keywords.py
+
+Environment variables:
+- BASELINE_REV: git revision whose simple_test_server.py is timed alongside the
+  current one, with outputs compared (e.g. ac50497 for the word-trie matcher)
+- BENCH_ROUNDS: timing rounds per prompt set, best one reported (default 5)
+"""
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+import simple_test_server
+from test_complex_prompts import TEST_PROMPTS
+
+
+def load_revision(rev):
+    source = subprocess.run(["git", "show", f"{rev}:simple_test_server.py"], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    path = Path(tempfile.mkdtemp()) / "baseline_test_server.py"
+    path.write_text(source, encoding="utf-8")
+    spec = importlib.util.spec_from_file_location("baseline_test_server", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def per_call_us(fn, prompts, rounds, loops=300):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for prompt in prompts:
+                fn(prompt)
+        best = min(best, (time.perf_counter() - start) / (loops * len(prompts)))
+    return best * 1e6
+
+
+def main():
+    rounds = int(os.environ.get("BENCH_ROUNDS", 5))
+    with open(ROOT / "training_examples.json", "r", encoding="utf-8") as f:
+        training = [ex["prompt"] for ex in json.load(f)]
+    sets = {
+        "training prompts": training,
+        "test prompts": list(TEST_PROMPTS),
+    }
+    # Prompts of a given length in words, from the test prompts repeated
+    words = " ".join(TEST_PROMPTS).split()
+    for n in (16, 64, 256, 1024):
+        sets[f"{n}-word prompt"] = [" ".join((words * (n // len(words) + 1))[:n])]
+    rev = os.environ.get("BASELINE_REV")
+    baseline = load_revision(rev) if rev else None
+
+    for label, prompts in sets.items():
+        line = f"{label:18s} current {per_call_us(simple_test_server.keyword_to_nodes, prompts, rounds):7.1f}us"
+        if baseline is not None:
+            line += f"  {rev} {per_call_us(baseline.keyword_to_nodes, prompts, rounds):7.1f}us"
+        print(line)
+    if baseline is not None:
+        prompts = [p for ps in sets.values() for p in ps]
+        differ = sum(simple_test_server.keyword_to_nodes(p) != baseline.keyword_to_nodes(p) for p in prompts)
+        print(f"{differ} of {len(prompts)} prompts map to different nodes")
+
+
+if __name__ == "__main__":
+    main()
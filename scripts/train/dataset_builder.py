@@ -1,15 +1,53 @@
+import hashlib
 import json
 import os
+import shutil
+import sys
+import time
+import zlib
+from multiprocessing import Pool
 from pathlib import Path
 
+# node_catalog lives at the repo root
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from node_catalog import load_catalog
+from dedup import cluster, cluster_stats, fingerprint
+
+try:
+    import orjson  # Optional: several times faster than the stdlib json
+except ImportError:
+    orjson = None
+
 """
 Build a simple instruction-tuning dataset from existing n8n workflows.
 Output: data/dataset.jsonl with lines: {"prompt": str, "workflow": {...}}
+
+Workflow files are decoded across a process pool and their examples streamed
+into DATASET_SHARDS shard files under data/dataset_shards/ (a file's shard is a
+hash of its path). data/dataset_manifest.json records each file's mtime, size,
+content hash and outcome, so a rebuild only re-reads files whose mtime or size
+changed, only decodes those whose hash changed, and only rewrites the shards
+they live in. data/dataset.jsonl is the shards concatenated, minus
+duplicates: workflows whose canonical node graph and parameters match
+(exactly, or above DEDUP_THRESHOLD estimated Jaccard similarity via MinHash/LSH)
+are clustered, only the first DEDUP_KEEP of each cluster are kept, and the
+clusters are reported in data/dataset_clusters.json. DEDUP=0 keeps everything.
+
+Files that can't be read or parsed are listed at the end of every build (and
+kept in the manifest); DATASET_STRICT=1 makes them fail the build.
+Other env: DATASET_WORKERS (default: CPU count), DATASET_FULL_REBUILD=1 to
+ignore the manifest.
 """
 
 WORKFLOWS_DIR = Path("workflows")
 OUTPUT_DIR = Path("data")
 OUTPUT_FILE = OUTPUT_DIR / "dataset.jsonl"
+SHARDS_DIR = OUTPUT_DIR / "dataset_shards"
+MANIFEST_FILE = OUTPUT_DIR / "dataset_manifest.json"
+CLUSTERS_FILE = OUTPUT_DIR / "dataset_clusters.json"
+MANIFEST_VERSION = 3
+
+NODE_CATALOG = load_catalog()
 
 
 def infer_prompt_from_workflow(wf: dict) -> str:
@@ -26,8 +64,7 @@ def infer_prompt_from_workflow(wf: dict) -> str:
     actions = []
     for n in nodes:
         t = n.get("type", "")
-        if "Trigger" in n.get("name", "") or t.endswith("Trigger") or \
-           t.endswith(".webhook") or t.endswith(".manualTrigger"):
+        if "Trigger" in n.get("name", "") or NODE_CATALOG.is_trigger(t):
             trigger = n
         else:
             actions.append(n)
@@ -45,31 +82,234 @@ def infer_prompt_from_workflow(wf: dict) -> str:
     return f"Connect {listed} in a simple workflow"
 
 
+def _decode(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _encode(example: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(example).decode("utf-8")
+    return json.dumps(example, ensure_ascii=False)
+
+
+def process_file(task):
+    """Worker: (rel, path, previous sha1) -> (rel, sha1, status, payload, fingerprint).
+
+    status is "unchanged" (same content hash as last build), "ok" (payload is
+    the JSONL line, fingerprint its dedup fingerprint), "skipped" (valid JSON
+    but not a workflow) or "error" (payload is the message).
+    """
+    rel, path, old_sha1 = task
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        return rel, None, "error", f"read failed: {e}", None
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if sha1 == old_sha1:
+        return rel, sha1, "unchanged", None, None
+    try:
+        data = _decode(raw)
+    except ValueError as e:  # Also covers orjson.JSONDecodeError and bad UTF-8
+        return rel, sha1, "error", f"invalid JSON: {e}", None
+    # Some files may wrap the workflow differently; try keys
+    wf = data
+    if isinstance(data, dict) and "nodes" not in data and "workflow" in data:
+        wf = data["workflow"]
+    if not isinstance(wf, dict) or "nodes" not in wf:
+        return rel, sha1, "skipped", None, None
+    try:
+        prompt = infer_prompt_from_workflow(wf)
+        fp = fingerprint(wf)
+    except (AttributeError, TypeError) as e:  # e.g. nodes that aren't objects
+        return rel, sha1, "error", f"malformed workflow: {e}", None
+    return rel, sha1, "ok", _encode({"prompt": prompt, "workflow": wf}), fp
+
+
+def scan(workflows_dir: Path) -> dict:
+    """Relative path -> (mtime_ns, size) for every .json file under workflows_dir."""
+    files = {}
+    for root, _, names in os.walk(workflows_dir):
+        for fname in names:
+            if not fname.lower().endswith(".json"):
+                continue
+            path = Path(root) / fname
+            st = path.stat()
+            files[path.relative_to(workflows_dir).as_posix()] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def shard_of(rel: str, num_shards: int) -> int:
+    return zlib.crc32(rel.encode("utf-8")) % num_shards
+
+
+def shard_path(shard: int) -> Path:
+    return SHARDS_DIR / f"part-{shard:05d}.jsonl"
+
+
+def load_manifest(num_shards: int):
+    """The previous build's manifest, or None if there is none or it can't be reused."""
+    if not MANIFEST_FILE.exists():
+        return None
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if (manifest.get("version") != MANIFEST_VERSION or manifest.get("num_shards") != num_shards
+            or manifest.get("source") != WORKFLOWS_DIR.as_posix()):
+        return None
+    if any(not shard_path(int(shard)).exists() for shard in manifest["shards"]):
+        return None
+    return manifest
+
+
+def read_shard(manifest: dict, shard: int) -> dict:
+    """Relative path -> JSONL line of every example in one shard of the previous build."""
+    entry = manifest["shards"].get(str(shard))
+    if not entry:
+        return {}
+    with open(shard_path(shard), "r", encoding="utf-8") as f:
+        return {rel: line.rstrip("\n") for rel, line in zip(entry["files"], f)}
+
+
+def save_manifest(manifest: dict):
+    tmp = MANIFEST_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, MANIFEST_FILE)
+
+
 def main():
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    workers = int(os.environ.get("DATASET_WORKERS", 0)) or os.cpu_count() or 1
+    num_shards = int(os.environ.get("DATASET_SHARDS", 16))
+    strict = os.environ.get("DATASET_STRICT", "0") == "1"
+    start = time.perf_counter()
+    SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+
+    old = None if os.environ.get("DATASET_FULL_REBUILD", "0") == "1" else load_manifest(num_shards)
+    old_files = old["files"] if old else {}
+    current = scan(WORKFLOWS_DIR)
+
+    by_shard = {}
+    for rel in sorted(current):
+        by_shard.setdefault(shard_of(rel, num_shards), []).append(rel)
+
+    # Only files whose stat changed are re-read; a matching hash still spares decoding them
+    stale = {rel for rel, (mtime_ns, size) in current.items()
+             if rel not in old_files
+             or (old_files[rel]["mtime_ns"], old_files[rel]["size"]) != (mtime_ns, size)}
+    deleted = set(old_files) - set(current)
+    if old is None:
+        dirty = list(range(num_shards))
+    else:
+        dirty = sorted({shard_of(rel, num_shards) for rel in stale | deleted})
+
+    files = {rel: old_files[rel] for rel in current if rel not in stale}
+    shards = dict(old["shards"]) if old else {}
+    tasks = [(rel, str(WORKFLOWS_DIR / rel), old_files.get(rel, {}).get("sha1"))
+             for shard in dirty for rel in by_shard.get(shard, []) if rel in stale]
+
+    rebuilt = []
+    pool = Pool(workers) if workers > 1 and len(tasks) > 1 else None
+    try:
+        if pool is not None:
+            # imap keeps task order, so results line up with the shard-by-shard walk below
+            results = pool.imap(process_file, tasks, chunksize=max(1, min(64, len(tasks) // (workers * 4))))
+        else:
+            results = map(process_file, tasks)
+
+        for shard in dirty:
+            previous = read_shard(old, shard) if old else {}
+            written, size = [], 0
+            changed = old is None or any(shard_of(rel, num_shards) == shard for rel in deleted)
+            tmp = shard_path(shard).with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as out:
+                for rel in by_shard.get(shard, []):
+                    mtime_ns, fsize = current[rel]
+                    if rel in stale:
+                        _, sha1, status, payload, fp = next(results)
+                        if status == "unchanged":
+                            files[rel] = dict(old_files[rel], mtime_ns=mtime_ns, size=fsize)
+                        else:
+                            changed = True
+                            files[rel] = {"mtime_ns": mtime_ns, "size": fsize, "sha1": sha1, "status": status}
+                            if status == "error":
+                                files[rel]["error"] = payload
+                            elif status == "ok":
+                                previous[rel] = payload
+                                files[rel].update(fp)
+                    if files[rel]["status"] == "ok":
+                        line = previous[rel] + "\n"
+                        out.write(line)
+                        written.append(rel)
+                        size += len(line.encode("utf-8"))
+            if not changed:
+                # Only timestamps moved; the shard on disk is already identical
+                tmp.unlink()
+                continue
+            os.replace(tmp, shard_path(shard))
+            shards[str(shard)] = {"examples": len(written), "bytes": size, "files": written}
+            rebuilt.append(shard)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Shards from an earlier build with more shards than now
+    for path in SHARDS_DIR.glob("part-*.jsonl"):
+        if int(path.stem.split("-")[1]) >= num_shards:
+            path.unlink()
+
+    # Dedup runs over the whole corpus every build; it only needs the fingerprints in the manifest
+    fingerprints = {rel: info for rel, info in files.items() if info["status"] == "ok"}
+    if os.environ.get("DEDUP", "1") == "1":
+        keep_per_cluster = int(os.environ.get("DEDUP_KEEP", 1))
+        clusters = cluster(fingerprints, float(os.environ.get("DEDUP_THRESHOLD", 0.85)))
+        keep = {rel for members in clusters for rel in members[:keep_per_cluster]}
+        stats = cluster_stats(clusters, fingerprints)
+        with open(CLUSTERS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"stats": stats, "clusters": [c for c in clusters if len(c) > 1]}, f, indent=2)
+    else:
+        keep, stats = set(fingerprints), None
+
     count = 0
-    with OUTPUT_FILE.open("w", encoding="utf-8") as out:
-        for root, _, files in os.walk(WORKFLOWS_DIR):
-            for fname in files:
-                if not fname.lower().endswith(".json"):
-                    continue
-                fpath = Path(root) / fname
-                try:
-                    with open(fpath, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    # Some files may wrap the workflow differently; try keys
-                    wf = data
-                    if isinstance(data, dict) and "nodes" not in data and "workflow" in data:
-                        wf = data["workflow"]
-                    if not isinstance(wf, dict) or "nodes" not in wf:
-                        continue
-                    prompt = infer_prompt_from_workflow(wf)
-                    out.write(json.dumps({"prompt": prompt, "workflow": wf}, ensure_ascii=False) + "\n")
-                    count += 1
-                except Exception:
-                    # Ignore malformed files
-                    continue
-    print(f"Wrote {count} examples to {OUTPUT_FILE}")
+    tmp = OUTPUT_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as out:
+        for shard in range(num_shards):
+            entry = shards.get(str(shard))
+            if not entry:
+                continue
+            with open(shard_path(shard), "r", encoding="utf-8") as f:
+                for rel, line in zip(entry["files"], f):
+                    if rel in keep:
+                        out.write(line)
+                        count += 1
+    os.replace(tmp, OUTPUT_FILE)
+
+    save_manifest({
+        "version": MANIFEST_VERSION,
+        "source": WORKFLOWS_DIR.as_posix(),
+        "num_shards": num_shards,
+        "built_at": int(time.time()),
+        "files": files,
+        "shards": shards,
+    })
+
+    errors = sorted((rel, info["error"]) for rel, info in files.items() if info["status"] == "error")
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} examples to {OUTPUT_FILE} in {elapsed:.2f}s "
+          f"({len(tasks)} of {len(current)} files re-read, {len(rebuilt)} of {num_shards} shards rebuilt, "
+          f"{len(deleted)} removed)")
+    if stats is not None:
+        print(f"Dedup: {stats['workflows']} workflows in {stats['clusters']} clusters, dropped "
+              f"{stats['workflows'] - count} ({stats['exact_duplicates']} exact, {stats['near_duplicates']} near "
+              f"duplicates); details in {CLUSTERS_FILE}")
+    if errors:
+        print(f"{len(errors)} files failed to parse:")
+        for rel, error in errors[:20]:
+            print(f"  {rel}: {error}")
+        if len(errors) > 20:
+            print(f"  ... and {len(errors) - 20} more (see {MANIFEST_FILE})")
+        if strict:
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""
+Near-duplicate detection for the training corpus.
+
+Each workflow is canonicalised into a set of features that describe what it
+does and ignore what identifies one copy: node types, typed connections
+between them and the scalar values of node parameters. Ids, names, canvas
+positions, credentials and sticky notes are left out. Two workflows with the
+same feature set are exact duplicates. MinHash signatures and LSH banding pick
+candidate near-duplicate pairs; a candidate pair is only merged when the exact
+Jaccard similarity of the two feature sets reaches the threshold, since the
+MinHash estimate alone is too noisy at 64 permutations. Merges are clustered
+with union-find, so the cost stays roughly linear in the number of workflows.
+"""
+
+import base64
+import hashlib
+import random
+import struct
+import zlib
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS  # 8 rows per band: pairs above ~0.77 Jaccard become candidates
+
+# Permutations are multiply-add-shift hashes h(x) = ((a * x + b) mod 2**64) >> 32 with a fixed seed,
+# so signatures are stable across runs and worker processes
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(20240601)
+_PERMS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_PERM)]
+
+STICKY_NOTE = "n8n-nodes-base.stickyNote"
+
+# Parameter keys that label or cache rather than configure
+_VOLATILE_PARAMS = frozenset({"cachedResultName", "cachedResultUrl", "notes", "options"})
+
+# Long free-text values only contribute their prefix
+_MAX_VALUE_CHARS = 64
+
+
+def _param_features(path: str, value, out: list):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key not in _VOLATILE_PARAMS:
+                _param_features(f"{path}.{key}", item, out)
+    elif isinstance(value, list):
+        for item in value:
+            _param_features(path + "[]", item, out)
+    else:
+        out.append(f"P:{path}={str(value).strip().lower()[:_MAX_VALUE_CHARS]}")
+
+
+def canonical_features(wf: dict) -> list:
+    """Feature set of a workflow; repeated features are numbered so multiplicity counts."""
+    nodes = [n for n in wf.get("nodes", []) if isinstance(n, dict) and n.get("type") != STICKY_NOTE]
+    types = {n.get("name"): str(n.get("type", "")) for n in nodes}
+    features = []
+    for node in nodes:
+        ntype = types[node.get("name")]
+        features.append("T:" + ntype)
+        _param_features(ntype, node.get("parameters"), features)
+
+    connections = wf.get("connections") if isinstance(wf.get("connections"), dict) else {}
+    for source, outputs in connections.items():
+        if source not in types or not isinstance(outputs, dict):
+            continue
+        for kind, branches in outputs.items():
+            for index, branch in enumerate(branches or []):
+                for edge in branch or []:
+                    if isinstance(edge, dict):
+                        features.append(f"E:{types[source]}>{kind}{index}>{types.get(edge.get('node'))}")
+
+    counts, numbered = {}, []
+    for feature in features:
+        n = counts[feature] = counts.get(feature, 0) + 1
+        numbered.append(feature if n == 1 else f"{feature}#{n}")
+    return numbered
+
+
+def _pack(values) -> str:
+    return base64.b64encode(struct.pack(f">{len(values)}I", *values)).decode("ascii")
+
+
+def fingerprint(wf: dict) -> dict:
+    """Dedup fingerprint of a workflow.
+
+    "canon" is the exact-duplicate key, "minhash" the packed MinHash signature
+    and "features" the packed, sorted CRC32 hashes of its features, for the
+    exact Jaccard check of LSH candidates.
+    """
+    features = canonical_features(wf)
+    canon = hashlib.sha1("\n".join(sorted(features)).encode("utf-8")).hexdigest()
+    hashes = sorted({zlib.crc32(f.encode("utf-8")) for f in features}) or [0]
+    # The high half of the 64-bit minimum is the 32-bit signature value
+    signature = [min([(a * x + b) & _MASK64 for x in hashes]) >> 32 for a, b in _PERMS]
+    return {"canon": canon, "minhash": _pack(signature), "features": _pack(hashes)}
+
+
+def unpack(packed: str) -> tuple:
+    raw = base64.b64decode(packed)
+    return struct.unpack(f">{len(raw) // 4}I", raw)
+
+
+def similarity(sig_a: tuple, sig_b: tuple) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """Exact Jaccard similarity of two feature-hash sets."""
+    if not a and not b:
+        return 1.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # The smaller index stays root, so a cluster is represented by its first member
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def cluster(fingerprints: dict, threshold: float = 0.85) -> list:
+    """Group keys of {key: fingerprint} into clusters of duplicates.
+
+    Exact duplicates (same canonical hash) always merge; other pairs merge when
+    they share an LSH band and the exact Jaccard similarity of their features
+    reaches threshold.
+    Returns lists of keys, largest cluster first, members in key order.
+    """
+    keys = sorted(fingerprints)
+    uf = _UnionFind(len(keys))
+    by_canon = {}
+    for i, key in enumerate(keys):
+        first = by_canon.setdefault(fingerprints[key]["canon"], i)
+        if first != i:
+            uf.union(first, i)
+
+    if threshold > 0:
+        # One representative per exact-duplicate group is enough for the LSH pass
+        reps = sorted(by_canon.values())
+        sigs = {i: unpack(fingerprints[keys[i]]["minhash"]) for i in reps}
+        features = {}
+        checked = set()
+        for band in range(BANDS):
+            buckets = {}
+            for i in reps:
+                buckets.setdefault(sigs[i][band * ROWS:(band + 1) * ROWS], []).append(i)
+            for members in buckets.values():
+                for n, j in enumerate(members):
+                    for i in members[:n]:
+                        if (i, j) in checked or uf.find(i) == uf.find(j):
+                            continue
+                        checked.add((i, j))
+                        for k in (i, j):
+                            if k not in features:
+                                features[k] = frozenset(unpack(fingerprints[keys[k]]["features"]))
+                        if jaccard(features[i], features[j]) >= threshold:
+                            uf.union(i, j)
+
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(uf.find(i), []).append(key)
+    return sorted(groups.values(), key=lambda g: (-len(g), g[0]))
+
+
+def cluster_stats(clusters: list, fingerprints: dict) -> dict:
+    total = sum(len(c) for c in clusters)
+    duplicated = [c for c in clusters if len(c) > 1]
+    exact = sum(len(c) - len({fingerprints[k]["canon"] for k in c}) for c in duplicated)
+    sizes = {}
+    for c in duplicated:
+        bucket = "2" if len(c) == 2 else "3-5" if len(c) <= 5 else "6-20" if len(c) <= 20 else "21+"
+        sizes[bucket] = sizes.get(bucket, 0) + 1
+    return {
+        "workflows": total,
+        "clusters": len(clusters),
+        "duplicate_clusters": len(duplicated),
+        "redundant": total - len(clusters),
+        "exact_duplicates": exact,
+        "near_duplicates": total - len(clusters) - exact,
+        "cluster_sizes": sizes,
+        "largest": [{"size": len(c), "members": c[:5]} for c in duplicated[:10]],
+    }
@@ -1,13 +1,32 @@
+import bisect
 import json
 import os
+import sys
+import time
 from pathlib import Path
 from dataclasses import dataclass
 
+# workflow_format lives at the repo root
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from workflow_format import COMPACT_FORMAT, FORMAT_FILE, compact_workflow, round_trips
+from workflow_layout import strip_positions
+
 """
 Minimal QLoRA training scaffold using Hugging Face Transformers + PEFT.
 This prepares instruction-tuning data from data/dataset.jsonl and trains a
 small adapter on a chosen base model (e.g., mistralai/Mistral-7B-Instruct-v0.3).
 
+Examples are packed several to a row up to MAX_SEQ_LEN (PACKING=0 disables),
+with attention confined to each example, and rows of similar length are
+batched together. Throughput (real tokens/sec) and the share of padding are
+added to the training logs.
+
+Targets use the compact workflow format from workflow_format.py by default
+(WORKFLOW_FORMAT=n8n trains on full n8n JSON); the format is recorded in the
+adapter directory so the inference servers expand the model's output.
+Node positions are left out of the targets; the servers lay workflows out
+from their connections (workflow_layout.py).
+
 Note: This is a scaffold; adjust batch sizes/learning rate/epochs based on your GPU.
 """
 
@@ -22,10 +41,15 @@ class TrainConfig:
     learning_rate: float = float(os.environ.get("LEARNING_RATE", 2e-4))
     num_epochs: int = int(os.environ.get("NUM_EPOCHS", 1))
     max_seq_len: int = int(os.environ.get("MAX_SEQ_LEN", 2048))
+    packing: bool = os.environ.get("PACKING", "1") == "1"
+    # "flash_attention_2" packs a whole batch into one row; "sdpa"/"eager" use a block-diagonal mask
+    attn_implementation: str = os.environ.get("ATTN_IMPLEMENTATION", "")
+    workflow_format: str = os.environ.get("WORKFLOW_FORMAT", COMPACT_FORMAT)
 
 
-def load_examples(path: str):
+def load_examples(path: str, workflow_format: str = COMPACT_FORMAT):
     examples = []
+    skipped = 0
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             obj = json.loads(line)
@@ -33,26 +57,121 @@ def load_examples(path: str):
             wf = obj.get("workflow", {})
             if not prompt or not isinstance(wf, dict):
                 continue
+            if workflow_format == COMPACT_FORMAT and not round_trips(wf):
+                # Duplicate node names or dangling connections: the expanded target would be a different workflow
+                skipped += 1
+                continue
             # SFT style: ask model to return only valid JSON
             system = (
                 "You are an expert n8n workflow designer. Convert the user's prompt to a valid n8n JSON workflow. "
                 "Return ONLY JSON."
             )
             user = prompt
-            assistant = json.dumps(wf, ensure_ascii=False)
+            if workflow_format == COMPACT_FORMAT:
+                assistant = json.dumps(compact_workflow(wf, positions=False), ensure_ascii=False, separators=(",", ":"))
+            else:
+                assistant = json.dumps(strip_positions(wf), ensure_ascii=False)
             examples.append({"system": system, "user": user, "assistant": assistant})
+    if skipped:
+        print(f"Skipped {skipped} workflows that don't survive the compact format round trip")
     return examples
 
 
+def pack_examples(lengths, max_len: int):
+    """Best-fit-decreasing bin packing: lists of example indices whose lengths sum to <= max_len."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    bins = []
+    free = []  # Sorted (remaining capacity, bin index)
+    for i in order:
+        pos = bisect.bisect_left(free, (lengths[i], -1))
+        if pos == len(free):
+            bins.append([i])
+            bisect.insort(free, (max_len - lengths[i], len(bins) - 1))
+        else:
+            remaining, b = free.pop(pos)
+            bins[b].append(i)
+            bisect.insort(free, (remaining - lengths[i], b))
+    return bins
+
+
+class PackedCollator:
+    """Batch rows of one or more concatenated examples.
+
+    Position ids restart at every example and the first token of each example
+    is not a prediction target, so nothing leaks across example boundaries.
+    With flatten=True (flash-attention 2) the whole batch becomes a single
+    unpadded row and the kernel splits sequences on the position id resets;
+    otherwise rows are padded to the longest one and packed rows get a 4D
+    block-diagonal causal mask in the model's dtype.
+
+    Counts real and padded tokens so callers can report throughput and waste.
+    """
+
+    def __init__(self, pad_token_id: int, dtype=None, flatten: bool = False, pad_to_multiple_of: int = 8):
+        self.pad_token_id = pad_token_id
+        self.dtype = dtype
+        self.flatten = flatten
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        import torch
+
+        if self.flatten:
+            features = [{
+                "input_ids": [t for f in features for t in f["input_ids"]],
+                "seq_lens": [n for f in features for n in f["seq_lens"]],
+            }]
+            width = len(features[0]["input_ids"])
+        else:
+            width = max(len(f["input_ids"]) for f in features)
+            width = -(-width // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        rows = len(features)
+        block_mask = not self.flatten and any(len(f["seq_lens"]) > 1 for f in features)
+
+        input_ids = torch.full((rows, width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((rows, width), -100, dtype=torch.long)
+        position_ids = torch.zeros((rows, width), dtype=torch.long)
+        if block_mask:
+            min_value = torch.finfo(self.dtype).min
+            attention_mask = torch.full((rows, 1, width, width), min_value, dtype=self.dtype)
+        else:
+            attention_mask = torch.zeros((rows, width), dtype=torch.long)
+
+        for row, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[row, :n] = torch.tensor(f["input_ids"], dtype=torch.long)
+            labels[row, :n] = input_ids[row, :n]
+            start = 0
+            for length in f["seq_lens"]:
+                end = start + length
+                position_ids[row, start:end] = torch.arange(length)
+                labels[row, start] = -100
+                if block_mask:
+                    attention_mask[row, 0, start:end, start:end] = torch.triu(
+                        torch.full((length, length), min_value, dtype=self.dtype), diagonal=1)
+                start = end
+            if not block_mask:
+                attention_mask[row, :n] = 1
+            self.real_tokens += n
+        self.padded_tokens += rows * width
+
+        batch = {"input_ids": input_ids, "labels": labels, "position_ids": position_ids}
+        if not self.flatten:
+            batch["attention_mask"] = attention_mask
+        return batch
+
+
 def main():
     cfg = TrainConfig()
     print("Loading dataset...", cfg.dataset_path)
-    examples = load_examples(cfg.dataset_path)
-    print(f"Loaded {len(examples)} examples")
+    examples = load_examples(cfg.dataset_path, cfg.workflow_format)
+    print(f"Loaded {len(examples)} examples ({cfg.workflow_format} targets)")
 
     # Lazy imports to keep app deps light
     from datasets import Dataset
-    from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, DataCollatorForLanguageModeling, Trainer
+    from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer, TrainerCallback
     import torch
     from peft import LoraConfig, get_peft_model, TaskType
 
@@ -67,12 +186,41 @@ def main():
         tokenizer.pad_token = tokenizer.eos_token
 
     def tokenize(batch):
-        return tokenizer(batch["text"], truncation=True, max_length=cfg.max_seq_len)
+        return tokenizer(batch["text"])
 
     tokenized = ds.map(tokenize, batched=True, remove_columns=["text"])  # type: ignore
+    token_ids = [ids for ids in tokenized["input_ids"] if len(ids) <= cfg.max_seq_len]
+    # A truncated workflow teaches the model to emit broken JSON, so overlong examples are left out
+    dropped = len(tokenized) - len(token_ids)
+    if dropped:
+        print(f"Skipping {dropped} examples longer than MAX_SEQ_LEN={cfg.max_seq_len}")
+
+    if cfg.packing:
+        groups = pack_examples([len(ids) for ids in token_ids], cfg.max_seq_len)
+    else:
+        groups = [[i] for i in range(len(token_ids))]
+    rows = [{
+        "input_ids": [t for i in group for t in token_ids[i]],
+        "seq_lens": [len(token_ids[i]) for i in group],
+    } for group in groups]
+    for row in rows:
+        row["length"] = len(row["input_ids"])
+    train_ds = Dataset.from_list(rows)
+    real = sum(row["length"] for row in rows)
+    print(f"{len(token_ids)} examples in {len(rows)} rows "
+          f"({real / max(1, len(rows) * cfg.max_seq_len):.0%} of MAX_SEQ_LEN filled on average)")
+
+    attn_implementation = cfg.attn_implementation
+    if not attn_implementation:
+        try:
+            import flash_attn  # noqa: F401
+            attn_implementation = "flash_attention_2" if torch.cuda.is_available() else "sdpa"
+        except ImportError:
+            attn_implementation = "sdpa"
 
     print("Loading base model:", cfg.base_model)
-    model = AutoModelForCausalLM.from_pretrained(cfg.base_model, torch_dtype=torch.float16, device_map="auto")
+    model = AutoModelForCausalLM.from_pretrained(cfg.base_model, torch_dtype=torch.float16, device_map="auto",
+                                                 attn_implementation=attn_implementation)
 
     lora_cfg = LoraConfig(
         r=8,
@@ -95,15 +243,34 @@ def main():
         bf16=torch.cuda.is_available(),
         fp16=not torch.cuda.is_available(),
         report_to=[],
+        # Batch rows of similar length together so little of each batch is padding
+        group_by_length=True,
+        length_column_name="length",
+        # seq_lens has to reach the collator
+        remove_unused_columns=False,
     )
 
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    data_collator = PackedCollator(tokenizer.pad_token_id, dtype=model.dtype,
+                                   flatten=attn_implementation == "flash_attention_2")
+
+    class ThroughputCallback(TrainerCallback):
+        """Adds real tokens/sec and the padding ratio to every training log line."""
+
+        def on_train_begin(self, args, state, control, **kwargs):
+            self.start = time.time()
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            if logs is None or not data_collator.padded_tokens:
+                return
+            logs["tokens_per_sec"] = round(data_collator.real_tokens / (time.time() - self.start), 1)
+            logs["padding_ratio"] = round(1 - data_collator.real_tokens / data_collator.padded_tokens, 4)
 
     trainer = Trainer(
         model=model,
         args=args,
-        train_dataset=tokenized,
+        train_dataset=train_ds,
         data_collator=data_collator,
+        callbacks=[ThroughputCallback()],
     )
 
     print("Starting training...")
@@ -111,6 +278,8 @@ def main():
     print("Saving adapter to:", cfg.output_dir)
     model.save_pretrained(cfg.output_dir)
     tokenizer.save_pretrained(cfg.output_dir)
+    with open(Path(cfg.output_dir) / FORMAT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"workflow_format": cfg.workflow_format}, f)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,18 @@
 """Ultra-minimal test LLM server for validation."""
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import json
 import re
 
+from node_catalog import load_catalog
+from workflow_layout import layout_workflow
+from workflow_validator import WorkflowValidator
+
 app = Flask(__name__)
 
+NODE_CATALOG = load_catalog()
+WORKFLOW_VALIDATOR = WorkflowValidator(NODE_CATALOG)
+
 # Node templates for various integrations
 NODE_TEMPLATES = {
     "webhook": {"name": "Webhook Trigger", "type": "n8n-nodes-base.webhook"},
@@ -27,92 +34,52 @@ NODE_TEMPLATES = {
     "function": {"name": "Function", "type": "n8n-nodes-base.function"},
 }
 
+# Trigger rules in priority order: the first rule mentioned in the prompt picks the trigger
+TRIGGER_KEYWORDS = [
+    ("webhook", ["webhook", "receive", "incoming", "api call"]),
+    ("schedule", ["schedule", "every", "daily", "hourly", "cron", "at 9am", "time", "periodic"]),
+    ("webhook", ["form", "submission", "submit"]),  # Form trigger
+]
+DEFAULT_TRIGGER = "webhook"
+
+# Action rules: every rule mentioned in the prompt adds its node, in this order
+ACTION_KEYWORDS = [
+    ("slack", ["slack", "slack channel", "slack message", "post to slack"]),
+    ("email", ["email", "send email", "email notification", "email to", "send an email"]),
+    ("gmail", ["gmail", "gmail message", "gmail send"]),
+    ("discord", ["discord", "discord message", "discord notify", "post to discord"]),
+    ("sheets", ["sheets", "google sheets", "spreadsheet", "sheets log", "log the"]),
+    ("airtable", ["airtable", "airtable base", "airtable record"]),
+    ("notion", ["notion", "notion page", "notion database", "log to notion"]),
+    ("trello", ["trello", "trello card", "create card"]),
+    ("asana", ["asana", "asana task", "create task", "create an asana"]),
+    ("zendesk", ["zendesk", "zendesk ticket", "support ticket", "create ticket"]),
+    ("stripe", ["stripe", "stripe payment", "payment", "billing"]),
+    ("mongodb", ["mongodb", "database", "mongo", "store in database", "save to db"]),
+    ("http", ["hubspot", "hubspot lead", "crm"]),  # Map to HTTP as placeholder
+    ("http", ["salesforce", "salesforce record", "create in salesforce"]),
+    ("http", ["mailchimp", "mailchimp list", "add to mailchimp"]),
+    ("http", ["twitter", "tweet", "post to twitter", "share on twitter", "post it on twitter", "post on twitter", "twitter and"]),  # HTTP call to Twitter API
+    ("slack", ["linkedin", "linkedin post", "share on linkedin", "post on linkedin", "post it on linkedin", "post to linkedin", "and linkedin"]),  # Post to LinkedIn via Slack (or email notification)
+    ("discord", ["teams", "microsoft teams", "post to teams"]),  # Similar notification service
+    ("http", ["wordpress", "blog post", "blog", "publish"]),  # HTTP webhook for WordPress
+    ("function", ["shorten", "url shortener", "short url", "shorten the url"]),  # Custom function for URL shortening
+    ("http", ["quickbooks", "invoice", "accounting"]),
+    ("http", ["api", "http request", "call api", "post request", "fetch data", "request data"]),
+    ("function", ["validate", "parse", "transform", "convert", "process", "analyze", "custom logic"]),
+]
+
 def keyword_to_nodes(prompt: str) -> list:
     """Map prompt keywords to node types - be aggressive to find many matches."""
     prompt_lower = prompt.lower()
-    matched_nodes = []
     
     # Trigger detection (pick ONE)
-    if any(w in prompt_lower for w in ["webhook", "receive", "incoming", "api call"]):
-        matched_nodes.append("webhook")
-    elif any(w in prompt_lower for w in ["schedule", "every", "daily", "hourly", "cron", "at 9am", "time", "periodic"]):
-        matched_nodes.append("schedule")
-    elif any(w in prompt_lower for w in ["form", "submission", "submit"]):
-        matched_nodes.append("webhook")  # Form trigger
-    else:
-        matched_nodes.append("webhook")  # Default trigger
+    trigger = next((node for node, words in TRIGGER_KEYWORDS if any(w in prompt_lower for w in words)),
+                   DEFAULT_TRIGGER)
+    matched_nodes = [trigger]
     
     # Aggressive action detection - match ALL mentioned services
-    # Check for each service independently and add ALL matches
-    
-    if any(w in prompt_lower for w in ["slack", "slack channel", "slack message", "post to slack"]):
-        matched_nodes.append("slack")
-    
-    if any(w in prompt_lower for w in ["email", "send email", "email notification", "email to", "send an email"]):
-        matched_nodes.append("email")
-    
-    if any(w in prompt_lower for w in ["gmail", "gmail message", "gmail send"]):
-        matched_nodes.append("gmail")
-    
-    if any(w in prompt_lower for w in ["discord", "discord message", "discord notify", "post to discord"]):
-        matched_nodes.append("discord")
-    
-    if any(w in prompt_lower for w in ["sheets", "google sheets", "spreadsheet", "sheets log", "log the"]):
-        matched_nodes.append("sheets")
-    
-    if any(w in prompt_lower for w in ["airtable", "airtable base", "airtable record"]):
-        matched_nodes.append("airtable")
-    
-    if any(w in prompt_lower for w in ["notion", "notion page", "notion database", "log to notion"]):
-        matched_nodes.append("notion")
-    
-    if any(w in prompt_lower for w in ["trello", "trello card", "create card"]):
-        matched_nodes.append("trello")
-    
-    if any(w in prompt_lower for w in ["asana", "asana task", "create task", "create an asana"]):
-        matched_nodes.append("asana")
-    
-    if any(w in prompt_lower for w in ["zendesk", "zendesk ticket", "support ticket", "create ticket"]):
-        matched_nodes.append("zendesk")
-    
-    if any(w in prompt_lower for w in ["stripe", "stripe payment", "payment", "billing"]):
-        matched_nodes.append("stripe")
-    
-    if any(w in prompt_lower for w in ["mongodb", "database", "mongo", "store in database", "save to db"]):
-        matched_nodes.append("mongodb")
-    
-    if any(w in prompt_lower for w in ["hubspot", "hubspot lead", "crm"]):
-        matched_nodes.append("http")  # Map to HTTP as placeholder
-    
-    if any(w in prompt_lower for w in ["salesforce", "salesforce record", "create in salesforce"]):
-        matched_nodes.append("http")
-    
-    if any(w in prompt_lower for w in ["mailchimp", "mailchimp list", "add to mailchimp"]):
-        matched_nodes.append("http")
-    
-    if any(w in prompt_lower for w in ["twitter", "tweet", "post to twitter", "share on twitter", "post it on twitter", "post on twitter", "twitter and"]):
-        matched_nodes.append("http")  # HTTP call to Twitter API
-    
-    if any(w in prompt_lower for w in ["linkedin", "linkedin post", "share on linkedin", "post on linkedin", "post it on linkedin", "post to linkedin", "and linkedin"]):
-        matched_nodes.append("slack")  # Post to LinkedIn via Slack (or email notification)
-    
-    if any(w in prompt_lower for w in ["teams", "microsoft teams", "post to teams"]):
-        matched_nodes.append("discord")  # Similar notification service
-    
-    if any(w in prompt_lower for w in ["wordpress", "blog post", "blog", "publish"]):
-        matched_nodes.append("http")  # HTTP webhook for WordPress
-    
-    if any(w in prompt_lower for w in ["shorten", "url shortener", "short url", "shorten the url"]):
-        matched_nodes.append("function")  # Custom function for URL shortening
-    
-    if any(w in prompt_lower for w in ["quickbooks", "invoice", "accounting"]):
-        matched_nodes.append("http")
-    
-    if any(w in prompt_lower for w in ["api", "http request", "call api", "post request", "fetch data", "request data"]):
-        matched_nodes.append("http")
-    
-    if any(w in prompt_lower for w in ["validate", "parse", "transform", "convert", "process", "analyze", "custom logic"]):
-        matched_nodes.append("function")
+    matched_nodes += [node for node, words in ACTION_KEYWORDS if any(w in prompt_lower for w in words)]
     
     # Remove duplicates while preserving order
     seen = set()
@@ -145,8 +112,6 @@ def build_workflow(prompt: str, node_types: list) -> dict:
         "connections": {}
     }
     
-    x_pos = 250
-    y_pos = 300
     prev_node = None
     
     for node_type in node_types:
@@ -158,9 +123,8 @@ def build_workflow(prompt: str, node_types: list) -> dict:
             "name": template["name"],
             "type": template["type"],
             "typeVersion": 1,
-            "position": [x_pos, y_pos],
             "parameters": {},
-            "disabled": node_type not in ["webhook", "schedule", "set", "function"],
+            "disabled": NODE_CATALOG.needs_credentials(template["type"]),
             "credentials": []
         }
         
@@ -189,9 +153,10 @@ def build_workflow(prompt: str, node_types: list) -> dict:
             })
         
         prev_node = node
-        x_pos += 200  # Shift right for next node
     
-    return workflow
+    # Same structural repairs as generated workflows (turns the flat "main" lists into per-output lists)
+    WORKFLOW_VALIDATOR.check(workflow)
+    return layout_workflow(workflow)
 
 @app.route("/health", methods=["GET"])
 def health():
@@ -210,6 +175,19 @@ def generate():
     
     return jsonify({"workflow": workflow, "method": "local"})
 
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    """Same as /generate as server-sent events: one "node" event per node, then "done"."""
+    prompt = (request.get_json(silent=True) or {}).get("prompt", "")
+    workflow = build_workflow(prompt, keyword_to_nodes(prompt))
+
+    def events():
+        for node in workflow["nodes"]:
+            yield f"event: node\ndata: {json.dumps(node)}\n\n"
+        yield f"event: done\ndata: {json.dumps({'workflow': workflow, 'method': 'local'})}\n\n"
+
+    return Response(events(), mimetype="text/event-stream")
+
 if __name__ == "__main__":
     print("\n" + "="*70)
     print("[STARTING] LLM Server (Lightweight Mode)")
@@ -219,6 +197,6 @@ if __name__ == "__main__":
     print("[✓] Ready!")
     print("")
     print("Server listening on http://127.0.0.1:8000")
-    print("Endpoints: /health, /generate")
+    print("Endpoints: /health, /generate, /generate/stream")
     print("="*70 + "\n")
     app.run(host="127.0.0.1", port=8000, debug=False)
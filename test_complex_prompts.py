@@ -7,9 +7,14 @@ import requests
 import json
 import sys
 
+from node_catalog import load_catalog
+from workflow_validator import WorkflowValidator, describe
+
 # Frontend API endpoint
 FRONTEND_URL = "http://127.0.0.1:5000/api/generate"
 
+VALIDATOR = WorkflowValidator(load_catalog())
+
 # Complex test prompts covering various scenarios with 7-10+ distinct apps/integrations
 TEST_PROMPTS = [
     # 1. Multi-channel customer notification
@@ -72,18 +77,13 @@ def validate_workflow(workflow: dict, prompt: str) -> tuple[bool, list]:
         errors.append(f"Only {len(nodes)} nodes (expected at least 2)")
     
     for i, node in enumerate(nodes):
-        if not isinstance(node, dict):
-            errors.append(f"Node {i} is not a dictionary")
-            continue
-        if "name" not in node or "type" not in node:
-            errors.append(f"Node {i} missing 'name' or 'type'")
-        if "position" not in node:
+        if isinstance(node, dict) and "position" not in node:
             errors.append(f"Node {i} missing 'position'")
     
-    # Validate connections
-    connections = workflow.get("connections", {})
-    if not isinstance(connections, dict):
-        errors.append("'connections' is not a dictionary")
+    # Structure: node names/types/versions, connections, trigger (shared with the servers, no repairs here)
+    for issue in VALIDATOR.check(workflow, repair=False):
+        if issue["severity"] == "error":
+            errors.append(describe([issue]))
     
     return len(errors) == 0, errors
 
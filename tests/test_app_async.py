@@ -0,0 +1,118 @@
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from backend_pool import BackendPool
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("starlette", "httpx", "dotenv"))
+
+URLS = ["http://a:8000/generate", "http://b:8000/generate", "http://c:8000/generate"]
+
+WORKFLOW = {"nodes": [{"name": "Hook", "type": "n8n-nodes-base.webhook", "typeVersion": 1, "parameters": {}}],
+            "connections": {}}
+
+
+@unittest.skipUnless(HAS_DEPS, "needs starlette, httpx and python-dotenv")
+class ImportTest(unittest.TestCase):
+    def test_import_needs_no_flask_and_starts_no_prober(self):
+        code = "import sys, app_async; print('flask' in sys.modules, app_async.BACKEND_POOL._prober is None)"
+        env = dict(os.environ, LOCAL_INFER_URLS=",".join(URLS))
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                             check=True)
+        self.assertEqual(out.stdout.split(), ["False", "True"])
+
+
+@unittest.skipUnless(HAS_DEPS, "needs starlette, httpx and python-dotenv")
+class AsyncGatewayTest(unittest.TestCase):
+    def setUp(self):
+        cwd = os.getcwd()
+        os.chdir(ROOT)
+        self.addCleanup(os.chdir, cwd)
+        import app_async
+
+        self.app_async = app_async
+
+    def generate(self, answers):
+        """Run app_async.generate_with_local_llm against stub backends; answers are used in call order."""
+        import httpx
+
+        calls = []
+
+        def handler(request):
+            calls.append(str(request.url))
+            answer = answers[len(calls) - 1]
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        async def run():
+            self.app_async.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                return await self.app_async.generate_with_local_llm("send a slack message")
+            finally:
+                await self.app_async.client.aclose()
+
+        pool = BackendPool(URLS)
+        with mock.patch.object(self.app_async, "BACKEND_POOL", pool):
+            result = asyncio.run(run())
+        self.assertTrue(all(b.outstanding == 0 for b in pool.backends))
+        return result, calls
+
+    def test_read_timeout_is_not_retried(self):
+        import httpx
+
+        (workflow, error), calls = self.generate([httpx.ReadTimeout("read timed out")])
+        self.assertIsNone(workflow)
+        self.assertIn("timed out", error)
+        self.assertEqual(len(calls), 1)
+
+    def test_connection_errors_and_unavailable_backends_are_retried(self):
+        import httpx
+
+        answers = [httpx.ConnectError("refused"), httpx.Response(503, text="loading"),
+                   httpx.Response(200, json={"workflow": WORKFLOW})]
+        (result, error), calls = self.generate(answers)
+        self.assertIsNone(error)
+        self.assertEqual(result["nodes"][0]["name"], "Hook")
+        self.assertEqual(len(set(calls)), 3)
+
+    def test_pipeline_steps_run_off_the_event_loop(self):
+        from starlette.requests import Request
+
+        threads = []
+
+        def lookup(prompt):
+            threads.append(threading.current_thread())
+            return dict(WORKFLOW, nodes=list(WORKFLOW["nodes"])), "cache", None
+
+        def build(*args):
+            threads.append(threading.current_thread())
+            return {"success": True}
+
+        body = json.dumps({"prompt": "send a slack message when a webhook is called"}).encode()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request({"type": "http", "method": "POST", "headers": [], "path": "/api/generate"}, receive)
+        with mock.patch.object(self.app_async, "lookup_without_llm", lookup), \
+                mock.patch.object(self.app_async, "build_response", build):
+            resp = asyncio.run(self.app_async.generate_workflow(request))
+        self.assertEqual(json.loads(resp.body), {"success": True})
+        # asyncio.run drives the event loop on this thread
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
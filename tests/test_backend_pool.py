@@ -0,0 +1,219 @@
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+import requests
+
+import backend_pool
+from backend_pool import BackendPool
+
+HAS_FLASK = all(importlib.util.find_spec(name) for name in ("flask", "flask_cors", "dotenv"))
+
+URLS = ["http://a:8000/generate", "http://b:8000/generate", "http://c:8000/generate"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, text=""):
+        self.status_code = status_code
+        self.body = body if body is not None else {}
+        self.text = text
+
+    def json(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+class BackendPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(backend_pool, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = BackendPool(URLS, max_failures=2, eject_seconds=30, slow_factor=3)
+        self.a, self.b, self.c = self.pool.backends
+
+    def probe(self, answers):
+        """Run one probe where answers maps URL -> FakeResponse or exception; returns the URLs hit."""
+        hit = []
+
+        def get(url, timeout):
+            hit.append(url)
+            answer = answers.get(url, FakeResponse())
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        with mock.patch.object(backend_pool.requests, "get", side_effect=get):
+            self.pool.probe()
+        return hit
+
+    def test_needs_a_backend(self):
+        with self.assertRaises(ValueError):
+            BackendPool([])
+
+    def test_acquire_picks_the_least_outstanding(self):
+        first, second, third = (self.pool.acquire() for _ in range(3))
+        self.assertEqual({first, second, third}, {self.a, self.b, self.c})
+        self.pool.release(second, ok=True, latency=1.0)
+        self.assertIs(self.pool.acquire(), second)
+        self.assertEqual([b.outstanding for b in (first, second, third)], [1, 1, 1])
+
+    def test_ties_go_to_the_faster_backend(self):
+        for backend, latency in ((self.a, 2.0), (self.b, 1.0), (self.c, 1.5)):
+            self.pool.acquire(exclude=[b for b in self.pool.backends if b is not backend])
+            self.pool.release(backend, ok=True, latency=latency)
+        self.assertIs(self.pool.acquire(), self.b)
+
+    def test_exclude(self):
+        self.assertIs(self.pool.acquire(exclude=[self.a, self.b]), self.c)
+        self.assertIsNone(self.pool.acquire(exclude=self.pool.backends))
+
+    def test_release_tracks_requests_and_failures(self):
+        backend = self.pool.acquire()
+        self.pool.release(backend, ok=False)
+        self.assertEqual((backend.outstanding, backend.requests, backend.failures), (0, 1, 1))
+        snap = self.pool.snapshot()[self.pool.backends.index(backend)]
+        self.assertEqual((snap["failures"], snap["ejected"]), (1, False))
+
+    def test_ejection_after_consecutive_failures(self):
+        for _ in range(2):
+            self.pool.acquire(exclude=[self.b, self.c])
+            self.pool.release(self.a, ok=False)
+        self.assertFalse(self.a.available(self.clock.time()))
+        self.assertNotIn(self.a, {self.pool.acquire() for _ in range(4)})
+        # A success in between resets the count
+        self.pool.acquire(exclude=[self.a, self.c])
+        self.pool.release(self.b, ok=False)
+        self.pool.acquire(exclude=[self.a, self.c])
+        self.pool.release(self.b, ok=True, latency=0.5)
+        self.pool.acquire(exclude=[self.a, self.c])
+        self.pool.release(self.b, ok=False)
+        self.assertTrue(self.b.available(self.clock.time()))
+
+    def test_everything_ejected_still_serves(self):
+        for backend in self.pool.backends:
+            self.pool._eject(backend)
+        self.assertIsNotNone(self.pool.acquire())
+
+    def test_readmission_needs_the_ejection_to_expire_and_a_good_probe(self):
+        self.a.ewma_latency = 9.0
+        self.pool._eject(self.a)
+        self.probe({})
+        self.assertFalse(self.a.available(self.clock.time()), "readmitted before the ejection expired")
+        self.clock.sleep(31)
+        self.probe({self.a.ready_url: FakeResponse(503, {"ok": False, "stage": "loading_model"})})
+        self.assertFalse(self.a.available(self.clock.time()), "readmitted while not ready")
+        self.probe({})
+        self.assertTrue(self.a.available(self.clock.time()))
+        self.assertEqual((self.a.ejected_until, self.a.consecutive_failures, self.a.ewma_latency), (0.0, 0, None))
+
+    def test_probe_prefers_readyz_and_falls_back_to_health(self):
+        hit = self.probe({self.b.ready_url: FakeResponse(404)})
+        self.assertEqual(hit, ["http://a:8000/readyz", "http://b:8000/readyz", "http://b:8000/health",
+                               "http://c:8000/readyz"])
+        # The 404 is remembered: b is only asked for /health from now on
+        hit = self.probe({self.b.health_url: FakeResponse(200, {"ok": False})})
+        self.assertEqual(hit, ["http://a:8000/readyz", "http://b:8000/health", "http://c:8000/readyz"])
+        self.assertFalse(self.b.healthy)
+        self.assertTrue(self.a.healthy and self.c.healthy)
+
+    def test_probe_failures_mark_unhealthy(self):
+        self.probe({self.a.ready_url: requests.ConnectionError("refused"),
+                    self.b.ready_url: FakeResponse(200, ValueError("not json")),
+                    self.c.ready_url: FakeResponse(500)})
+        self.assertEqual([b.healthy for b in self.pool.backends], [False, False, False])
+        self.probe({})
+        self.assertEqual([b.healthy for b in self.pool.backends], [True, True, True])
+
+    def test_slow_backend_is_ejected_but_never_the_last_one(self):
+        for backend, latency in ((self.a, 1.0), (self.b, 1.2)):
+            self.pool.acquire(exclude=[b for b in self.pool.backends if b is not backend])
+            self.pool.release(backend, ok=True, latency=latency)
+        self.pool.acquire(exclude=[self.a, self.b])
+        self.pool.release(self.c, ok=True, latency=10.0)
+        self.assertFalse(self.c.available(self.clock.time()))
+
+        alone = BackendPool(URLS[:1], slow_factor=3)
+        backend = alone.acquire()
+        alone.release(backend, ok=True, latency=100.0)
+        self.assertTrue(backend.available(self.clock.time()))
+
+    def test_from_env(self):
+        env = {"LOCAL_INFER_URLS": " http://x/generate, ,http://y/generate", "BACKEND_MAX_FAILURES": "5"}
+        with mock.patch.dict("os.environ", env):
+            pool = BackendPool.from_env("http://default/generate")
+        self.assertEqual([b.url for b in pool.backends], ["http://x/generate", "http://y/generate"])
+        self.assertEqual(pool.max_failures, 5)
+        with mock.patch.dict("os.environ", {"LOCAL_INFER_URLS": ""}):
+            self.assertEqual(len(BackendPool.from_env("http://default/generate")), 1)
+
+
+@unittest.skipUnless(HAS_FLASK, "needs flask, flask-cors and python-dotenv")
+class RetryPolicyTest(unittest.TestCase):
+    def generate(self, answers):
+        """Run app.generate_with_local_llm against stub backends; answers are used in call order."""
+        import app
+
+        calls = []
+
+        def post(url, json, timeout):
+            calls.append(url)
+            answer = answers[len(calls) - 1]
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        pool = BackendPool(URLS)
+        with mock.patch.object(app, "BACKEND_POOL", pool), mock.patch.object(app.requests, "post", side_effect=post):
+            result = app.generate_with_local_llm("send a slack message")
+        self.assertTrue(all(b.outstanding == 0 for b in pool.backends))
+        return result, calls, pool
+
+    def test_read_timeout_is_not_retried(self):
+        (workflow, error), calls, pool = self.generate([requests.ReadTimeout("read timed out")])
+        self.assertIsNone(workflow)
+        self.assertIn("timed out", error)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(b.failures for b in pool.backends), 1)
+
+    def test_connection_errors_and_unavailable_backends_are_retried(self):
+        workflow = {"nodes": [{"name": "Hook", "type": "n8n-nodes-base.webhook", "typeVersion": 1, "parameters": {}}],
+                    "connections": {}}
+        answers = [requests.ConnectTimeout("connect timed out"), FakeResponse(503, text="loading"),
+                   FakeResponse(200, {"workflow": workflow})]
+        (result, error), calls, pool = self.generate(answers)
+        self.assertIsNone(error)
+        self.assertEqual(result["nodes"][0]["name"], "Hook")
+        self.assertEqual(len(set(calls)), 3)
+
+    def test_gives_up_after_every_backend(self):
+        (workflow, error), calls, _ = self.generate([requests.ConnectionError("refused")] * 3)
+        self.assertIsNone(workflow)
+        self.assertEqual(len(calls), 3)
+
+    def test_client_errors_are_not_retried(self):
+        (workflow, error), calls, _ = self.generate([FakeResponse(400, text="prompt is required")])
+        self.assertIsNone(workflow)
+        self.assertIn("400", error)
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
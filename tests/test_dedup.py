@@ -0,0 +1,55 @@
+import copy
+import json
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "scripts" / "train"))
+
+from dedup import BANDS, ROWS, canonical_features, cluster, fingerprint, unpack
+
+WORKFLOWS = ROOT / "workflows"
+
+
+def load(name):
+    with open(WORKFLOWS / name, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def exact_jaccard(a, b):
+    fa, fb = set(canonical_features(a)), set(canonical_features(b))
+    return len(fa & fb) / len(fa | fb)
+
+
+def share_band(fp_a, fp_b):
+    a, b = unpack(fp_a["minhash"]), unpack(fp_b["minhash"])
+    return any(a[band * ROWS:(band + 1) * ROWS] == b[band * ROWS:(band + 1) * ROWS] for band in range(BANDS))
+
+
+class ClusterTest(unittest.TestCase):
+    def test_lsh_candidate_below_threshold_stays_apart(self):
+        # Calendly and ConvertKit workflows: MinHash estimates ~0.86, the exact Jaccard is ~0.80
+        a = load("0430_Calendly_Filter_Create_Triggered.json")
+        b = load("0431_Filter_Convertkit_Create_Triggered.json")
+        fps = {"calendly": fingerprint(a), "convertkit": fingerprint(b)}
+        self.assertTrue(share_band(fps["calendly"], fps["convertkit"]))
+        self.assertLess(exact_jaccard(a, b), 0.85)
+        self.assertEqual(cluster(fps, 0.85), [["calendly"], ["convertkit"]])
+
+    def test_near_duplicates_merge(self):
+        a = load("0660_Calendly_Noop_Create_Triggered.json")
+        b = load("0661_Calendly_Noop_Create_Triggered.json")
+        self.assertGreaterEqual(exact_jaccard(a, b), 0.85)
+        self.assertEqual(cluster({"a": fingerprint(a), "b": fingerprint(b)}, 0.85), [["a", "b"]])
+
+    def test_exact_duplicates_merge_without_lsh(self):
+        a = load("0430_Calendly_Filter_Create_Triggered.json")
+        b = copy.deepcopy(a)
+        for node in b["nodes"]:
+            node["position"] = [0, 0]
+        self.assertEqual(cluster({"a": fingerprint(a), "b": fingerprint(b)}, 0), [["a", "b"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
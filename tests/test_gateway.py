@@ -0,0 +1,69 @@
+import importlib.util
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+HAS_DEPS = importlib.util.find_spec("dotenv") is not None
+
+# Prompt -> node type every selected example must use
+RELEVANT = {
+    "Send a Slack message when a Stripe payment succeeds": "n8n-nodes-base.slack",
+    "Add new Typeform responses to Google Sheets": "n8n-nodes-base.googleSheets",
+    "When a new row is added to Airtable send an email": "airtable",
+    "Every morning post the weather forecast to Telegram": "n8n-nodes-base.openWeatherMap",
+}
+
+
+def node_types(example):
+    return {n["type"] for n in example["workflow"]["nodes"]}
+
+
+@unittest.skipUnless(HAS_DEPS, "needs python-dotenv")
+class FewShotTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cwd = os.getcwd()
+        os.chdir(ROOT)
+        cls.addClassCleanup(os.chdir, cwd)
+        import gateway
+
+        cls.gateway = gateway
+        if gateway.WORKFLOW_INDEX is None:
+            raise unittest.SkipTest("no workflows/ corpus")
+
+    def test_select_examples_picks_relevant_corpus_workflows(self):
+        for prompt, node_type in RELEVANT.items():
+            examples = self.gateway.select_examples(prompt, k=3)
+            self.assertEqual(len(examples), 3, prompt)
+            for ex in examples:
+                self.assertTrue(any(node_type in t for t in node_types(ex)), (prompt, ex["prompt"]))
+                self.assertLessEqual(len(json.dumps(ex["workflow"], separators=(",", ":"))),
+                                     self.gateway.FEW_SHOT_MAX_CHARS)
+                self.assertEqual(set(ex["workflow"]), {"nodes", "connections"})
+
+    def test_select_examples_falls_back_to_training_examples(self):
+        with mock.patch.object(self.gateway, "WORKFLOW_INDEX", None):
+            self.assertEqual(self.gateway.select_examples("send a slack message", k=2),
+                             self.gateway.TRAINING_EXAMPLES[:2])
+        self.assertEqual(self.gateway.select_examples(None, k=1), self.gateway.TRAINING_EXAMPLES[:1])
+
+    def test_backend_request_carries_the_examples(self):
+        prompt = "Add new Typeform responses to Google Sheets"
+        body = self.gateway.backend_request(prompt)
+        self.assertEqual(body["prompt"], prompt)
+        self.assertEqual([ex["prompt"] for ex in body["examples"]],
+                         [ex["prompt"] for ex in self.gateway.select_examples(prompt)])
+        for ex in body["examples"]:
+            self.assertTrue(all("position" not in n for n in ex["workflow"]["nodes"]))
+        with mock.patch.object(self.gateway, "FEW_SHOT_K", 0):
+            self.assertEqual(self.gateway.backend_request(prompt), {"prompt": prompt})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "trained_model"))
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("torch", "transformers", "peft"))
+
+
+@unittest.skipUnless(HAS_DEPS, "needs torch, transformers and peft")
+class LoadModelDeviceTest(unittest.TestCase):
+    def load(self, device, cuda):
+        import inference
+
+        model_dir = tempfile.mkdtemp()
+        with mock.patch.object(inference.torch.cuda, "is_available", return_value=cuda), \
+                mock.patch.object(inference, "AutoTokenizer") as tokenizer, \
+                mock.patch.object(inference, "AutoModelForCausalLM") as auto_model, \
+                mock.patch.object(inference, "PeftModel") as peft, \
+                mock.patch.object(inference, "BitsAndBytesConfig") as bnb, \
+                mock.patch.object(inference.N8NWorkflowGenerator, "_quantize_cpu", return_value=True) as quantize, \
+                mock.patch.object(inference.N8NWorkflowGenerator, "_build_prefix_cache"):
+            gen = inference.N8NWorkflowGenerator(model_dir, use_quantization=True, device=device)
+        return gen, auto_model.from_pretrained, bnb, quantize
+
+    def test_cpu_int8_path_when_cuda_is_present(self):
+        import torch
+
+        gen, from_pretrained, bnb, quantize = self.load("cpu", cuda=True)
+        self.assertEqual(gen.device, "cpu")
+        bnb.assert_not_called()
+        from_pretrained.assert_called_once()
+        kwargs = from_pretrained.call_args.kwargs
+        self.assertNotIn("quantization_config", kwargs)
+        self.assertEqual(kwargs["device_map"], "cpu")
+        self.assertEqual(kwargs["torch_dtype"], torch.bfloat16)
+        quantize.assert_called_once()
+
+    def test_cuda_device_loads_nf4(self):
+        gen, from_pretrained, bnb, quantize = self.load("cuda", cuda=True)
+        self.assertEqual(gen.device, "cuda")
+        bnb.assert_called_once()
+        self.assertIn("quantization_config", from_pretrained.call_args.kwargs)
+        quantize.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import importlib.util
+import json
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+HAS_TORCH = importlib.util.find_spec("torch") is not None
+
+WORKFLOW = {
+    "name": "Demo",
+    "nodes": [
+        {"name": "Start", "type": "n8n-nodes-base.manualTrigger", "typeVersion": 1, "position": [0, 0]},
+        {"name": "Set", "type": "n8n-nodes-base.set", "typeVersion": 3.4, "parameters": {"x": [1, -2.5e3, True, None]}},
+    ],
+    "connections": {"Start": {"main": [[{"node": "Set", "type": "main", "index": 0}]]}},
+}
+
+# Token texts for a toy vocabulary; id 0 is EOS
+EOS = 0
+TEXTS = [None, "{", "}", '"nodes"', ":", "[", "]", ",", '"connections"', "x", " "]
+OPEN, CLOSE, NODES, COLON, LBRACKET, RBRACKET, COMMA, CONNECTIONS, JUNK, SPACE = range(1, 11)
+
+
+@unittest.skipUnless(HAS_TORCH, "needs torch")
+class JsonScannerTest(unittest.TestCase):
+    def scanner(self):
+        from json_grammar import WORKFLOW_SCHEMA, JsonScanner
+
+        return JsonScanner(WORKFLOW_SCHEMA)
+
+    def test_accepts_a_workflow_one_character_at_a_time(self):
+        scanner = self.scanner()
+        text = json.dumps(WORKFLOW, indent=2)
+        for ch in text[:-1]:
+            self.assertTrue(scanner.feed(ch), ch)
+            self.assertFalse(scanner.done)
+        self.assertTrue(scanner.feed(text[-1]))
+        self.assertTrue(scanner.done)
+        # Only whitespace may follow the closed object
+        self.assertTrue(scanner.copy().feed("\n "))
+        self.assertFalse(scanner.copy().feed("{"))
+
+    def test_rejects_missing_required_keys(self):
+        self.assertFalse(self.scanner().feed('{"nodes": [{"name": "A", "type": "t", "typeVersion": 1}]}'))
+        self.assertFalse(self.scanner().feed('{"nodes": [{"name": "A"}], "connections": {}}'))
+
+    def test_rejects_schema_type_and_bounds(self):
+        node = '{"name": "A", "type": "t", "typeVersion": 1, "position": %s}'
+        self.assertFalse(self.scanner().feed('{"nodes": "A"'))
+        self.assertFalse(self.scanner().feed('{"nodes": []'))
+        self.assertFalse(self.scanner().feed('{"nodes": [' + node % "[1, 2, 3]"))
+        self.assertTrue(self.scanner().feed('{"nodes": [' + node % "[1, 2]"))
+
+    def test_rejects_malformed_json(self):
+        for text in ('{"nodes" [', '{"nodes": [01', '{"nodes": [{"name": tru', '{,', '{"a\\x'):
+            self.assertFalse(self.scanner().feed(text), text)
+
+    def test_limits_whitespace_runs(self):
+        from json_grammar import MAX_WHITESPACE_RUN
+
+        scanner = self.scanner()
+        self.assertTrue(scanner.feed("{" + " " * MAX_WHITESPACE_RUN))
+        self.assertFalse(scanner.feed(" "))
+
+    def test_copy_is_independent(self):
+        scanner = self.scanner()
+        scanner.feed('{"nodes": [')
+        other = scanner.copy()
+        self.assertTrue(other.feed('{"name": "A", "type": "t", "typeVersion": 1}'))
+        self.assertEqual(scanner.stack[-1][2], 0)
+        self.assertEqual(other.stack[-1][2], 1)
+
+
+@unittest.skipUnless(HAS_TORCH, "needs torch")
+class WorkflowConstraintTest(unittest.TestCase):
+    def constraint(self, texts=TEXTS, eos=EOS, schema=None, top_k=4):
+        from json_grammar import WorkflowConstraint
+
+        return WorkflowConstraint(texts, eos, schema or {"type": "object"}, top_k=top_k)
+
+    def logits(self, ranking, size=len(TEXTS)):
+        """Logits where ranking[0] scores highest; everything else scores lowest."""
+        import torch
+
+        logits = torch.full((size,), -100.0)
+        for rank, token_id in enumerate(ranking):
+            logits[token_id] = float(len(ranking) - rank)
+        return logits
+
+    def finite(self, masked):
+        import torch
+
+        return set(torch.nonzero(torch.isfinite(masked)).flatten().tolist())
+
+    def test_mask_keeps_only_valid_tokens(self):
+        c = self.constraint()
+        masked = c.mask(self.logits([CLOSE, JUNK, OPEN, NODES]))
+        self.assertEqual(self.finite(masked), {OPEN})
+        c.advance(OPEN)
+        masked = c.mask(self.logits([JUNK, CLOSE, NODES, COLON]))
+        self.assertEqual(self.finite(masked), {CLOSE, NODES})
+        # Valid tokens keep their logits
+        self.assertEqual(float(masked[CLOSE]), 3.0)
+
+    def test_eos_is_the_only_token_once_done(self):
+        c = self.constraint()
+        c.advance(OPEN)
+        c.advance(CLOSE)
+        self.assertTrue(c.done)
+        masked = c.mask(self.logits([OPEN, CLOSE]))
+        self.assertEqual(self.finite(masked), {EOS})
+        self.assertFalse(c.stalled)
+        # EOS and anything after completion are ignored
+        c.advance(EOS)
+        c.advance(JUNK)
+
+    def test_advance_rejects_grammar_violations(self):
+        c = self.constraint()
+        with self.assertRaises(ValueError):
+            c.advance(CLOSE)
+        with self.assertRaises(ValueError):
+            self.constraint().advance(EOS + len(TEXTS))
+
+    def test_window_widens_until_a_valid_token_is_found(self):
+        from json_grammar import TOP_K_GROWTH
+
+        size = 1000
+        texts = [None] + ["x"] * (size - 2) + ["{"]
+        c = self.constraint(texts=texts, top_k=8)
+        calls = []
+        allows = c.allows
+        c.allows = lambda t: calls.append(t) or allows(t)
+        # "{" ranks below 8 * TOP_K_GROWTH junk tokens
+        ranking = list(range(1, 8 * TOP_K_GROWTH + 1)) + [size - 1]
+        masked = c.mask(self.logits(ranking, size))
+        self.assertEqual(self.finite(masked), {size - 1})
+        # Each candidate is checked once, and the search stops at the window that found one
+        self.assertEqual(len(calls), len(set(calls)))
+        self.assertEqual(len(calls), 8 * TOP_K_GROWTH * TOP_K_GROWTH)
+
+    def test_stalled_grammar_forces_eos(self):
+        import json_grammar
+
+        size = 3 * json_grammar.MAX_TOP_K
+        texts = [None] + ["x"] * (size - 1)
+        c = self.constraint(texts=texts)
+        calls = []
+        allows = c.allows
+        c.allows = lambda t: calls.append(t) or allows(t)
+        masked = c.mask(self.logits(range(1, size), size))
+        self.assertTrue(c.stalled)
+        self.assertEqual(self.finite(masked), {EOS})
+        self.assertEqual(len(calls), json_grammar.MAX_TOP_K)
+        # Sampling the row can't fail: all probability is on EOS
+        import torch
+
+        self.assertEqual(float(torch.softmax(masked, dim=-1)[EOS]), 1.0)
+        c.advance(JUNK)  # Ignored once stalled
+
+    def test_nothing_to_sample_without_eos(self):
+        c = self.constraint(eos=None)
+        c.advance(OPEN)
+        c.advance(CLOSE)
+        self.assertIsNone(c.mask(self.logits([OPEN])))
+        stuck = self.constraint(texts=[None, "x"], eos=None)
+        self.assertIsNone(stuck.mask(self.logits([1], 2)))
+        self.assertTrue(stuck.stalled)
+
+    def test_logits_processor_leaves_stalled_rows_alone(self):
+        import torch
+        from json_grammar import WorkflowLogitsProcessor
+
+        processor = WorkflowLogitsProcessor([None, "x", "{"], None, prompt_length=1, schema={"type": "object"})
+        # The output can only open with "{", which ranks last but is still found
+        out = processor(torch.tensor([[7]]), torch.tensor([[0.0, 5.0, -100.0]]))
+        self.assertTrue(torch.isfinite(out[0, 2]) and torch.isinf(out[0, 1]))
+        stuck = WorkflowLogitsProcessor([None, "x"], None, prompt_length=1, schema={"type": "object"})
+        scores = torch.tensor([[0.0, 5.0]])
+        self.assertTrue(torch.equal(stuck(torch.tensor([[7]]), scores.clone()), scores))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import importlib.util
+import json
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "scripts" / "serve"))
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("torch", "transformers", "flask"))
+
+EXAMPLE = {"prompt": "Post new Stripe payments to Slack",
+           "workflow": {"nodes": [{"name": "Stripe Trigger", "type": "n8n-nodes-base.stripeTrigger", "parameters": {},
+                                   "position": [250, 300]},
+                                  {"name": "Slack", "type": "n8n-nodes-base.slack", "parameters": {"text": "paid"},
+                                   "position": [450, 300]}],
+                        "connections": {"Stripe Trigger": {"main": [[{"node": "Slack", "type": "main", "index": 0}]]}}}}
+
+
+@unittest.skipUnless(HAS_DEPS, "needs torch, transformers and flask")
+class BuildPromptTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import local_inference
+
+        cls.li = local_inference
+
+    def test_without_examples(self):
+        self.assertEqual(self.li.build_prompt("hi"), f"{self.li.PROMPT_PREFIX}hi\n[/USER]\n[ASSISTANT]\n")
+
+    def test_examples_are_earlier_turns_after_the_cached_prefix(self):
+        text = self.li.build_prompt("Send Slack alerts for failed payments", [EXAMPLE])
+        self.assertTrue(text.startswith(self.li.PROMPT_PREFIX))
+        turn, question = text[len(self.li.PROMPT_PREFIX):].split("\n[/ASSISTANT]\n[USER]\n")
+        shot_prompt, answer = turn.split("\n[/USER]\n[ASSISTANT]\n")
+        self.assertEqual(shot_prompt, EXAMPLE["prompt"])
+        workflow = json.loads(answer)
+        self.assertEqual([n["name"] for n in workflow["nodes"]], ["Stripe Trigger", "Slack"])
+        self.assertTrue(all("position" not in n for n in workflow["nodes"]))
+        self.assertEqual(question, "Send Slack alerts for failed payments\n[/USER]\n[ASSISTANT]\n")
+
+    def test_compact_adapters_see_compact_examples(self):
+        from workflow_format import compact_workflow, expand_workflow
+
+        text = self.li.build_prompt("x", [EXAMPLE], compact=True)
+        answer = text.split("[ASSISTANT]\n")[1].split("\n[/ASSISTANT]")[0]
+        self.assertEqual(json.loads(answer), compact_workflow(EXAMPLE["workflow"], positions=False))
+        self.assertEqual(expand_workflow(json.loads(answer))["connections"], EXAMPLE["workflow"]["connections"])
+
+    def test_malformed_examples_are_skipped(self):
+        plain = self.li.build_prompt("x")
+        for examples in ("junk", [None, {"prompt": "p"}, {"prompt": 1, "workflow": {}}, {"workflow": {}}]):
+            self.assertEqual(self.li.build_prompt("x", examples), plain)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from node_defaults import DEFAULTS_FILE, NodeDefaults, load_rules
+
+# Node types the original ensure_required_defaults if-chain started disabled
+DISABLED_TYPES = {
+    "n8n-nodes-base.gmail",
+    "n8n-nodes-base.slack",
+    "n8n-nodes-base.discord",
+    "n8n-nodes-base.googleSheets",
+    "n8n-nodes-base.googleSheetsTrigger",
+    "n8n-nodes-base.airtable",
+    "n8n-nodes-base.trello",
+    "n8n-nodes-base.notion",
+    "n8n-nodes-base.httpRequest",
+}
+
+
+class NodeDefaultsTest(unittest.TestCase):
+    def setUp(self):
+        self.defaults = NodeDefaults(load_rules([ROOT / DEFAULTS_FILE]))
+
+    def apply(self, node_type, **node):
+        workflow = {"nodes": [{"name": "Node", "type": node_type, **node}]}
+        return self.defaults.apply(workflow)["nodes"][0]
+
+    def test_disabled_types_are_pinned(self):
+        disabled = {t for t in load_rules([ROOT / DEFAULTS_FILE]) if self.apply(t).get("disabled")}
+        self.assertEqual(disabled, DISABLED_TYPES)
+
+    def test_other_credential_nodes_stay_enabled(self):
+        for node_type in ("n8n-nodes-base.telegram", "n8n-nodes-base.postgres", "n8n-nodes-base.openAi",
+                          "@n8n/n8n-nodes-langchain.lmChatOpenAi", "n8n-nodes-base.set"):
+            self.assertNotIn("disabled", self.apply(node_type), node_type)
+
+    def test_explicit_disabled_is_kept(self):
+        self.assertFalse(self.apply("n8n-nodes-base.slack", disabled=False)["disabled"])
+
+    def test_parameters_fill_gaps_and_are_not_shared(self):
+        first = self.apply("n8n-nodes-base.notion", parameters={"databaseId": "abc"})
+        second = self.apply("n8n-nodes-base.notion")
+        self.assertEqual(first["parameters"]["databaseId"], "abc")
+        self.assertEqual(first["parameters"]["operation"], "create")
+        self.assertIsNot(first["parameters"]["propertiesUi"], second["parameters"]["propertiesUi"])
+
+
+if __name__ == "__main__":
+    unittest.main()
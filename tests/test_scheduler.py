@@ -0,0 +1,158 @@
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "scripts" / "serve"))
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("torch", "transformers"))
+
+PROMPTS = [[5, 9, 14, 3], [7, 7, 21], [30, 2, 11, 40, 8, 19, 6], [12], [44, 45, 46, 47, 48]]
+
+
+def tiny_lm(seed=0):
+    """Randomly initialised two-layer Llama in float64, so padding can't flip an argmax."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+                         bos_token_id=None, eos_token_id=None, pad_token_id=None)
+    return LlamaForCausalLM(config).double().eval()
+
+
+def reference(model, prompt, max_new_tokens, eos_token_id=None):
+    """Greedy model.generate() continuation of one prompt, without the EOS token."""
+    import torch
+
+    ids = torch.tensor([prompt])
+    out = model.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=max_new_tokens, do_sample=False,
+                         eos_token_id=eos_token_id, pad_token_id=0)
+    tokens = out[0, len(prompt):].tolist()
+    return tokens[:tokens.index(eos_token_id)] if eos_token_id in tokens else tokens
+
+
+@unittest.skipUnless(HAS_DEPS, "needs torch and transformers")
+class BatchSchedulerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = tiny_lm()
+
+    def request(self, prompt, max_new_tokens=12, eos_token_id=None, **kwargs):
+        from scheduler import GenerationRequest
+
+        return GenerationRequest(prompt, max_new_tokens=max_new_tokens, temperature=0, eos_token_id=eos_token_id,
+                                 **kwargs)
+
+    def scheduler(self, max_batch_size=8):
+        from scheduler import BatchScheduler
+
+        return BatchScheduler(self.model, None, max_batch_size=max_batch_size)
+
+    def run_steps(self, scheduler, arrivals):
+        """Drive the scheduler thread's loop by hand; arrivals maps decode step -> requests submitted before it."""
+        import torch
+
+        step = 0
+        with torch.inference_mode():
+            while step <= max(arrivals) or scheduler.active or not scheduler.pending.empty():
+                for req in arrivals.get(step, ()):
+                    scheduler.submit(req)
+                scheduler._admit()
+                if scheduler.active:
+                    scheduler._decode_step()
+                step += 1
+
+    def eos_after(self, prompt, steps):
+        """A token greedy decoding of prompt first emits at step steps, to use as its EOS."""
+        tokens = reference(self.model, prompt, 40)
+        for i in range(steps, len(tokens)):
+            if tokens[i] not in tokens[:i]:
+                return tokens[i]
+        self.skipTest("no fresh token to use as EOS")
+
+    def test_batched_output_matches_generate(self):
+        scheduler = self.scheduler()
+        reqs = [self.request(p) for p in PROMPTS]
+        self.run_steps(scheduler, {0: reqs})
+        for prompt, req in zip(PROMPTS, reqs):
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 12))
+            self.assertEqual(req.finish_reason, "length")
+        self.assertEqual(scheduler.stats["max_batch_seen"], len(PROMPTS))
+        self.assertEqual(scheduler.stats["generated_tokens"], 12 * len(PROMPTS))
+
+    def test_staggered_admission(self):
+        # Requests join a running batch at different steps, and queue while the batch is full
+        scheduler = self.scheduler(max_batch_size=2)
+        reqs = [self.request(p, max_new_tokens=5 + i) for i, p in enumerate(PROMPTS)]
+        self.run_steps(scheduler, {0: reqs[:1], 2: reqs[1:3], 3: reqs[3:4], 9: reqs[4:]})
+        for i, (prompt, req) in enumerate(zip(PROMPTS, reqs)):
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 5 + i), i)
+        self.assertEqual(scheduler.stats["max_batch_seen"], 2)
+        self.assertEqual(scheduler.stats["completed"], len(PROMPTS))
+        # The batched cache is released once the batch drains
+        self.assertIsNone(scheduler._past)
+        self.assertEqual(scheduler._rows, [])
+
+    def test_sequence_finishing_mid_batch(self):
+        scheduler = self.scheduler()
+        # The longest prompt stops after two tokens, so the shared left padding shrinks while others decode
+        eos = self.eos_after(PROMPTS[2], 2)
+        reqs = [self.request(p, max_new_tokens=10) for p in PROMPTS[:2]]
+        reqs.insert(2, self.request(PROMPTS[2], max_new_tokens=10, eos_token_id=eos))
+        self.run_steps(scheduler, {0: reqs})
+        self.assertEqual(reqs[2].finish_reason, "eos")
+        self.assertEqual(reqs[2].output_ids, reference(self.model, PROMPTS[2], 10, eos))
+        self.assertEqual(len(reqs[2].output_ids), 2)
+        for prompt, req in zip(PROMPTS[:2], reqs[:2]):
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 10))
+
+    def test_eos_is_not_counted_as_generated(self):
+        scheduler = self.scheduler()
+        reqs = [self.request(p, max_new_tokens=20, eos_token_id=self.eos_after(p, 3)) for p in PROMPTS[:3]]
+        self.run_steps(scheduler, {0: reqs})
+        for req in reqs:
+            self.assertEqual(req.finish_reason, "eos")
+            self.assertNotIn(req.eos_token_id, req.output_ids)
+        self.assertEqual(scheduler.stats["generated_tokens"], sum(len(req.output_ids) for req in reqs))
+
+    def test_stream_receives_every_token(self):
+        scheduler = self.scheduler()
+        req = self.request(PROMPTS[0], eos_token_id=self.eos_after(PROMPTS[0], 4), stream=True)
+        self.run_steps(scheduler, {0: [req]})
+        streamed = []
+        while (token_id := req.stream.get_nowait()) is not None:
+            streamed.append(token_id)
+        self.assertEqual(streamed, req.output_ids)
+
+    def test_grammar_dead_end_finishes_the_request(self):
+        from json_grammar import WorkflowConstraint
+
+        scheduler = self.scheduler()
+        texts = [None] + ["x"] * 63  # Nothing in the vocabulary can open a JSON object
+        stalled = [self.request(PROMPTS[0], eos_token_id=eos,
+                                constraint=WorkflowConstraint(texts, eos, {"type": "object"}))
+                   for eos in (0, None)]
+        for req in stalled:
+            req.temperature = 1.0  # Sampling a row of all -inf would raise
+        plain = self.request(PROMPTS[1])
+        self.run_steps(scheduler, {0: stalled + [plain]})
+        for req in stalled:
+            self.assertEqual(req.finish_reason, "grammar")
+            self.assertIsNone(req.error)
+            self.assertEqual(req.output_ids, [])
+        self.assertEqual(plain.output_ids, reference(self.model, PROMPTS[1], 12))
+
+    def test_threaded_loop(self):
+        scheduler = self.scheduler(max_batch_size=3).start()
+        reqs = [scheduler.submit(self.request(p)) for p in PROMPTS]
+        for prompt, req in zip(PROMPTS, reqs):
+            self.assertTrue(req.wait(timeout=60))
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 12))
+
+
+if __name__ == "__main__":
+    unittest.main()
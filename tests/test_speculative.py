@@ -0,0 +1,123 @@
+import importlib.util
+import string
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "scripts" / "serve"))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from test_scheduler import PROMPTS, reference, tiny_lm
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("torch", "transformers"))
+
+
+class CharTokenizer:
+    """One character per token id over the tiny model's 64-token vocabulary, so text round-trips exactly."""
+
+    ALPHABET = string.ascii_letters + string.digits + "+/"
+
+    def __init__(self, eos_token_id=None):
+        self.eos_token_id = eos_token_id
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [self.ALPHABET.index(c) for c in text]}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(self.ALPHABET[i] for i in ids if not (skip_special_tokens and i == self.eos_token_id))
+
+
+def cache_len(past):
+    return past.get_seq_length() if hasattr(past, "get_seq_length") else past[0][0].shape[2]
+
+
+@unittest.skipUnless(HAS_DEPS, "needs torch and transformers")
+class SpeculativeSchedulerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = tiny_lm()
+        # A different random model only agrees with the target some of the time
+        cls.other = tiny_lm(seed=1)
+
+    def scheduler(self, draft_model, max_draft_tokens=4):
+        from speculative import SpeculativeScheduler
+
+        scheduler = SpeculativeScheduler(self.model, CharTokenizer(), draft_model, CharTokenizer(),
+                                         max_draft_tokens=max_draft_tokens)
+        checks = self.checks = []
+        propose = scheduler._propose
+
+        def checked_propose(req, draft, k):
+            # Every target forward starts from a cache of the prompt and all output but the last token
+            checks.append((req.past_len, cache_len(req.past), len(req.input_ids) + len(req.output_ids) - 1))
+            proposal = propose(req, draft, k)
+            checks.append((len(draft.ids), cache_len(draft.past), len(draft.ids)))
+            return proposal
+
+        scheduler._propose = checked_propose
+        return scheduler.start()
+
+    def generate(self, scheduler, prompt, max_new_tokens=16, eos_token_id=None):
+        from scheduler import GenerationRequest
+
+        req = scheduler.submit(GenerationRequest(prompt, max_new_tokens=max_new_tokens, temperature=0,
+                                                 eos_token_id=eos_token_id))
+        self.assertTrue(req.wait(timeout=60))
+        self.assertIsNone(req.error)
+        return req
+
+    def assert_caches_in_sync(self):
+        self.assertTrue(self.checks)
+        for past_len, length, expected in self.checks:
+            self.assertEqual((past_len, length), (expected, expected))
+
+    def test_matching_draft_accepts_every_guess(self):
+        scheduler = self.scheduler(self.model)
+        for prompt in PROMPTS:
+            req = self.generate(scheduler, prompt)
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 16))
+            self.assertEqual(req.accepted_tokens, req.draft_tokens)
+        snap = scheduler.snapshot()
+        self.assertEqual(snap["acceptance_rate"], 1.0)
+        self.assertGreater(snap["tokens_per_forward"], 2)
+        self.assert_caches_in_sync()
+
+    def test_partial_accepts_keep_the_target_output(self):
+        scheduler = self.scheduler(self.other)
+        for prompt in PROMPTS:
+            req = self.generate(scheduler, prompt, max_new_tokens=24)
+            self.assertEqual(req.output_ids, reference(self.model, prompt, 24))
+        stats = scheduler.stats
+        self.assertGreater(stats["accepted_tokens"], 0)
+        self.assertLess(stats["accepted_tokens"], stats["draft_tokens"])
+        self.assert_caches_in_sync()
+
+    def test_matches_the_batch_scheduler(self):
+        from scheduler import BatchScheduler, GenerationRequest
+
+        batch = BatchScheduler(self.model, None, max_batch_size=4).start()
+        batched = [batch.submit(GenerationRequest(p, max_new_tokens=20, temperature=0)) for p in PROMPTS]
+        speculative = self.scheduler(self.other, max_draft_tokens=6)
+        for prompt, req in zip(PROMPTS, batched):
+            self.assertTrue(req.wait(timeout=60))
+            self.assertEqual(self.generate(speculative, prompt, max_new_tokens=20).output_ids, req.output_ids)
+
+    def test_stops_inside_an_accepted_run(self):
+        scheduler = self.scheduler(self.model, max_draft_tokens=6)
+        prompt = PROMPTS[2]
+        tokens = reference(self.model, prompt, 40)
+        # Length and EOS both land in the middle of a proposal the target agrees with
+        req = self.generate(scheduler, prompt, max_new_tokens=5)
+        self.assertEqual((req.output_ids, req.finish_reason), (tokens[:5], "length"))
+        eos = next((t for i, t in enumerate(tokens) if i >= 3 and t not in tokens[:i]), None)
+        if eos is None:
+            self.skipTest("no fresh token to use as EOS")
+        req = self.generate(scheduler, prompt, max_new_tokens=40, eos_token_id=eos)
+        self.assertEqual((req.output_ids, req.finish_reason), (tokens[:tokens.index(eos)], "eos"))
+        self.assertEqual(scheduler.stats["generated_tokens"], 5 + tokens.index(eos))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+import workflow_cache
+from workflow_cache import WorkflowCache, cosine, embed, normalize_prompt
+
+# The similarity threshold .env.example suggests when enabling the fallback
+SIMILARITY = 0.9
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def wf(name, padding=0):
+    return {"nodes": [{"name": name, "type": "n8n-nodes-base.set", "parameters": {"x": "." * padding}}],
+            "connections": {}}
+
+
+def size(workflow):
+    return len(json.dumps(workflow, separators=(",", ":")))
+
+
+def similarity(a, b):
+    return cosine(embed(normalize_prompt(a)), embed(normalize_prompt(b)))
+
+
+class WorkflowCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(workflow_cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_normalized_prompts_share_an_entry(self):
+        self.assertEqual(normalize_prompt("Send a Slack message, every day at 9am!"), "send slack message every day 9am")
+        cache = WorkflowCache()
+        cache.put("Send Slack message every day at 9am!", wf("A"))
+        self.assertEqual(cache.get("send a slack message every day at 9am"), wf("A"))
+        self.assertIsNone(cache.get("send slack message every week at 9am"))
+        self.assertEqual((cache.counters["hits"], cache.counters["misses"]), (1, 1))
+
+    def test_callers_get_a_private_copy(self):
+        cache = WorkflowCache()
+        cache.put("p", wf("A"))
+        cache.get("p")["nodes"].clear()
+        self.assertEqual(cache.get("p"), wf("A"))
+
+    def test_ttl_expiry(self):
+        cache = WorkflowCache(ttl=60)
+        cache.put("first", wf("A"))
+        self.clock.now += 30
+        cache.put("second", wf("B"))
+        self.clock.now += 30
+        self.assertIsNone(cache.get("first"), "an entry is stale once its TTL has passed")
+        self.assertEqual(cache.get("second"), wf("B"))
+        # A hit doesn't extend the TTL, but storing the prompt again does
+        self.clock.now += 29
+        cache.put("second", wf("C"))
+        self.clock.now += 59
+        self.assertEqual(cache.get("second"), wf("C"))
+        stats = cache.stats()
+        self.assertEqual((stats["expirations"], stats["entries"], stats["bytes"]), (1, 1, size(wf("C"))))
+
+    def test_byte_cap(self):
+        entry = size(wf("A", 100))
+        cache = WorkflowCache(max_bytes=3 * entry)
+        for name in "ABC":
+            cache.put(name, wf(name, 100))
+        self.assertEqual(cache.stats()["bytes"], 3 * entry)
+        cache.put("D", wf("D", 100))
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["bytes"], stats["evictions"]), (3, 3 * entry, 1))
+        # Replacing an entry with a bigger one frees room for it first
+        cache.put("D", wf("D", 100 + entry))
+        self.assertLessEqual(cache.stats()["bytes"], 3 * entry)
+        self.assertEqual(cache.get("D"), wf("D", 100 + entry))
+        # A workflow bigger than the whole cache is never stored, and evicts nothing
+        before = cache.stats()
+        cache.put("huge", wf("huge", 3 * entry))
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(cache.stats()["entries"], before["entries"])
+
+    def test_lru_eviction_order(self):
+        entry = size(wf("A"))
+        cache = WorkflowCache(max_bytes=3 * entry)
+        for name in "ABC":
+            cache.put(name, wf(name))
+        cache.get("A")  # A is now the most recently used, B the least
+        cache.put("D", wf("D"))
+        self.assertIsNone(cache.get("B"))
+        cache.put("C", wf("C"))  # Overwriting counts as a use
+        cache.put("E", wf("E"))
+        self.assertIsNone(cache.get("A"))
+        self.assertEqual([name for name in "CDE" if cache.get(name)], ["C", "D", "E"])
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_disabled_similarity_only_hits_exact_keys(self):
+        cache = WorkflowCache(similarity_threshold=0)
+        cache.put("every day at 9am send a slack message", wf("A"))
+        self.assertIsNone(cache.get("send a slack message every day at 9am"))
+
+    def test_similarity_fallback(self):
+        cache = WorkflowCache(similarity_threshold=SIMILARITY)
+        cache.put("Send a Slack message every day at 9am", wf("A"))
+        cache.put("Add a row to Google Sheets when a form is submitted", wf("B"))
+        self.assertEqual(cache.get("every day at 9am send a slack message"), wf("A"))
+        self.assertEqual(cache.get("when a form is submitted add a row to google sheets"), wf("B"))
+        self.assertIsNone(cache.get("send a slack message"))
+        self.assertEqual((cache.counters["similar_hits"], cache.counters["misses"]), (2, 1))
+        # Expired entries are never matched by similarity
+        self.clock.now += cache.ttl
+        self.assertIsNone(cache.get("every day at 9am send a slack message"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_similarity_picks_the_closest_entry(self):
+        cache = WorkflowCache(similarity_threshold=0.5)
+        cache.put("send slack message every day", wf("daily"))
+        cache.put("send slack message every day at 9am", wf("9am"))
+        self.assertEqual(cache.get("every day at 9am send slack message"), wf("9am"))
+
+    def test_threshold_keeps_different_actions_apart(self):
+        pairs = [
+            ("send Slack message", "read Slack messages"),
+            ("Send a Slack message every day at 9am", "Read Slack messages every day at 9am"),
+            ("create a Trello card when a GitHub issue is opened", "delete a Trello card when a GitHub issue is closed"),
+            ("append a row to Google Sheets", "delete a row from Google Sheets"),
+        ]
+        for a, b in pairs:
+            self.assertLess(similarity(a, b), SIMILARITY, (a, b))
+            cache = WorkflowCache(similarity_threshold=SIMILARITY)
+            cache.put(a, wf("A"))
+            self.assertIsNone(cache.get(b), (a, b))
+            self.assertEqual(cache.counters["similar_hits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "scripts" / "train"))
+
+from qlora_train import load_examples
+from workflow_format import (COMPACT_FORMAT, FORMAT_FILE, N8N_FORMAT, compact_workflow, expand_workflow, load_format,
+                             round_trips)
+from workflow_index import _load_workflow_file
+
+WORKFLOWS = ROOT / "workflows"
+
+
+def corpus():
+    for path in sorted(WORKFLOWS.glob("*.json")):
+        wf = _load_workflow_file(path)
+        if wf is not None:
+            yield path.name, wf
+
+
+def defects(wf):
+    """Why a workflow can't survive the compact form: duplicate names or connections to missing nodes."""
+    names = [n.get("name") for n in wf["nodes"] if isinstance(n, dict)]
+    found = set()
+    if len(names) != len(set(names)):
+        found.add("duplicate_name")
+    for source, outputs in wf.get("connections", {}).items():
+        targets = [e.get("node") for branches in outputs.values() for b in branches or [] for e in b or []]
+        if source not in names or any(t not in names for t in targets):
+            found.add("dangling_connection")
+    return found
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_corpus_round_trips(self):
+        failures = {}
+        count = 0
+        for name, wf in corpus():
+            count += 1
+            if not round_trips(wf):
+                failures[name] = defects(wf)
+        self.assertGreater(count, 900)
+        # Only workflows with duplicate names or dangling connections are lost, and only a handful
+        self.assertLessEqual(len(failures), 10, failures)
+        for name, found in failures.items():
+            self.assertTrue(found, f"{name} doesn't round-trip for another reason")
+
+    def test_round_trip_keeps_everything_but_ids_credentials_and_positions(self):
+        wf = {
+            "nodes": [
+                {"id": "a", "name": "Webhook", "type": "n8n-nodes-base.webhook", "typeVersion": 2, "position": [0, 0],
+                 "webhookId": "w", "parameters": {"path": "orders"}},
+                {"id": "b", "name": "Notify", "type": "n8n-nodes-base.slack", "typeVersion": 2.2, "position": [9, 9],
+                 "parameters": {"text": "hi"}, "credentials": {"slackApi": {"id": "1"}}, "onError": "continue"},
+                {"name": "Agent", "type": "@n8n/n8n-nodes-langchain.agent", "position": [1, 1], "parameters": {}},
+            ],
+            "connections": {
+                "Webhook": {"main": [[{"node": "Notify", "type": "main", "index": 0}],
+                                     [{"node": "Agent", "type": "main", "index": 0}]]},
+            },
+        }
+        self.assertTrue(round_trips(wf))
+        back = expand_workflow(compact_workflow(wf, positions=False))
+        self.assertEqual(back["connections"], wf["connections"])
+        self.assertEqual(back["nodes"][1]["onError"], "continue")
+        self.assertNotIn("credentials", back["nodes"][1])
+        self.assertIn("webhookId", back["nodes"][0])
+
+    def test_duplicate_names_and_dangling_connections_are_detected(self):
+        node = {"name": "Set", "type": "n8n-nodes-base.set", "parameters": {}}
+        self.assertFalse(round_trips({"nodes": [node, dict(node)], "connections": {}}))
+        dangling = {"Set": {"main": [[{"node": "Gone", "type": "main", "index": 0}]]}}
+        self.assertFalse(round_trips({"nodes": [node], "connections": dangling}))
+
+
+class TrainingTargetsTest(unittest.TestCase):
+    def test_compact_training_skips_workflows_that_do_not_round_trip(self):
+        node = {"name": "Set", "type": "n8n-nodes-base.set", "parameters": {}}
+        rows = [
+            {"prompt": "ok", "workflow": {"nodes": [node], "connections": {}}},
+            {"prompt": "duplicate", "workflow": {"nodes": [node, dict(node)], "connections": {}}},
+        ]
+        path = Path(tempfile.mkdtemp()) / "dataset.jsonl"
+        path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+        with mock.patch("builtins.print"):
+            self.assertEqual([ex["user"] for ex in load_examples(str(path), COMPACT_FORMAT)], ["ok"])
+        self.assertEqual([ex["user"] for ex in load_examples(str(path), N8N_FORMAT)], ["ok", "duplicate"])
+
+
+class LoadFormatTest(unittest.TestCase):
+    def test_format_comes_from_each_adapter(self):
+        compact_dir, plain_dir, bare_dir = (tempfile.mkdtemp() for _ in range(3))
+        with open(Path(compact_dir) / FORMAT_FILE, "w", encoding="utf-8") as f:
+            json.dump({"workflow_format": COMPACT_FORMAT}, f)
+        with open(Path(plain_dir) / FORMAT_FILE, "w", encoding="utf-8") as f:
+            json.dump({"workflow_format": N8N_FORMAT}, f)
+        # The training-time WORKFLOW_FORMAT setting doesn't leak into serving
+        with mock.patch.dict(os.environ, {"WORKFLOW_FORMAT": COMPACT_FORMAT}):
+            self.assertEqual(load_format(compact_dir), COMPACT_FORMAT)
+            self.assertEqual(load_format(plain_dir), N8N_FORMAT)
+            self.assertEqual(load_format(bare_dir), N8N_FORMAT)
+            self.assertEqual(load_format(None), N8N_FORMAT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import copy
+import random
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from workflow_index import _load_workflow_file
+from workflow_layout import ORIGIN, STICKY_NOTE, X_STEP, Y_STEP, has_positions, layout_workflow, strip_positions
+
+WORKFLOWS = ROOT / "workflows"
+
+
+def node(name, node_type="n8n-nodes-base.set"):
+    return {"name": name, "type": node_type, "parameters": {}}
+
+
+def workflow(names, edges, types=None):
+    """edges are (source, target) or (source, target, output) or (source, target, output, kind)."""
+    types = types or {}
+    connections = {}
+    for e in edges:
+        source, target, output, kind = (list(e) + [0, "main"][len(e) - 2:])[:4]
+        branches = connections.setdefault(source, {}).setdefault(kind, [])
+        while len(branches) <= output:
+            branches.append([])
+        branches[output].append({"node": target, "type": kind, "index": 0})
+    return {"nodes": [node(n, types.get(n, "n8n-nodes-base.set")) for n in names], "connections": connections}
+
+
+def positions(wf):
+    return {n["name"]: tuple(n["position"]) for n in wf["nodes"] if n.get("type") != STICKY_NOTE}
+
+
+def main_edges(wf):
+    names = {n["name"] for n in wf["nodes"]}
+    for source, outputs in wf.get("connections", {}).items():
+        for branch in (outputs.get("main") or []) if isinstance(outputs, dict) else []:
+            for edge in branch if isinstance(branch, list) else [branch]:
+                if source in names and isinstance(edge, dict) and edge.get("node") in names:
+                    yield source, edge["node"]
+
+
+class LayoutTest(unittest.TestCase):
+    def assert_no_overlaps(self, wf, label=""):
+        taken = {}
+        for name, (x, y) in ((n["name"], n["position"]) for n in wf["nodes"] if n.get("type") != STICKY_NOTE):
+            self.assertIsInstance(x, int, label)
+            self.assertIsInstance(y, int, label)
+            self.assertEqual((x - ORIGIN[0]) % X_STEP, 0, label)
+            for other_y, other in taken.get(x, []):
+                self.assertGreaterEqual(abs(y - other_y), Y_STEP - 1, f"{label}: {name!r} overlaps {other!r}")
+            taken.setdefault(x, []).append((y, name))
+
+    def test_chain_starts_with_the_trigger_at_the_origin(self):
+        wf = layout_workflow(workflow(["Set", "Webhook", "Slack"], [("Webhook", "Set"), ("Set", "Slack")],
+                                      {"Webhook": "n8n-nodes-base.webhook"}))
+        pos = positions(wf)
+        self.assertEqual(pos["Webhook"], ORIGIN)
+        self.assertEqual(pos["Set"], (ORIGIN[0] + X_STEP, ORIGIN[1]))
+        self.assertEqual(pos["Slack"], (ORIGIN[0] + 2 * X_STEP, ORIGIN[1]))
+
+    def test_triggers_sit_in_the_first_layer(self):
+        # Two triggers feeding one chain, one of them joining late
+        wf = layout_workflow(workflow(["A", "B", "C", "Cron", "Hook"],
+                                      [("Hook", "A"), ("A", "B"), ("B", "C"), ("Cron", "A")]))
+        pos = positions(wf)
+        self.assertEqual(pos["Hook"][0], ORIGIN[0])
+        self.assertEqual(pos["Cron"][0], ORIGIN[0])
+        self.assert_no_overlaps(wf)
+
+    def test_if_true_branch_above_false_branch(self):
+        wf = layout_workflow(workflow(["Start", "IF", "No", "Yes"],
+                                      [("Start", "IF"), ("IF", "Yes", 0), ("IF", "No", 1)]))
+        pos = positions(wf)
+        self.assertEqual(pos["Yes"][0], pos["No"][0])
+        self.assertLess(pos["Yes"][1], pos["No"][1])
+
+    def test_cycles(self):
+        loop = workflow(["Start", "Split", "Work", "Done"],
+                        [("Start", "Split"), ("Split", "Done", 0), ("Split", "Work", 1), ("Work", "Split")])
+        pos = positions(layout_workflow(loop))
+        self.assertEqual(pos["Start"][0], ORIGIN[0])
+        self.assertLess(pos["Start"][0], pos["Split"][0])
+        self.assertLess(pos["Split"][0], pos["Work"][0])
+        self.assert_no_overlaps(loop)
+
+        # A cycle with no way in, and a self-loop
+        ring = layout_workflow(workflow(["A", "B", "C", "D"], [("A", "B"), ("B", "C"), ("C", "A"), ("D", "D")]))
+        self.assertTrue(has_positions(ring))
+        self.assert_no_overlaps(ring)
+
+    def test_sub_nodes_stack_under_their_parent(self):
+        wf = workflow(["Chat", "Agent", "Model", "Memory", "Reply"],
+                      [("Chat", "Agent"), ("Agent", "Reply"), ("Model", "Agent", 0, "ai_languageModel"),
+                       ("Memory", "Agent", 0, "ai_memory")])
+        pos = positions(layout_workflow(wf))
+        for sub_node in ("Model", "Memory"):
+            self.assertEqual(pos[sub_node][0], pos["Agent"][0])
+            self.assertGreater(pos[sub_node][1], pos["Agent"][1])
+        self.assert_no_overlaps(wf)
+
+    def test_sticky_notes_keep_their_position(self):
+        wf = workflow(["Start", "Set"], [("Start", "Set")])
+        wf["nodes"].append({"name": "Note", "type": STICKY_NOTE, "position": [-500, 40], "parameters": {}})
+        wf["nodes"].append({"name": "New note", "type": STICKY_NOTE, "parameters": {}})
+        layout_workflow(wf)
+        self.assertEqual(wf["nodes"][2]["position"], [-500, 40])
+        self.assertLess(wf["nodes"][3]["position"][1], ORIGIN[1])
+
+    def test_tolerates_malformed_input(self):
+        self.assertEqual(layout_workflow({"nodes": []}), {"nodes": []})
+        wf = {"nodes": [node("A"), "junk", node("B"), node("A")],
+              "connections": {"A": {"main": [{"node": "B"}, "x"]}, "Ghost": {"main": [[{"node": "A"}]]}, "B": []}}
+        layout_workflow(wf)
+        self.assertEqual(wf["nodes"][0]["position"], list(ORIGIN))
+        self.assertEqual(wf["nodes"][2]["position"], [ORIGIN[0] + X_STEP, ORIGIN[1]])
+
+    def test_layout_ignores_given_positions_and_is_deterministic(self):
+        wf = workflow(["Start", "A", "B", "C"], [("Start", "A"), ("Start", "B"), ("A", "C"), ("B", "C")])
+        first = positions(layout_workflow(copy.deepcopy(wf)))
+        for n in wf["nodes"]:
+            n["position"] = [random.randint(-999, 999), random.randint(-999, 999)]
+        self.assertEqual(positions(layout_workflow(wf)), first)
+        self.assertNotIn("position", strip_positions(wf)["nodes"][0])
+        self.assertIn("position", wf["nodes"][0])
+
+    def test_corpus_layouts(self):
+        count = 0
+        for path in sorted(WORKFLOWS.glob("*.json")):
+            wf = _load_workflow_file(path)
+            if wf is None:
+                continue
+            count += 1
+            layout_workflow(wf)
+            self.assertTrue(has_positions(wf), path.name)
+            self.assert_no_overlaps(wf, path.name)
+            pos = positions(wf)
+            if len(pos) != sum(n.get("type") != STICKY_NOTE for n in wf["nodes"]):
+                continue  # Duplicate names: edges can't tell the nodes apart
+            targets = {target for _, target in main_edges(wf)}
+            # Triggers (nodes nothing leads into) sit left of everything they feed
+            for source, target in main_edges(wf):
+                if source not in targets and source != target:
+                    self.assertLess(pos[source][0], pos[target][0], f"{path.name}: {source!r} -> {target!r}")
+        self.assertGreater(count, 900)
+
+    def test_random_graphs(self):
+        rng = random.Random(1234)
+        for trial in range(500):
+            n = rng.randint(1, 25)
+            names = [f"N{i}" for i in range(n)]
+            edges = [(rng.choice(names), rng.choice(names), rng.randint(0, 2)) for _ in range(rng.randint(0, 2 * n))]
+            edges += [(rng.choice(names), rng.choice(names), 0, "ai_tool") for _ in range(rng.randint(0, 3))]
+            wf = layout_workflow(workflow(names, edges))
+            self.assertTrue(has_positions(wf), trial)
+            self.assert_no_overlaps(wf, f"trial {trial}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import copy
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from node_catalog import NodeCatalog
+from workflow_validator import ERROR, WARNING, WorkflowValidator, is_valid, unrepaired
+
+CATALOG = NodeCatalog({
+    "nodes": {
+        "n8n-nodes-base.webhook": {"trigger": True, "typeVersion": 2, "credentials": False},
+        "n8n-nodes-base.slack": {"trigger": False, "typeVersion": 2.2, "credentials": True},
+        "n8n-nodes-base.googleSheets": {"trigger": False, "typeVersion": 4.5, "credentials": True},
+        "n8n-nodes-base.set": {"trigger": False, "typeVersion": 3.4, "credentials": False},
+    },
+    "aliases": {"webhook": "n8n-nodes-base.webhook", "slack": "n8n-nodes-base.slack",
+                "google sheets": "n8n-nodes-base.googleSheets", "googlesheets": "n8n-nodes-base.googleSheets",
+                "set": "n8n-nodes-base.set"},
+})
+
+
+def node(name, node_type="n8n-nodes-base.set", **extra):
+    return {"name": name, "type": node_type, "typeVersion": 1, "parameters": {}, **extra}
+
+
+def edge(target, index=0):
+    return {"node": target, "type": "main", "index": index}
+
+
+def workflow(*nodes, connections=None):
+    nodes = list(nodes) or [node("Hook", "n8n-nodes-base.webhook"), node("Set")]
+    if connections is None:
+        connections = {nodes[0]["name"]: {"main": [[edge(nodes[-1]["name"])]]}} if len(nodes) > 1 else {}
+    return {"nodes": nodes, "connections": connections}
+
+
+class WorkflowValidatorTest(unittest.TestCase):
+    def setUp(self):
+        self.validator = WorkflowValidator(CATALOG)
+
+    def codes(self, issues):
+        return [i["code"] for i in issues]
+
+    def check_repair(self, wf, code, severity=ERROR):
+        """Check-only finds code unrepaired without touching wf; repair fixes it and reports it. Returns the repaired wf."""
+        before = copy.deepcopy(wf)
+        issues = self.validator.check(wf, repair=False)
+        self.assertIn(code, self.codes(issues))
+        self.assertEqual(wf, before, "check-only mode changed the workflow")
+        found = [i for i in issues if i["code"] == code]
+        self.assertTrue(all(i["severity"] == severity and not i["repaired"] for i in found))
+
+        issues = self.validator.check(wf)
+        self.assertTrue(all(i["repaired"] for i in issues if i["code"] == code), issues)
+        self.assertEqual(unrepaired(issues), [])
+        # A repaired workflow checks clean
+        self.assertEqual([i for i in self.validator.check(copy.deepcopy(wf)) if i["severity"] == ERROR], [])
+        return wf
+
+    def test_valid_workflow(self):
+        self.assertEqual(self.validator.check(workflow()), [])
+
+    def test_unfixable_shapes(self):
+        self.assertEqual(self.codes(self.validator.check([])), ["not_an_object"])
+        self.assertEqual(self.codes(self.validator.check({"connections": {}})), ["missing_nodes"])
+        issues = self.validator.check({"nodes": [], "connections": {}})
+        self.assertEqual(self.codes(issues), ["no_nodes"])
+        self.assertFalse(is_valid(issues))
+
+    def test_invalid_and_typeless_nodes_are_dropped(self):
+        wf = self.check_repair(workflow(node("Hook", "n8n-nodes-base.webhook"), "oops", node("Set")), "invalid_node")
+        self.assertEqual([n["name"] for n in wf["nodes"]], ["Hook", "Set"])
+        wf = self.check_repair(workflow(node("Hook", "n8n-nodes-base.webhook"), node("Typeless", ""), node("Set")),
+                               "missing_type")
+        self.assertEqual([n["name"] for n in wf["nodes"]], ["Hook", "Set"])
+
+    def test_missing_name(self):
+        nameless = node("", "n8n-nodes-base.googleSheets")
+        wf = self.check_repair(workflow(node("Hook", "n8n-nodes-base.webhook"), node("Google Sheets"), nameless),
+                               "missing_name")
+        self.assertEqual(wf["nodes"][2]["name"], "Google Sheets1")
+
+    def test_duplicate_name(self):
+        wf = workflow(node("Hook", "n8n-nodes-base.webhook"), node("Set"), node("Set"), node("Set"))
+        wf = self.check_repair(wf, "duplicate_name")
+        self.assertEqual([n["name"] for n in wf["nodes"]], ["Hook", "Set", "Set1", "Set2"])
+
+    def test_missing_type_version_and_parameters(self):
+        slack = node("Slack", "n8n-nodes-base.slack")
+        del slack["typeVersion"], slack["parameters"]
+        wf = self.check_repair(workflow(node("Hook", "n8n-nodes-base.webhook"), slack), "missing_type_version")
+        self.assertEqual(wf["nodes"][1]["typeVersion"], 2.2)
+        self.assertEqual(wf["nodes"][1]["parameters"], {})
+        wf = workflow(node("Hook", "n8n-nodes-base.webhook"), node("Set", typeVersion=True, parameters=[]))
+        self.check_repair(wf, "missing_parameters")
+        self.assertEqual(wf["nodes"][1]["typeVersion"], 3.4)
+
+    def test_known_aliases_are_rewritten_and_reported(self):
+        for alias in ("slack", "Google Sheets", "n8n-nodes-base.googlesheets"):
+            wf = self.check_repair(workflow(node("Hook", "n8n-nodes-base.webhook"), node("Node", alias)),
+                                   "unknown_type")
+            self.assertIn(wf["nodes"][1]["type"], CATALOG)
+            issue = next(i for i in self.validator.check(workflow(node("Node", alias)), repair=True)
+                         if i["code"] == "unknown_type")
+            self.assertIn(repr(alias), issue["message"])
+            self.assertIn("rewritten", issue["message"])
+
+    def test_unknown_and_community_types_are_left_alone(self):
+        for node_type in ("@acme/n8n-nodes-chat.slack", "n8n-nodes-evolution-api.set", "n8n-nodes-base.fancyNew",
+                          "notANode"):
+            wf = workflow(node("Hook", "n8n-nodes-base.webhook"), node("Node", node_type))
+            issues = self.validator.check(wf)
+            self.assertEqual(wf["nodes"][1]["type"], node_type)
+            self.assertEqual([(i["code"], i["severity"], i["repaired"]) for i in issues],
+                             [("unknown_type", WARNING, False)], node_type)
+
+    def test_missing_connections(self):
+        wf = self.check_repair({"nodes": [node("Hook", "n8n-nodes-base.webhook")]}, "missing_connections")
+        self.assertEqual(wf["connections"], {})
+
+    def test_dangling_source_and_target(self):
+        wf = workflow(connections={"Ghost": {"main": [[edge("Set")]]}, "Hook": {"main": [[edge("Set"), edge("Gone")]]}})
+        self.check_repair(wf, "dangling_source")
+        self.assertEqual(wf["connections"], {"Hook": {"main": [[edge("Set")]]}})
+        wf = workflow(connections={"Hook": {"main": [[edge("Gone")]]}})
+        self.check_repair(wf, "dangling_target")
+        self.assertEqual(wf["connections"], {})
+
+    def test_malformed_connections_are_normalised(self):
+        cases = [
+            ({"Hook": {"main": [edge("Set")]}}, {"Hook": {"main": [[edge("Set")]]}}),
+            ({"Hook": {"main": [[edge("Set")], edge("Set")]}}, {"Hook": {"main": [[edge("Set")], [edge("Set")]]}}),
+            ({"Hook": {"main": [[edge("Set")], "x"]}}, {"Hook": {"main": [[edge("Set")], []]}}),
+            ({"Hook": {"main": [[{"node": "Set"}, "x"]]}}, {"Hook": {"main": [[edge("Set")]]}}),
+            ({"Hook": {"main": [[{"node": "Set", "type": "main", "index": "1"}]]}}, {"Hook": {"main": [[edge("Set")]]}}),
+            ({"Hook": {"main": "Set"}}, {}),
+            ({"Hook": ["Set"]}, {}),
+        ]
+        for connections, repaired in cases:
+            wf = self.check_repair(workflow(connections=connections), "invalid_connection")
+            self.assertEqual(wf["connections"], repaired, connections)
+
+    def test_no_trigger_is_a_warning(self):
+        issues = self.validator.check(workflow(node("Set"), node("Slack", "n8n-nodes-base.slack")))
+        self.assertEqual([(i["code"], i["severity"]) for i in issues], [("no_trigger", WARNING)])
+        self.assertTrue(is_valid(issues))
+        # Without a catalogue, trigger detection falls back to the type name
+        issues = WorkflowValidator().check(workflow(node("Start", "n8n-nodes-base.manualTrigger"), node("Set")))
+        self.assertEqual(issues, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
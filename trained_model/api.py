@@ -65,7 +65,12 @@ def generate():
             return jsonify({
                 'success': True,
                 'workflow': result['workflow'],
-                'prompt': prompt
+                'prompt': prompt,
+                'metrics': {
+                    'tokens_saved': result.get('tokens_saved', 0),
+                    'prefix_hit_tokens': result.get('prefix_hit_tokens', 0),
+                    'quantization': gen.quantization
+                }
             })
         else:
             return jsonify({
@@ -6,33 +6,79 @@ Uses the trained LoRA adapter with Mistral-7B to generate n8n workflows
 import torch
 import json
 import os
+import sys
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, LogitsProcessorList, StoppingCriteriaList
+)
 from peft import PeftModel
 
+# Shared workflow helpers (json_grammar, ...) live at the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from json_grammar import (
+    COMPACT_WORKFLOW_SCHEMA, WORKFLOW_SCHEMA, BalancedJsonStoppingCriteria, WorkflowLogitsProcessor, token_texts
+)
+from workflow_format import COMPACT_FORMAT, expand_workflow, load_format
+from workflow_layout import layout_workflow
+from workflow_validator import WorkflowValidator, describe, unrepaired
+
 class N8NWorkflowGenerator:
     """Generate n8n workflows from natural language descriptions using fine-tuned Mistral-7B"""
     
+    # Constant part of every prompt; its KV cache is computed once after loading
+    SYSTEM_PREFIX = """<|system|>
+You are an n8n workflow generator. Convert natural language descriptions into valid n8n workflow JSON.
+<|user|>
+"""
+    
+    # Quantization guard: the int8 CPU model must pick the same next token as the
+    # merged bfloat16 model on at least this share of the probe's positions
+    QUANT_MIN_AGREEMENT = 0.9
+    QUANT_PROBE = (
+        "When a new row is added to Google Sheets, send a Slack message and an email",
+        '{"nodes":[{"name":"Google Sheets Trigger","type":"n8n-nodes-base.googleSheetsTrigger","typeVersion":1,'
+        '"parameters":{}},{"name":"Slack","type":"n8n-nodes-base.slack","typeVersion":2,"parameters":{"channel":'
+    )
+    
     def __init__(self, model_dir=".", use_quantization=True, device="cuda"):
         """
         Initialize the workflow generator
         
         Args:
             model_dir: Path to the trained model directory
-            use_quantization: Whether to use 4-bit quantization (default: True)
+            use_quantization: Quantize the model: 4-bit NF4 on GPU, LoRA-merged
+                int8 on CPU (default: True)
             device: Device to use (cuda/cpu)
         """
         self.model_dir = Path(model_dir)
         self.device = device
         self.use_quantization = use_quantization
+        self._token_texts = None
+        self.last_tokens_saved = 0
+        self.last_prefix_hit_tokens = 0
+        # "compact" adapters emit the short training format, expanded after parsing
+        self.workflow_format = load_format(self.model_dir)
+        # Structural checks only; the node catalogue lives with the full repository
+        self.validator = WorkflowValidator()
         
         print(f"[*] Loading N8N Workflow Generator from {self.model_dir}...")
         self._load_model()
         print("[OK] Model loaded successfully!")
     
-    def _load_model(self):
-        """Load the base model and LoRA adapter"""
+    def _load_model(self, quantize=None):
+        """Load the base model and LoRA adapter, or a merged export of both
+
+        With quantization the GPU path loads the base model in 4-bit (bitsandbytes
+        NF4) under the adapter; the CPU path merges the adapter into the weights and
+        quantizes every decoder Linear layer to int8 (see _quantize_cpu).
+        """
         base_model = "mistralai/Mistral-7B-Instruct-v0.2"
+        # A directory written by scripts/serve/merge_adapter.py holds full merged weights, not an adapter
+        merged = self._is_merged()
+        if merged:
+            base_model = str(self.model_dir)
+        quantize = self.use_quantization if quantize is None else quantize
+        self.quantization = None
         
         # Load tokenizer
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
@@ -42,25 +88,41 @@ class N8NWorkflowGenerator:
         # Load base model with memory-efficient settings
         try:
             # Try GPU first with reduced memory usage
-            if torch.cuda.is_available():
+            # device="cpu" must skip this branch even with CUDA present: 4-bit bitsandbytes layers
+            # can't be int8-quantized for CPU afterwards
+            if torch.cuda.is_available() and self.device != "cpu":
                 print("[*] Attempting GPU loading with memory optimization...")
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    base_model,
-                    torch_dtype=torch.float16,
-                    device_map="auto",
-                    max_memory={0: "6GB", "cpu": "8GB"},  # Limit GPU memory
-                    offload_folder="./offload_tmp",
-                    low_cpu_mem_usage=True
-                )
+                if quantize:
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        base_model,
+                        quantization_config=BitsAndBytesConfig(
+                            load_in_4bit=True,
+                            bnb_4bit_quant_type="nf4",
+                            bnb_4bit_compute_dtype=torch.float16,
+                            bnb_4bit_use_double_quant=True
+                        ),
+                        device_map="auto",
+                        low_cpu_mem_usage=True
+                    )
+                    self.quantization = {"mode": "nf4"}
+                else:
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        base_model,
+                        torch_dtype=torch.float16,
+                        device_map="auto",
+                        max_memory={0: "6GB", "cpu": "8GB"},  # Limit GPU memory
+                        offload_folder="./offload_tmp",
+                        low_cpu_mem_usage=True
+                    )
             else:
-                raise Exception("No CUDA available")
+                raise Exception("CPU requested" if self.device == "cpu" else "No CUDA available")
         except Exception as e:
-            print(f"[WARNING] GPU loading failed ({e}), trying CPU...")
+            print(f"[WARNING] GPU loading skipped or failed ({e}), trying CPU...")
             try:
-                # Fallback to CPU with disk offload
+                # Fallback to CPU; bfloat16 halves peak memory when the weights get quantized afterwards
                 self.model = AutoModelForCausalLM.from_pretrained(
                     base_model,
-                    torch_dtype=torch.float32,  # CPU needs float32
+                    torch_dtype=torch.bfloat16 if quantize else torch.float32,  # CPU matmuls need float32
                     device_map="cpu",
                     low_cpu_mem_usage=True,
                     offload_folder="./offload_tmp"
@@ -71,11 +133,78 @@ class N8NWorkflowGenerator:
                 print(f"[ERROR] Both GPU and CPU loading failed: {e2}")
                 raise
         
-        # Load LoRA adapter
-        self.model = PeftModel.from_pretrained(self.model, self.model_dir)
+        # Load LoRA adapter (already part of the weights of a merged export)
+        if not merged:
+            self.model = PeftModel.from_pretrained(self.model, self.model_dir)
         self.model.eval()
+        if self.device == "cpu" and quantize:
+            if not self._quantize_cpu():
+                # Quantized logits drifted too far from the unquantized model; serve float32 instead
+                self.model = None
+                self._load_model(quantize=False)
+                return
+        self._build_prefix_cache()
+    
+    def _is_merged(self):
+        return (self.model_dir / "config.json").exists() and not (self.model_dir / "adapter_config.json").exists()
+    
+    def _probe_logprobs(self):
+        """Next-token log-probs over a canned prompt + workflow prefix, for the quantization guard"""
+        text = f"{self.SYSTEM_PREFIX}{self.QUANT_PROBE[0]}\n<|assistant|>\n{self.QUANT_PROBE[1]}"
+        ids = self.tokenizer(text, return_tensors="pt")["input_ids"].to(self.model.device)
+        with torch.no_grad():
+            logits = self.model(input_ids=ids).logits[0].float()
+        return torch.log_softmax(logits, dim=-1)
     
-    def generate(self, prompt, max_length=2048, temperature=0.7, top_p=0.9, num_return_sequences=1):
+    def _quantize_cpu(self):
+        """Merge the adapter, quantize decoder Linear layers to int8 and check the result
+        
+        Returns False when the quantized model disagrees with the merged bfloat16
+        model on more than QUANT_MIN_AGREEMENT of the probe's next-token choices.
+        """
+        print("[*] Merging LoRA adapter and quantizing to int8...")
+        if isinstance(self.model, PeftModel):
+            self.model = self.model.merge_and_unload()
+        reference = self._probe_logprobs()
+        
+        # Layer by layer, so only one decoder layer is ever held in float32 besides the int8 weights
+        for layer in self.model.model.layers:
+            layer.float()
+            torch.ao.quantization.quantize_dynamic(layer, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        # Embeddings, norms and the LM head stay unquantized, in float32
+        self.model.float()
+        self.model.eval()
+        
+        quantized = self._probe_logprobs()
+        agreement = (quantized.argmax(-1) == reference.argmax(-1)).float().mean().item()
+        kl = torch.nn.functional.kl_div(quantized, reference, log_target=True, reduction="batchmean").item()
+        self.quantization = {"mode": "int8-dynamic", "top1_agreement": round(agreement, 4), "kl": round(kl, 5)}
+        print(f"[*] int8 quality check: top-1 agreement {agreement:.1%}, KL {kl:.4f}")
+        if agreement < self.QUANT_MIN_AGREEMENT:
+            print(f"[WARNING] int8 model below {self.QUANT_MIN_AGREEMENT:.0%} agreement, reloading unquantized")
+            return False
+        return True
+    
+    def _build_prefix_cache(self):
+        """Precompute past-key-values for SYSTEM_PREFIX so requests only prefill their own text"""
+        self._prefix_ids = self.tokenizer(self.SYSTEM_PREFIX)["input_ids"]
+        with torch.no_grad():
+            ids = torch.tensor([self._prefix_ids], device=self.model.device)
+            self._prefix_past = self.model(input_ids=ids, use_cache=True).past_key_values
+    
+    def _match_prefix(self, input_ids):
+        """Return (hit_tokens, sliced past) for the shared prefix of a tokenized prompt"""
+        limit = min(len(self._prefix_ids), len(input_ids) - 1)
+        hit = 0
+        while hit < limit and self._prefix_ids[hit] == input_ids[hit]:
+            hit += 1
+        if hit == 0:
+            return 0, None
+        # generate() concatenates onto these views, so the shared cache stays intact
+        return hit, tuple((k[:, :, :hit, :], v[:, :, :hit, :]) for k, v in self._prefix_past)
+    
+    def generate(self, prompt, max_length=2048, temperature=0.7, top_p=0.9, num_return_sequences=1,
+                 constrained=False):
         """
         Generate n8n workflow from a natural language description
         
@@ -85,15 +214,14 @@ class N8NWorkflowGenerator:
             temperature: Sampling temperature
             top_p: Nucleus sampling parameter
             num_return_sequences: Number of variants to generate
+            constrained: Mask logits against the workflow JSON grammar so the
+                output always parses (see json_grammar.py)
             
         Returns:
             list: Generated workflows
         """
         # Format prompt in the same style as training
-        formatted_prompt = f"""<|system|>
-You are an n8n workflow generator. Convert natural language descriptions into valid n8n workflow JSON.
-<|user|>
-{prompt}
+        formatted_prompt = f"""{self.SYSTEM_PREFIX}{prompt}
 <|assistant|>
 """
         
@@ -105,6 +233,27 @@ You are an n8n workflow generator. Convert natural language descriptions into va
             truncation=True
         ).to(self.device)
         
+        if self._token_texts is None:
+            self._token_texts = token_texts(self.tokenizer)
+        prompt_length = inputs["input_ids"].shape[1]
+        logits_processor = LogitsProcessorList()
+        if constrained:
+            schema = COMPACT_WORKFLOW_SCHEMA if self.workflow_format == COMPACT_FORMAT else WORKFLOW_SCHEMA
+            logits_processor.append(WorkflowLogitsProcessor(
+                self._token_texts, self.tokenizer.eos_token_id, prompt_length, schema
+            ))
+        # Stop as soon as every sequence has closed its top-level JSON object
+        json_stop = BalancedJsonStoppingCriteria(self._token_texts, prompt_length, max_length)
+        
+        # Reuse the cached system prefix; generate() can't expand a supplied cache across return sequences
+        extra = {}
+        self.last_prefix_hit_tokens = 0
+        if num_return_sequences == 1:
+            hit, past = self._match_prefix(inputs["input_ids"][0].tolist())
+            if past is not None:
+                extra["past_key_values"] = past
+                self.last_prefix_hit_tokens = hit
+        
         # Generate
         with torch.no_grad():
             outputs = self.model.generate(
@@ -114,8 +263,12 @@ You are an n8n workflow generator. Convert natural language descriptions into va
                 top_p=top_p,
                 num_return_sequences=num_return_sequences,
                 do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=self.tokenizer.eos_token_id,
+                logits_processor=logits_processor,
+                stopping_criteria=StoppingCriteriaList([json_stop]),
+                **extra
             )
+        self.last_tokens_saved = json_stop.tokens_saved
         
         # Decode
         generated_texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
@@ -132,17 +285,18 @@ You are an n8n workflow generator. Convert natural language descriptions into va
         
         return workflows
     
-    def generate_workflow_json(self, prompt):
+    def generate_workflow_json(self, prompt, constrained=True):
         """
         Generate a complete n8n workflow and parse JSON if possible
         
         Args:
             prompt: Natural language description
+            constrained: Use grammar-constrained decoding (default: True)
             
         Returns:
             dict: Parsed workflow JSON or raw text if parsing fails
         """
-        workflows = self.generate(prompt, num_return_sequences=1)
+        workflows = self.generate(prompt, num_return_sequences=1, constrained=constrained)
         raw_workflow = workflows[0]
         
         # Try to parse JSON
@@ -153,11 +307,24 @@ You are an n8n workflow generator. Convert natural language descriptions into va
             
             if json_start >= 0 and json_end > json_start:
                 json_str = raw_workflow[json_start:json_end]
-                workflow_json = json.loads(json_str)
+                workflow_json = expand_workflow(json.loads(json_str))
+                issues = self.validator.check(workflow_json)
+                if unrepaired(issues):
+                    return {
+                        "success": False,
+                        "workflow": None,
+                        "raw": raw_workflow,
+                        "issues": issues,
+                        "error": f"Invalid workflow: {describe(unrepaired(issues))}"
+                    }
+                layout_workflow(workflow_json)
                 return {
                     "success": True,
                     "workflow": workflow_json,
-                    "raw": raw_workflow
+                    "raw": raw_workflow,
+                    "issues": issues,
+                    "tokens_saved": self.last_tokens_saved,
+                    "prefix_hit_tokens": self.last_prefix_hit_tokens
                 }
         except (json.JSONDecodeError, ValueError) as e:
             print(f"[WARNING] JSON parsing failed: {e}")
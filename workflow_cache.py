@@ -0,0 +1,154 @@
+"""
+Bounded result cache for generated workflows.
+
+Prompts are keyed by a normalized form (lowercase, punctuation and stopwords
+dropped, whitespace collapsed) so "Send Slack message every day at 9am!" and
+"send a slack message every day at 9am" share an entry. When a similarity
+threshold is configured, a miss on the exact key falls back to the most
+similar cached prompt by cosine similarity of hashed word/bigram vectors.
+
+Entries expire after a TTL and are evicted least-recently-used once the cache
+holds more than max_bytes of serialized workflows.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Words like "every", "new" or "when" change what the workflow does and are kept
+STOPWORDS = frozenset("""
+a an the and or but to of in on at for from by with into onto via as is are be been
+it its this that these those my our your their me us i we you please can could would
+should will just then
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Dimensions of the hashed bag-of-words vectors used for similarity lookups
+VECTOR_DIM = 1 << 18
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical cache key for a prompt."""
+    words = _WORD_RE.findall(prompt.lower())
+    return " ".join(w for w in words if w not in STOPWORDS)
+
+
+def embed(normalized: str) -> dict:
+    """Hashed unigram + bigram vector, L2-normalized, as a sparse {index: weight} dict."""
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vec = {}
+    for feature in features:
+        idx = zlib.crc32(feature.encode("utf-8")) % VECTOR_DIM
+        vec[idx] = vec.get(idx, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {k: v / norm for k, v in vec.items()}
+
+
+def cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class _Entry:
+    __slots__ = ("payload", "size", "expires_at", "vector")
+
+    def __init__(self, payload, expires_at, vector):
+        self.payload = payload
+        self.size = len(payload)
+        self.expires_at = expires_at
+        self.vector = vector
+
+
+class WorkflowCache:
+    """Thread-safe LRU + TTL cache of workflows keyed by normalized prompt."""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, ttl=3600, similarity_threshold=0.0, embed_fn=embed):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # 0 disables the similarity fallback; only exact normalized keys hit
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, prompt):
+        """Return a fresh copy of the cached workflow for prompt, or None."""
+        key = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is None and self.similarity_threshold > 0 and self._entries:
+                entry = self._lookup_similar(key, now)
+                if entry is not None:
+                    self.counters["similar_hits"] += 1
+            elif entry is not None:
+                self.counters["hits"] += 1
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            payload = entry.payload
+        # Entries are stored serialized, so callers can mutate what they get back
+        return json.loads(payload)
+
+    def put(self, prompt, workflow):
+        key = normalize_prompt(prompt)
+        payload = json.dumps(workflow, separators=(",", ":"))
+        if len(payload) > self.max_bytes:
+            return
+        vector = self.embed_fn(key) if self.similarity_threshold > 0 else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            entry = _Entry(payload, time.time() + self.ttl, vector)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, ttl=self.ttl,
+                        similarity_threshold=self.similarity_threshold)
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _lookup_similar(self, key, now):
+        vector = self.embed_fn(key)
+        best_key, best_score = None, self.similarity_threshold
+        for other_key, entry in list(self._entries.items()):
+            if entry.expires_at <= now:
+                self._drop(other_key)
+                continue
+            score = cosine(vector, entry.vector) if entry.vector else 0.0
+            if score >= best_score:
+                best_key, best_score = other_key, score
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self.counters["expirations"] += 1
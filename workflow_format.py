@@ -0,0 +1,246 @@
+"""
+Compact workflow representation used as the model's training target.
+
+n8n workflow JSON spends most of its tokens on things the model should not
+have to learn: UUID ids and webhookIds, credential references, the package
+prefix of every node type, absolute canvas positions and a connections map
+that repeats node names. The compact form keeps everything that describes the
+workflow and drops the rest:
+
+    {
+      "nodes": [
+        {"t": "webhook", "p": {"path": "orders"}, "w": 1},
+        {"t": "slack", "n": "Notify team", "v": 2, "p": {...}, "xy": [220, 0]}
+      ],
+      "edges": [[0, 1], [2, 3, 1]]
+    }
+
+Node keys:
+- "t": node type; "n8n-nodes-base." is stripped and "@n8n/n8n-nodes-langchain."
+  becomes "lc.", any other package is kept verbatim
+- "n": node name, omitted when it is the default name for the type
+- "v": typeVersion, omitted when 1
+- "p": parameters, omitted when empty
+- "xy": position relative to the previous node (the first node is relative
+  to ORIGIN), rounded to whole pixels, omitted when it is the default STEP to
+  the right; compact_workflow(wf, positions=False) leaves all positions out
+  for models whose output is laid out by workflow_layout
+- "w": 1 when the node has a webhookId; a fresh one is generated on expansion
+- "x": any other node keys (notes, onError, retryOnFail, ...) verbatim
+
+Edges are [source, target, output, input, kind] with node indexes; trailing
+defaults (output 0, input 0, kind "main") are left off.
+
+expand_workflow() turns the compact form back into n8n JSON with the same
+nodes, parameters, positions and connections. Ids and webhookIds are freshly
+generated and credentials are left for the user to connect, as n8n does when
+importing a workflow without them.
+"""
+
+import json
+import re
+import uuid
+from pathlib import Path
+
+COMPACT_FORMAT = "compact"
+N8N_FORMAT = "n8n"
+
+# Written next to a trained adapter so servers know which format the model emits
+FORMAT_FILE = "workflow_format.json"
+
+ORIGIN = [250, 300]
+STEP = [200, 0]
+
+_TYPE_PREFIXES = (("n8n-nodes-base.", ""), ("@n8n/n8n-nodes-langchain.", "lc."))
+
+# Node keys with their own compact field, or regenerated on expansion
+_NODE_FIELDS = frozenset({"name", "type", "typeVersion", "parameters", "position", "id", "webhookId", "credentials"})
+
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def compact_type(node_type: str) -> str:
+    for prefix, short in _TYPE_PREFIXES:
+        if node_type.startswith(prefix):
+            return short + node_type[len(prefix):]
+    return node_type
+
+
+def expand_type(short_type: str) -> str:
+    if "/" in short_type or short_type.startswith("n8n-nodes-"):
+        return short_type
+    if short_type.startswith("lc."):
+        return "@n8n/n8n-nodes-langchain." + short_type[3:]
+    if "." in short_type:
+        return short_type  # Community package types keep their own prefix
+    return "n8n-nodes-base." + short_type
+
+
+def default_name(node_type: str) -> str:
+    """n8n-nodes-base.googleSheets -> "Google Sheets\""""
+    short = node_type.rsplit(".", 1)[-1]
+    return " ".join(word[:1].upper() + word[1:] for word in _CAMEL_RE.split(short))
+
+
+def unique_name(name: str, taken: set) -> str:
+    """First of name, name1, name2, ... not in taken (n8n's scheme when pasting a node whose name is taken)."""
+    candidate, n = name, 0
+    while candidate in taken:
+        n += 1
+        candidate = f"{name}{n}"
+    return candidate
+
+
+def is_compact(workflow) -> bool:
+    return isinstance(workflow, dict) and "edges" in workflow and "connections" not in workflow
+
+
+def compact_workflow(workflow: dict, positions: bool = True) -> dict:
+    """n8n workflow JSON -> compact form (see module docstring)."""
+    nodes, index, taken = [], {}, set()
+    previous = ORIGIN
+    for node in workflow.get("nodes", []):
+        if not isinstance(node, dict):
+            continue
+        node_type = str(node.get("type", ""))
+        name = node.get("name", "")
+        c = {"t": compact_type(node_type)}
+        if name != unique_name(default_name(node_type), taken):
+            c["n"] = name
+        if node.get("typeVersion", 1) != 1:
+            c["v"] = node["typeVersion"]
+        if node.get("parameters"):
+            c["p"] = node["parameters"]
+        position = node.get("position")
+        if positions and isinstance(position, list) and len(position) == 2:
+            position = [round(position[0]), round(position[1])]
+            delta = [position[0] - previous[0], position[1] - previous[1]]
+            if delta != STEP:
+                c["xy"] = delta
+            previous = position
+        else:
+            previous = [previous[0] + STEP[0], previous[1] + STEP[1]]
+        if node.get("webhookId"):
+            c["w"] = 1
+        extra = {k: v for k, v in node.items() if k not in _NODE_FIELDS}
+        if extra:
+            c["x"] = extra
+        index.setdefault(name, len(nodes))
+        taken.add(name)
+        nodes.append(c)
+
+    edges = []
+    connections = workflow.get("connections") if isinstance(workflow.get("connections"), dict) else {}
+    for source, outputs in connections.items():
+        if source not in index or not isinstance(outputs, dict):
+            continue
+        for kind, branches in outputs.items():
+            for output, branch in enumerate(branches or []):
+                for edge in branch or []:
+                    if not isinstance(edge, dict) or edge.get("node") not in index:
+                        continue
+                    e = [index[source], index[edge["node"]], output, edge.get("index", 0), kind]
+                    while len(e) > 2 and e[-1] == (0, 0, "main")[len(e) - 3]:
+                        e.pop()
+                    edges.append(e)
+    return {"nodes": nodes, "edges": edges}
+
+
+def expand_node(c: dict, previous=None, taken=None) -> dict:
+    """One compact node -> n8n node. previous is the previous node's position; taken the names used so far."""
+    node_type = expand_type(str(c.get("t", "")))
+    name = c.get("n") or default_name(node_type)
+    if taken is not None:
+        name = unique_name(name, taken)
+        taken.add(name)
+    base = previous or ORIGIN
+    delta = c.get("xy")
+    if not (isinstance(delta, list) and len(delta) == 2):
+        delta = STEP
+    node = {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "type": node_type,
+        "typeVersion": c.get("v", 1),
+        "position": [base[0] + delta[0], base[1] + delta[1]],
+        "parameters": c.get("p") or {},
+    }
+    if c.get("w"):
+        node["webhookId"] = str(uuid.uuid4())
+    extra = c.get("x")
+    if isinstance(extra, dict):
+        for key, value in extra.items():
+            node.setdefault(key, value)
+    return node
+
+
+def expand_workflow(workflow: dict) -> dict:
+    """Compact form -> n8n workflow JSON; anything else is returned unchanged."""
+    if not is_compact(workflow):
+        return workflow
+    nodes, taken = [], set()
+    previous = ORIGIN
+    for c in workflow.get("nodes", []):
+        if not isinstance(c, dict):
+            continue
+        node = expand_node(c, previous, taken)
+        previous = node["position"]
+        nodes.append(node)
+
+    connections = {}
+    for edge in workflow.get("edges", []):
+        if not isinstance(edge, list) or len(edge) < 2:
+            continue
+        source, target, output, input_index, kind = (list(edge) + [0, 0, "main"][len(edge) - 2:])[:5]
+        if not all(isinstance(i, int) and 0 <= i < len(nodes) for i in (source, target)):
+            continue
+        if not isinstance(output, int) or output < 0:
+            continue
+        branches = connections.setdefault(nodes[source]["name"], {}).setdefault(kind, [])
+        while len(branches) <= output:
+            branches.append([])
+        branches[output].append({"node": nodes[target]["name"], "type": kind, "index": input_index})
+
+    result = {"nodes": nodes, "connections": connections}
+    if isinstance(workflow.get("name"), str):
+        result["name"] = workflow["name"]
+    return result
+
+
+def _comparable(workflow: dict):
+    """The part of a workflow the compact form keeps: nodes without ids, credentials and positions, and the edges."""
+    nodes, edges = [], []
+    for node in workflow.get("nodes", []):
+        if not isinstance(node, dict):
+            continue
+        kept = {k: v for k, v in node.items() if k not in ("id", "webhookId", "credentials", "position")}
+        kept.update(typeVersion=node.get("typeVersion", 1), parameters=node.get("parameters") or {},
+                    webhookId=bool(node.get("webhookId")))
+        nodes.append(kept)
+    connections = workflow.get("connections") if isinstance(workflow.get("connections"), dict) else {}
+    for source, outputs in connections.items():
+        for kind, branches in (outputs.items() if isinstance(outputs, dict) else ()):
+            for output, branch in enumerate(branches or []):
+                for edge in branch or []:
+                    if isinstance(edge, dict):
+                        edges.append((source, kind, output, edge.get("node"), edge.get("type"), edge.get("index", 0)))
+    return nodes, sorted(edges, key=repr)
+
+
+def round_trips(workflow: dict) -> bool:
+    """True if expand_workflow(compact_workflow(workflow)) gives the workflow back, apart from what the compact
+    form drops on purpose (ids, webhookIds, credentials and positions).
+
+    Duplicate node names and connections from or to missing nodes don't survive.
+    """
+    return _comparable(expand_workflow(compact_workflow(workflow, positions=False))) == _comparable(workflow)
+
+
+def load_format(model_dir=None) -> str:
+    """Output format of a model: its workflow_format.json (written by qlora_train), else full n8n JSON."""
+    if model_dir:
+        path = Path(model_dir) / FORMAT_FILE
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("workflow_format", N8N_FORMAT)
+    return N8N_FORMAT
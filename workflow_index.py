@@ -0,0 +1,194 @@
+"""
+Retrieval index over the workflows/ corpus.
+
+Each workflow is reduced to a bag of terms (its name, file name, node names and
+node types, camelCase split) weighted by TF-IDF and stored with its node-type
+set in data/workflow_index.json. Queries walk an inverted index, so scoring a
+prompt against the ~1000 workflows only touches documents that share a term
+with it and takes well under a millisecond.
+
+Build (or rebuild) the index with:
+    python workflow_index.py
+"""
+
+import json
+import math
+import os
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from workflow_cache import STOPWORDS
+
+WORKFLOWS_DIR = Path("workflows")
+INDEX_FILE = Path("data") / "workflow_index.json"
+INDEX_VERSION = 1
+
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Generic words that appear in most workflow/file names and carry no signal
+_CORPUS_NOISE = frozenset({"n8n", "nodes", "base", "json", "workflow", "node", "automation", "automate"})
+
+
+def tokenize(text: str) -> list:
+    """Lowercase terms with camelCase and snake_case split and stopwords removed."""
+    words = _WORD_RE.findall(_CAMEL_RE.sub(" ", text).lower())
+    return [w for w in words if w not in STOPWORDS and w not in _CORPUS_NOISE]
+
+
+def workflow_terms(wf: dict, fname: str = "") -> list:
+    terms = tokenize(Path(fname).stem.replace("_", " ")) if fname else []
+    if isinstance(wf.get("name"), str):
+        terms += tokenize(wf["name"])
+    for node in wf.get("nodes", []):
+        if not isinstance(node, dict):
+            continue
+        terms += tokenize(str(node.get("name", "")))
+        # "n8n-nodes-base.googleSheetsTrigger" -> google, sheets, trigger
+        terms += tokenize(str(node.get("type", "")).split(".")[-1])
+    return terms
+
+
+def _load_workflow_file(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "nodes" not in data and "workflow" in data:
+        data = data["workflow"]
+    return data if isinstance(data, dict) and isinstance(data.get("nodes"), list) else None
+
+
+def _corpus_signature(workflows_dir: Path) -> list:
+    files = sorted(workflows_dir.glob("*.json"))
+    return [len(files), max((int(p.stat().st_mtime) for p in files), default=0)]
+
+
+def _weigh(counts: dict, idf: dict) -> dict:
+    vec = {t: (1.0 + math.log(c)) * idf.get(t, 0.0) for t, c in counts.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {t: v / norm for t, v in vec.items() if v}
+
+
+def _counts(terms: list) -> dict:
+    counts = {}
+    for t in terms:
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+def build_index(workflows_dir: Path = WORKFLOWS_DIR) -> dict:
+    docs, doc_counts = [], []
+    for path in sorted(workflows_dir.glob("*.json")):
+        try:
+            wf = _load_workflow_file(path)
+        except (OSError, ValueError):
+            continue
+        if wf is None:
+            continue
+        node_types = sorted({n.get("type") for n in wf["nodes"] if isinstance(n, dict) and n.get("type")})
+        docs.append({
+            "file": path.name,
+            "name": wf.get("name") if isinstance(wf.get("name"), str) else path.stem,
+            "node_types": node_types,
+            "nodes": len(wf["nodes"]),
+        })
+        doc_counts.append(_counts(workflow_terms(wf, path.name)))
+
+    df = {}
+    for counts in doc_counts:
+        for t in counts:
+            df[t] = df.get(t, 0) + 1
+    n = len(docs) or 1
+    idf = {t: round(math.log((1 + n) / (1 + d)) + 1.0, 6) for t, d in df.items()}
+
+    postings = {}
+    for doc_id, counts in enumerate(doc_counts):
+        for t, w in _weigh(counts, idf).items():
+            postings.setdefault(t, []).append([doc_id, round(w, 6)])
+
+    return {
+        "version": INDEX_VERSION,
+        "built_at": int(time.time()),
+        "source": str(workflows_dir),
+        "signature": _corpus_signature(workflows_dir),
+        "docs": docs,
+        "idf": idf,
+        "postings": postings,
+    }
+
+
+class WorkflowIndex:
+    """In-memory view of the on-disk index with top-k search."""
+
+    def __init__(self, data: dict, workflows_dir: Path = WORKFLOWS_DIR):
+        self.docs = data["docs"]
+        self.idf = data["idf"]
+        self.postings = data["postings"]
+        self.workflows_dir = Path(workflows_dir)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, prompt: str, k: int = 3) -> list:
+        """Return up to k (score, doc) pairs, best first; score is cosine similarity in [0, 1]."""
+        query = _weigh(_counts(tokenize(prompt)), self.idf)
+        scores = {}
+        for term, qw in query.items():
+            for doc_id, dw in self.postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + qw * dw
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.docs[doc_id]) for doc_id, score in best]
+
+    def load_workflow(self, doc: dict) -> dict:
+        """Read a fresh copy of the indexed workflow from the corpus."""
+        return json.loads(_read_corpus_file(str(self.workflows_dir / doc["file"])))
+
+
+@lru_cache(maxsize=256)
+def _read_corpus_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def save_index(data: dict, index_file: Path = INDEX_FILE):
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = index_file.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, index_file)
+
+
+def load_index(index_file: Path = INDEX_FILE, workflows_dir: Path = WORKFLOWS_DIR):
+    """Load the prebuilt index, rebuilding it if it is missing or the corpus changed.
+
+    Returns None when there is no corpus to index.
+    """
+    if not workflows_dir.is_dir():
+        return None
+    data = None
+    if index_file.exists():
+        with open(index_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION or data.get("signature") != _corpus_signature(workflows_dir):
+            data = None
+    if data is None:
+        data = build_index(workflows_dir)
+        try:
+            save_index(data, index_file)
+        except OSError:
+            pass  # A read-only checkout can still serve from the in-memory index
+    return WorkflowIndex(data, workflows_dir)
+
+
+def main():
+    start = time.perf_counter()
+    data = build_index(WORKFLOWS_DIR)
+    save_index(data, INDEX_FILE)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {len(data['docs'])} workflows ({len(data['postings'])} terms) "
+          f"into {INDEX_FILE} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
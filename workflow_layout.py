@@ -0,0 +1,265 @@
+"""
+Deterministic canvas layout for generated workflows.
+
+Node positions are computed from the connections with a layered
+(Sugiyama-style) layout instead of trusting whatever coordinates the model or
+a template produced:
+
+1. Back edges found by a depth-first search are reversed so loops (e.g.
+   SplitInBatches) don't break layering.
+2. Each node goes one layer (column) right of its furthest predecessor;
+   sources are pulled next to their first successor.
+3. Edges spanning several layers get placeholder nodes, and the order within
+   each layer is refined with barycenter sweeps so branches don't cross. An
+   IF's "true" output stays above its "false" output.
+4. Rows are assigned top to bottom, each node as close as possible to the
+   average row of its predecessors, at least Y_STEP apart.
+
+AI sub-nodes (language models, memories, tools wired in with ai_* connections)
+are stacked below the node they plug into. Sticky notes keep their position.
+The cost is linear in the size of the workflow apart from the per-layer sorts.
+"""
+
+ORIGIN = (250, 300)
+X_STEP = 200
+Y_STEP = 160
+SWEEPS = 4
+
+STICKY_NOTE = "n8n-nodes-base.stickyNote"
+
+# Ordering key offset per output index, so a node's first output sorts above its second
+_BRANCH_BIAS = 0.1
+
+
+def _is_position(value) -> bool:
+    return (isinstance(value, list) and len(value) == 2
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value))
+
+
+def has_positions(workflow: dict) -> bool:
+    """True when every node carries an [x, y] position."""
+    return all(_is_position(node.get("position")) for node in workflow.get("nodes", []) if isinstance(node, dict))
+
+
+def strip_positions(workflow: dict) -> dict:
+    """Shallow copy of the workflow with node positions left out (for prompts and training targets)."""
+    nodes = [{k: v for k, v in node.items() if k != "position"} if isinstance(node, dict) else node
+             for node in workflow.get("nodes", [])]
+    return {**workflow, "nodes": nodes}
+
+
+def _edges(workflow: dict, index: dict):
+    """(source, target, kind, output) for every connection between known nodes."""
+    connections = workflow.get("connections") if isinstance(workflow.get("connections"), dict) else {}
+    for source, outputs in connections.items():
+        if source not in index or not isinstance(outputs, dict):
+            continue
+        for kind, branches in outputs.items():
+            if not isinstance(branches, list):
+                continue
+            for output, branch in enumerate(branches):
+                # Tolerate flat [{"node": ...}] lists as well as n8n's [[...], [...]] branches
+                for edge in branch if isinstance(branch, list) else [branch]:
+                    if isinstance(edge, dict) and edge.get("node") in index:
+                        yield index[source], index[edge["node"]], kind, output
+
+
+def _break_cycles(n: int, succ: list, roots: list) -> list:
+    """DAG edges (u, v, output): back edges of a DFS from roots (then any unvisited node) are reversed."""
+    state = [0] * n  # 0 unvisited, 1 on the DFS stack, 2 finished
+    dag = []
+    for root in roots + list(range(n)):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            u, it = stack[-1]
+            for v, output in it:
+                if state[v] == 1:
+                    dag.append((v, u, output))
+                    continue
+                dag.append((u, v, output))
+                if state[v] == 0:
+                    state[v] = 1
+                    stack.append((v, iter(succ[v])))
+                    break
+            else:
+                state[u] = 2
+                stack.pop()
+    return dag
+
+
+def _assign_layers(n: int, dag: list) -> tuple:
+    """Longest-path layering; returns (layer per node, topological order)."""
+    preds = [[] for _ in range(n)]
+    succs = [[] for _ in range(n)]
+    indegree = [0] * n
+    for u, v, _ in dag:
+        if u != v:
+            succs[u].append(v)
+            preds[v].append(u)
+            indegree[v] += 1
+    order = [v for v in range(n) if indegree[v] == 0]
+    for u in order:  # order grows while iterating (Kahn's algorithm)
+        for v in succs[u]:
+            indegree[v] -= 1
+            if indegree[v] == 0:
+                order.append(v)
+    layer = [0] * n
+    for v in order:
+        for u in preds[v]:
+            layer[v] = max(layer[v], layer[u] + 1)
+    # A source feeding a deep node sits just left of it rather than in column 0
+    for v in reversed(order):
+        if not preds[v] and succs[v]:
+            layer[v] = min(layer[w] for w in succs[v]) - 1
+    return layer, order
+
+
+def _order_layers(n: int, dag: list, layer: list, topo: list) -> tuple:
+    """Insert placeholders for long edges and order each layer by barycenter sweeps.
+
+    Returns (layers as lists of item ids, preds per item as (item, output)); items
+    >= n are placeholders.
+    """
+    preds = [[] for _ in range(n)]
+    succs = [[] for _ in range(n)]
+    item_layer = list(layer)
+    for u, v, output in dag:
+        if u == v:
+            continue
+        prev = u
+        for mid in range(layer[u] + 1, layer[v]):
+            dummy = len(item_layer)
+            item_layer.append(mid)
+            preds.append([(prev, output)])
+            succs.append([])
+            succs[prev].append(dummy)
+            prev = dummy
+        preds[v].append((prev, output))
+        succs[prev].append(v)
+
+    depth = max(item_layer, default=-1) + 1
+    layers = [[] for _ in range(depth)]
+    # Initial order: real nodes in topological order, placeholders after their source
+    for item in topo + list(range(n, len(item_layer))):
+        layers[item_layer[item]].append(item)
+
+    pos = [0.0] * len(item_layer)
+
+    def renumber(items):
+        for i, item in enumerate(items):
+            pos[item] = i
+
+    for items in layers:
+        renumber(items)
+    for sweep in range(SWEEPS * 2 + 1):
+        downward = sweep % 2 == 0
+        for items in (layers[1:] if downward else reversed(layers[:-1])):
+            def key(item):
+                if downward:
+                    near = [pos[u] + output * _BRANCH_BIAS for u, output in preds[item]]
+                else:
+                    near = [pos[w] for w in succs[item]]
+                return sum(near) / len(near) if near else pos[item]
+            items.sort(key=key)
+            renumber(items)
+    return layers, preds
+
+
+def layout_workflow(workflow: dict, origin=ORIGIN) -> dict:
+    """Replace node positions with a layered layout of the connections, in place; returns the workflow."""
+    nodes = [node for node in workflow.get("nodes", []) if isinstance(node, dict)]
+    graph_nodes = [node for node in nodes if node.get("type") != STICKY_NOTE]
+    index = {}
+    for i, node in enumerate(graph_nodes):
+        index.setdefault(node.get("name"), i)
+    n = len(graph_nodes)
+    if not n:
+        return workflow
+
+    main_edges, has_main = [], [False] * n
+    parent = [None] * n
+    for u, v, kind, output in _edges(workflow, index):
+        if kind == "main":
+            main_edges.append((u, v, output))
+            has_main[u] = has_main[v] = True
+        elif parent[u] is None and u != v:
+            parent[u] = v
+
+    # Sub-nodes hang off another node through ai_* edges only, and must be anchored to the main graph
+    sub = [parent[v] is not None and not has_main[v] for v in range(n)]
+    for v in range(n):
+        seen, p = {v}, v
+        while sub[p] and parent[p] not in seen:
+            p = parent[p]
+            seen.add(p)
+        if sub[p]:
+            sub[v] = False  # Only sub-nodes in a cycle: lay it out like any other node
+
+    main = [v for v in range(n) if not sub[v]]
+    local = {v: i for i, v in enumerate(main)}
+    m = len(main)
+    succ = [[] for _ in range(m)]
+    indegree = [0] * m
+    for u, v, output in main_edges:
+        if u in local and v in local:
+            succ[local[u]].append((local[v], output))
+            indegree[local[v]] += 1
+    roots = [i for i in range(m) if indegree[i] == 0]
+
+    dag = _break_cycles(m, succ, roots)
+    layer, topo = _assign_layers(m, dag)
+    layers, preds = _order_layers(m, dag, layer, topo)
+
+    children = [[] for _ in range(n)]
+    for v in range(n):
+        if sub[v]:
+            children[parent[v]].append(v)
+
+    def with_children(v):
+        yield v
+        for c in children[v]:
+            yield from with_children(c)
+
+    col = [0] * n
+    row = [0.0] * n
+    y = [0.0] * len(preds)
+    for c, items in enumerate(layers):
+        # Each entry: (item or None for a sub-node, graph node or None for a placeholder, desired y, anchored)
+        entries = []
+        prev = origin[1] - Y_STEP
+        for item in items:
+            near = [y[u] for u, _ in preds[item]]
+            desired = sum(near) / len(near) if near else prev + Y_STEP
+            entries.append((item, main[item] if item < m else None, desired, bool(near)))
+            prev = desired
+            if item < m:
+                # Sub-nodes stack directly under the node they plug into
+                for v in list(with_children(main[item]))[1:]:
+                    entries.append((None, v, desired, False))
+
+        placed, last = [], None
+        for _, _, desired, _ in entries:
+            last = desired if last is None else max(desired, last + Y_STEP)
+            placed.append(last)
+        # Pushing rows apart only moves them down; re-centre on the predecessors' average
+        anchored = [desired - p for (_, _, desired, a), p in zip(entries, placed) if a]
+        offset = sum(anchored) / len(anchored) if anchored else 0.0
+        for (item, v, _, _), p in zip(entries, placed):
+            if item is not None:
+                y[item] = p + offset
+            if v is not None:
+                col[v] = c
+                row[v] = p + offset
+
+    for v, node in enumerate(graph_nodes):
+        node["position"] = [origin[0] + col[v] * X_STEP, int(round(row[v]))]
+
+    # Sticky notes keep their place; new ones go above the graph
+    top = min(node["position"][1] for node in graph_nodes)
+    for i, node in enumerate(node for node in nodes if node.get("type") == STICKY_NOTE):
+        if not _is_position(node.get("position")):
+            node["position"] = [origin[0] + i * X_STEP, top - 2 * Y_STEP]
+    return workflow
@@ -0,0 +1,231 @@
+"""
+Structural validation and repair of n8n workflows.
+
+One pass over the nodes and one over the connections, so checking (and
+fixing) even a large generated workflow costs microseconds instead of a
+regeneration. Checks:
+
+- the workflow has a "nodes" list and a "connections" object
+- every node is an object with a name, a type, parameters and a typeVersion
+- node names are unique
+- connections only reference existing nodes and have n8n's
+  {"<source>": {"<kind>": [[{"node", "type", "index"}], ...]}} shape
+- node types are known to the node catalogue
+- at least one node is a trigger
+
+With repair=True common defects are fixed in place: dangling connections are
+dropped, duplicate names get n8n's "Name1", "Name2" suffixes, missing names,
+parameters and typeVersions are filled in, malformed edges are normalised and
+node types given as a catalogue alias ("slack", "Google Sheets",
+"n8n-nodes-base.googlesheets") are resolved. Types from other packages
+(community nodes) are never rewritten. Every repair is reported as an issue
+with "repaired": True; anything that can't be fixed is reported as well.
+
+Each issue is a dict:
+    {"code": "duplicate_name", "severity": "error", "node": "Slack",
+     "message": "...", "repaired": True}
+"""
+
+from node_catalog import short_name
+from workflow_format import default_name, unique_name
+
+ERROR = "error"
+WARNING = "warning"
+
+# Packages whose node types may be corrected through the catalogue's aliases
+_N8N_PACKAGES = ("n8n-nodes-base.", "@n8n/n8n-nodes-langchain.")
+
+
+def _issue(issues, code, severity, message, node=None, repaired=False):
+    issues.append({"code": code, "severity": severity, "node": node, "message": message, "repaired": repaired})
+
+
+def unrepaired(issues: list) -> list:
+    """Errors that are still present in the workflow."""
+    return [i for i in issues if i["severity"] == ERROR and not i["repaired"]]
+
+
+def is_valid(issues: list) -> bool:
+    return not unrepaired(issues)
+
+
+def describe(issues: list) -> str:
+    return "; ".join(f"{i['node']}: {i['message']}" if i["node"] else i["message"] for i in issues)
+
+
+class WorkflowValidator:
+    """Validates workflows against the node catalogue (optional) and repairs what it can."""
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog
+
+    def _is_trigger(self, node_type: str) -> bool:
+        if self.catalog is not None:
+            return self.catalog.is_trigger(node_type)
+        name = short_name(node_type).lower()
+        return name.endswith("trigger") or name == "webhook"
+
+    def _resolve_alias(self, node_type: str):
+        """Catalogue type for a bare alias or a misspelt n8n type; None for other packages' types."""
+        if "." in node_type:
+            if not node_type.startswith(_N8N_PACKAGES):
+                return None  # A community package's node; its short name may collide with a built-in one
+            node_type = short_name(node_type)
+        return self.catalog.resolve(node_type)
+
+    def check(self, workflow, repair: bool = True) -> list:
+        """Issues found in the workflow; with repair=True fixable ones are fixed in place."""
+        issues = []
+        if not isinstance(workflow, dict):
+            _issue(issues, "not_an_object", ERROR, "workflow is not a JSON object")
+            return issues
+        nodes = workflow.get("nodes")
+        if not isinstance(nodes, list):
+            _issue(issues, "missing_nodes", ERROR, "'nodes' is missing or not a list")
+            return issues
+        if not nodes:
+            _issue(issues, "no_nodes", ERROR, "workflow has no nodes")
+
+        kept, names = self._check_nodes(nodes, issues, repair)
+        if repair and len(kept) != len(nodes):
+            nodes[:] = kept
+        self._check_connections(workflow, names, issues, repair)
+
+        if kept and not any(self._is_trigger(node["type"]) for node in kept if isinstance(node.get("type"), str)):
+            _issue(issues, "no_trigger", WARNING, "no trigger node; the workflow can only be run manually")
+        return issues
+
+    def _check_nodes(self, nodes, issues, repair):
+        """Returns (nodes to keep, set of node names)."""
+        kept, names = [], set()
+        catalog = self.catalog
+        for i, node in enumerate(nodes):
+            if not isinstance(node, dict):
+                _issue(issues, "invalid_node", ERROR, f"node {i} is not an object", repaired=repair)
+                continue
+            node_type = node.get("type")
+            if not isinstance(node_type, str) or not node_type:
+                _issue(issues, "missing_type", ERROR, f"node {i} has no type", node=node.get("name"), repaired=repair)
+                continue
+
+            if catalog is not None and node_type not in catalog:
+                resolved = self._resolve_alias(node_type)
+                if resolved and repair:
+                    _issue(issues, "unknown_type", ERROR, f"node type {node_type!r} rewritten to {resolved!r}",
+                           node=node.get("name"), repaired=True)
+                    node["type"] = node_type = resolved
+                elif resolved:
+                    _issue(issues, "unknown_type", ERROR, f"unknown node type {node_type!r}, did you mean {resolved!r}",
+                           node=node.get("name"))
+                else:
+                    _issue(issues, "unknown_type", WARNING, f"node type {node_type!r} is not in the node catalogue",
+                           node=node.get("name"))
+
+            name = node.get("name")
+            if not isinstance(name, str) or not name.strip():
+                fixed = unique_name(default_name(node_type), names)
+                _issue(issues, "missing_name", ERROR, f"node {i} has no name", node=fixed, repaired=repair)
+                if repair:
+                    node["name"] = name = fixed
+            elif name in names:
+                fixed = unique_name(name, names)
+                _issue(issues, "duplicate_name", ERROR, f"node name {name!r} is used more than once; renamed to {fixed!r}",
+                       node=name, repaired=repair)
+                if repair:
+                    node["name"] = name = fixed
+            names.add(name)
+
+            version = node.get("typeVersion")
+            if not isinstance(version, (int, float)) or isinstance(version, bool):
+                _issue(issues, "missing_type_version", ERROR, "typeVersion is missing or not a number",
+                       node=name, repaired=repair)
+                if repair:
+                    node["typeVersion"] = catalog.type_version(node_type) if catalog is not None else 1
+            if not isinstance(node.get("parameters"), dict):
+                _issue(issues, "missing_parameters", ERROR, "parameters are missing or not an object",
+                       node=name, repaired=repair)
+                if repair:
+                    node["parameters"] = {}
+            kept.append(node)
+        return kept, names
+
+    def _check_connections(self, workflow, names, issues, repair):
+        connections = workflow.get("connections")
+        if not isinstance(connections, dict):
+            _issue(issues, "missing_connections", ERROR, "'connections' is missing or not an object", repaired=repair)
+            if repair:
+                workflow["connections"] = {}
+            return
+
+        for source in list(connections):
+            outputs = connections[source]
+            if source not in names:
+                _issue(issues, "dangling_source", ERROR, f"connections from unknown node {source!r}",
+                       node=source, repaired=repair)
+                if repair:
+                    del connections[source]
+                continue
+            if not isinstance(outputs, dict):
+                _issue(issues, "invalid_connection", ERROR, "connection outputs are not an object",
+                       node=source, repaired=repair)
+                if repair:
+                    del connections[source]
+                continue
+            for kind in list(outputs):
+                branches = outputs[kind]
+                if not isinstance(branches, list):
+                    _issue(issues, "invalid_connection", ERROR, f"{kind!r} outputs are not a list",
+                           node=source, repaired=repair)
+                    if repair:
+                        del outputs[kind]
+                    continue
+                if branches and all(isinstance(branch, dict) for branch in branches):
+                    # A flat [{"node": ...}, ...] list: every edge leaves the first output
+                    _issue(issues, "invalid_connection", ERROR, f"{kind!r} outputs are a flat list of edges",
+                           node=source, repaired=repair)
+                    if not repair:
+                        continue
+                    branches[:] = [list(branches)]
+                for b, branch in enumerate(branches):
+                    if isinstance(branch, dict):
+                        _issue(issues, "invalid_connection", ERROR, f"{kind!r} output {b} is not a list of edges",
+                               node=source, repaired=repair)
+                        if repair:
+                            branch = branches[b] = [branch]
+                        else:
+                            continue
+                    elif not isinstance(branch, list):
+                        _issue(issues, "invalid_connection", ERROR, f"{kind!r} output {b} is not a list of edges",
+                               node=source, repaired=repair)
+                        if repair:
+                            branches[b] = []
+                        continue
+                    self._check_edges(source, kind, branch, names, issues, repair)
+                if repair and not any(branches):
+                    del outputs[kind]
+            if repair and not outputs:
+                del connections[source]
+
+    @staticmethod
+    def _check_edges(source, kind, branch, names, issues, repair):
+        kept = []
+        for edge in branch:
+            if not isinstance(edge, dict):
+                _issue(issues, "invalid_connection", ERROR, "connection edge is not an object",
+                       node=source, repaired=repair)
+                continue
+            target = edge.get("node")
+            if target not in names:
+                _issue(issues, "dangling_target", ERROR, f"connection to unknown node {target!r}",
+                       node=source, repaired=repair)
+                continue
+            if edge.get("type") != kind or not isinstance(edge.get("index"), int) or isinstance(edge.get("index"), bool):
+                _issue(issues, "invalid_connection", ERROR, f"edge to {target!r} needs a type and an integer index",
+                       node=source, repaired=repair)
+                if repair:
+                    index = edge.get("index")
+                    edge = {"node": target, "type": kind,
+                            "index": index if isinstance(index, int) and not isinstance(index, bool) else 0}
+            kept.append(edge)
+        if repair:
+            branch[:] = kept